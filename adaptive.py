@@ -0,0 +1,118 @@
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Savol qiyinligi (questions.json dagi "difficulty") -> Rasch modelidagi qiyinlik parametri b
+DIFFICULTY_B = {"oson": -1.0, "o'rta": 0.0, "qiyin": 1.0}
+
+# Qobiliyat (theta) bo'yicha daraja chegaralari: finish_test dagi "boshlang'ich/o'rta/yuqori"
+THETA_LEVELS = [(0.8, "yuqori"), (-0.3, "o'rta")]
+
+# theta ni baholash uchun to'r va standart normal prior (EAP)
+GRID = [i / 10 for i in range(-40, 41)]
+PRIOR = [math.exp(-theta * theta / 2) for theta in GRID]
+
+
+# Rasch modeli: qobiliyati theta bo'lgan o'quvchi qiyinligi b bo'lgan savolga to'g'ri javob berish ehtimoli
+def probability(theta, b):
+    return 1 / (1 + math.exp(b - theta))
+
+
+# Javoblar [(b, to'g'ri 1/0), ...] bo'yicha theta ning aposterior taqsimoti (to'rda, normallangan).
+# To'rdagi integrallash hamma javob to'g'ri (yoki noto'g'ri) bo'lganda ham chekli baho beradi.
+def posterior(responses):
+    weights = []
+    for theta, prior in zip(GRID, PRIOR):
+        likelihood = prior
+        for b, is_correct in responses:
+            p = probability(theta, b)
+            likelihood *= p if is_correct else 1 - p
+        weights.append(likelihood)
+    total = sum(weights)
+    return [w / total for w in weights]
+
+
+# Aposterior o'rtacha (EAP), standart xato va baho tushgan darajaning ehtimoli
+def estimate(responses):
+    weights = posterior(responses)
+    mean = sum(theta * w for theta, w in zip(GRID, weights))
+    se = math.sqrt(sum((theta - mean) ** 2 * w for theta, w in zip(GRID, weights)))
+    level = level_for_theta(mean)
+    confidence = sum(w for theta, w in zip(GRID, weights) if level_for_theta(theta) == level)
+    return mean, se, confidence
+
+
+def level_for_theta(theta):
+    for threshold, level in THETA_LEVELS:
+        if theta >= threshold:
+            return level
+    return "boshlang'ich"
+
+
+# Adaptiv test: navbatdagi savol o'quvchining joriy bahosiga eng ko'p ma'lumot beradigan
+# qiyinlikdan (|b - theta| eng kichik) tanlanadi. Savollar QuestionIndex ning qiyinlik bo'yicha
+# tayyor ro'yxatlaridan tasodifiy olinadi, ishlatilganlari va takroriy bo'limlar rad etiladi,
+# shuning uchun bitta tanlov o'rtacha O(1). Kamida `min_questions` savoldan keyin test
+# standart xato `se_target` dan kichik bo'lganda yoki daraja `confidence` ehtimol bilan
+# aniq bo'lganda to'xtaydi; eng ko'pi `max_questions` savol.
+class AdaptiveEngine:
+    def __init__(self, index, min_questions=5, max_questions=10, se_target=0.6, confidence=0.75):
+        self.index = index
+        self.min_questions = min_questions
+        self.max_questions = max_questions
+        self.se_target = se_target
+        self.confidence = confidence
+
+    def _difficulty_b(self, subject, question_id, version=None):
+        question = self.index.get(subject, question_id, version)
+        return DIFFICULTY_B.get(question.get('difficulty'), 0.0) if question else 0.0
+
+    def _section(self, subject, question_id):
+        question = self.index.get(subject, question_id)
+        return question.get('section') if question else None
+
+    def _pick(self, subject, pool, used, used_sections, rng):
+        for attempt in range(8):
+            question_id = rng.choice(pool)
+            if question_id in used:
+                continue
+            # Dastlabki urinishlarda hali chiqmagan bo'limlar afzal
+            if attempt < 4 and self._section(subject, question_id) in used_sections:
+                continue
+            return question_id
+        remaining = [question_id for question_id in pool if question_id not in used]
+        return rng.choice(remaining) if remaining else None
+
+    def _select(self, subject, theta, used, rng):
+        used_sections = {self._section(subject, question_id) for question_id in used}
+        for difficulty in sorted(DIFFICULTY_B, key=lambda d: abs(DIFFICULTY_B[d] - theta)):
+            pool = self.index.difficulty(subject, difficulty)
+            if pool:
+                question_id = self._pick(subject, pool, used, used_sections, rng)
+                if question_id is not None:
+                    return question_id
+        return None
+
+    def first_question(self, subject, rng):
+        return self._select(subject, 0.0, set(), rng)
+
+    # Javobdan keyin bahoni yangilash va navbatdagi savolni tanlash. None - test tugadi.
+    # Baho test yozuviga (theta, se, level) yoziladi.
+    def next_question(self, subject, test, rng):
+        version = test.get('bank_version')
+        responses = [
+            (self._difficulty_b(subject, question_id, version), is_correct)
+            for question_id, _, is_correct in test['answers']
+        ]
+        theta, se, confidence = estimate(responses)
+        test['theta'] = round(theta, 3)
+        test['se'] = round(se, 3)
+        test['level'] = level_for_theta(theta)
+
+        answered = len(test['answers'])
+        if answered >= self.max_questions:
+            return None
+        if answered >= self.min_questions and (se <= self.se_target or confidence >= self.confidence):
+            return None
+        return self._select(subject, theta, set(test['question_ids']), rng)
@@ -0,0 +1,151 @@
+import logging
+import time
+from array import array
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GROUP_FRACTION = 0.27  # Ajratish indeksi uchun yuqori va quyi guruh ulushi (klassik 27%)
+MIN_ATTEMPTS = 20      # Bundan kam urinishli savollar bo'yicha xulosa chiqarilmaydi
+
+# Belgilangan qiyinlik uchun kutilgan to'g'ri javoblar ulushi oralig'i
+EXPECTED_DIFFICULTY = {
+    "oson": (0.6, 1.0),
+    "o'rta": (0.3, 0.85),
+    "qiyin": (0.0, 0.6),
+}
+
+
+# Javoblar matritsasi ixcham ustunlar ko'rinishida: har bir javob uchun bitta qator
+#   tests         javob qaysi testga tegishli (test_scores dagi indeks)
+#   question_ids  savol id'si
+#   choices       tanlangan variant (-1 - noma'lum)
+#   correct       1/0
+# test_scores - har bir testning umumiy natijasi (0..1).
+class AnswerMatrix:
+    def __init__(self, tests, question_ids, choices, correct, test_scores):
+        self.tests = tests
+        self.question_ids = question_ids
+        self.choices = choices
+        self.correct = correct
+        self.test_scores = test_scores
+
+    def __len__(self):
+        return len(self.question_ids)
+
+
+# Saqlangan natijalardagi ixcham javoblardan matritsa yig'ish. rows - storage.iter_export() uchliklari.
+# Qiymatlar avval array modulidagi tipli massivlarga yig'iladi, so'ng nusxasiz NumPy ga o'tkaziladi.
+def collect_answers(rows, subject="matem"):
+    tests, question_ids, choices, correct = array('q'), array('q'), array('q'), array('b')
+    test_scores = array('d')
+    for _, _, user_results in rows:
+        for result in user_results:
+            answers = result.get("answers")
+            if not answers or result.get("subject") != subject:
+                continue
+            test_no = len(test_scores)
+            test_scores.append(result.get("score", 0) / (result.get("total") or len(answers)))
+            for question_id, choice, is_correct in answers:
+                tests.append(test_no)
+                question_ids.append(question_id)
+                choices.append(choice if isinstance(choice, int) else -1)
+                correct.append(1 if is_correct else 0)
+    return AnswerMatrix(
+        np.frombuffer(tests, dtype=np.int64),
+        np.frombuffer(question_ids, dtype=np.int64),
+        np.frombuffer(choices, dtype=np.int64),
+        np.frombuffer(correct, dtype=np.int8),
+        np.frombuffer(test_scores, dtype=np.float64)
+    )
+
+
+def _ratio(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.full(len(denominator), np.nan), where=denominator > 0)
+
+
+# Savollar tahlili. Barcha hisob bincount orqali butun matritsa ustida bir o'tishda bajariladi:
+#   difficulty      to'g'ri javoblar ulushi (p)
+#   discrimination  yuqori 27% va quyi 27% testlar orasidagi p farqi (D)
+#   options         har bir variantni tanlaganlar ulushi (distraktorlar)
+# Qaytadi: savollar bo'yicha lug'atlar ro'yxati (id tartibida), har birida `flags` - shubhali belgilar.
+def analyze(matrix, questions, min_attempts=MIN_ATTEMPTS, fraction=GROUP_FRACTION):
+    questions = sorted(questions, key=lambda q: q['id'])
+    ids = np.array([q['id'] for q in questions], dtype=np.int64)
+    count = len(ids)
+    if not count:
+        return []
+    max_options = max(len(q['options']) for q in questions)
+
+    # Savol id'sini qator raqamiga aylantirish; bazada yo'q savollarga javoblar tashlanadi
+    rows = np.searchsorted(ids, matrix.question_ids)
+    known = rows < count
+    known[known] = ids[rows[known]] == matrix.question_ids[known]
+    rows = rows[known]
+    correct = matrix.correct[known].astype(np.float64)
+    choices = matrix.choices[known]
+    answer_scores = matrix.test_scores[matrix.tests[known]]
+
+    attempts = np.bincount(rows, minlength=count)
+    difficulty = _ratio(np.bincount(rows, weights=correct, minlength=count), attempts)
+
+    if len(matrix.test_scores):
+        low_cut, high_cut = np.quantile(matrix.test_scores, [fraction, 1 - fraction])
+    else:
+        low_cut = high_cut = 0.0
+    upper = answer_scores >= high_cut
+    lower = answer_scores <= low_cut
+    p_upper = _ratio(np.bincount(rows[upper], weights=correct[upper], minlength=count), np.bincount(rows[upper], minlength=count))
+    p_lower = _ratio(np.bincount(rows[lower], weights=correct[lower], minlength=count), np.bincount(rows[lower], minlength=count))
+    discrimination = p_upper - p_lower
+
+    valid = (choices >= 0) & (choices < max_options)
+    cells = rows[valid] * max_options + choices[valid]
+    option_counts = np.bincount(cells, minlength=count * max_options).reshape(count, max_options)
+    upper_counts = np.bincount(cells[upper[valid]], minlength=count * max_options).reshape(count, max_options)
+    option_share = option_counts / np.maximum(attempts, 1)[:, None]
+
+    report = []
+    for i, question in enumerate(questions):
+        options_count = len(question['options'])
+        item = {
+            "id": question['id'],
+            "attempts": int(attempts[i]),
+            "difficulty": float(difficulty[i]),
+            "discrimination": float(discrimination[i]),
+            "options": [float(share) for share in option_share[i, :options_count]],
+            "flags": []
+        }
+        report.append(item)
+        if attempts[i] < min_attempts:
+            continue
+        flags = item["flags"]
+        p, d = difficulty[i], discrimination[i]
+        if p < 0.2:
+            flags.append("juda qiyin")
+        elif p > 0.95:
+            flags.append("juda oson")
+        if d < 0:
+            flags.append("manfiy ajratish (kalitni tekshiring)")
+        elif d < 0.1:
+            flags.append("past ajratish")
+        if upper_counts[i].any() and int(upper_counts[i].argmax()) != question['correct']:
+            flags.append(f"kuchli o'quvchilar {int(upper_counts[i].argmax()) + 1}-variantni tanlagan")
+        unused = [str(j + 1) for j in range(options_count) if j != question['correct'] and option_counts[i, j] == 0]
+        if unused:
+            flags.append(f"hech kim tanlamagan variant: {', '.join(unused)}")
+        expected = EXPECTED_DIFFICULTY.get(question.get('difficulty'))
+        if expected and not expected[0] <= p <= expected[1]:
+            flags.append(f"'{question['difficulty']}' belgisi mos emas")
+    return report
+
+
+# To'liq tahlil: yig'ish + hisoblash. Fon oqimida chaqiriladi. Qaytadi: (hisobot, javoblar soni, testlar soni, soniya)
+def run_analysis(rows, questions, subject="matem"):
+    started = time.perf_counter()
+    matrix = collect_answers(rows, subject)
+    report = analyze(matrix, questions)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Savollar tahlili: {len(matrix)} javob, {len(matrix.test_scores)} test, {elapsed:.3f} s")
+    return report, len(matrix), len(matrix.test_scores), elapsed
@@ -0,0 +1,66 @@
+import asyncio
+import itertools
+import json
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 999000, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+# Jarayon ichidagi soxta Bot API: tarmoqqa chiqmaydi, har bir usulga Telegram javobiga o'xshash
+# minimal natija qaytaradi. Har bir chat uchun oxirgi inline menyu eslab qolinadi - load_test.py
+# foydalanuvchilari keyingi tugmani shu menyudan tanlaydi. `latency` (soniya) berilsa, har bir
+# so'rov shuncha kutadi (haqiqiy tarmoq kechikishiga yaqinlashtirish uchun).
+class FakeBotAPI(BaseRequest):
+    def __init__(self, latency=0.0, member_status="member"):
+        self.latency = latency
+        self.member_status = member_status
+        self.calls = {}
+        self.markups = {}
+        self._message_ids = itertools.count(1000)
+
+    @property
+    def read_timeout(self):
+        return 5.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data: RequestData = None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data is not None else {}
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+    def _result(self, api_method, params):
+        if api_method == "getMe":
+            return BOT_USER
+        chat_id = params.get("chat_id")
+        if api_method in ("sendMessage", "editMessageText", "sendDocument", "sendPhoto"):
+            if "reply_markup" in params and chat_id is not None:
+                markup = params["reply_markup"]
+                self.markups[str(chat_id)] = json.loads(markup) if isinstance(markup, str) else markup
+            return {
+                "message_id": next(self._message_ids),
+                "date": 0,
+                "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else 1, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if api_method == "getChatMember":
+            user = {"id": int(params["user_id"]), "is_bot": False, "first_name": "U"}
+            if user["id"] == BOT_USER["id"]:
+                return {"status": "creator", "user": user, "is_anonymous": False}
+            return {"status": self.member_status, "user": user}
+        if api_method == "getChat":
+            return {"id": -100123, "type": "supergroup", "title": "Bench", "accent_color_id": 0, "max_reaction_count": 11}
+        return True
+
+    # Chatdagi oxirgi inline menyuning callback qiymatlari
+    def buttons(self, chat_id):
+        markup = self.markups.get(str(chat_id)) or {}
+        return [button.get("callback_data") for row in markup.get("inline_keyboard", []) for button in row]
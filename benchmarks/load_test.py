@@ -0,0 +1,284 @@
+# Yuklama sinovi: N ta o'quvchi bir vaqtda botdan to'liq o'tadi.
+#
+# Har bir o'quvchi: /start -> sinf -> maktab -> telefon -> guruhni tasdiqlash -> test (barcha
+# savollar) -> natijalar. Yangilanishlar bot.py da ro'yxatdan o'tgan handlerlar orqali jarayon
+# ichidagi soxta Bot API ga qarshi (fake_api.py) yuboriladi. Har bir foydalanuvchi soni alohida
+# jarayonda ishlaydi, shuning uchun eng yuqori RSS shu o'lchovga tegishli. Natija
+# benchmarks/results/ ga JSON bo'lib yoziladi.
+#
+#     python benchmarks/load_test.py --users 100,1000,10000
+#     python benchmarks/load_test.py --users 100000 --backend sqlite
+#     python benchmarks/load_test.py --compare benchmarks/results/<oldingi>.json
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DATA_FILES = ("courses.json", "questions.json", "schools.json")
+MAX_ANSWERS = 50  # Test cheksiz davom etib ketmasligi uchun
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    summary = {}
+    for name, values in sorted(samples.items()):
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+    return summary
+
+
+def _user(uid):
+    return {"id": uid, "is_bot": False, "first_name": f"O'quvchi{uid}"}
+
+
+def make_message(uid, update_id, text=None, contact=None):
+    message = {"message_id": update_id, "date": 0, "chat": {"id": uid, "type": "private"}, "from": _user(uid)}
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if contact is not None:
+        message["contact"] = contact
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback(uid, update_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "from": _user(uid), "chat_instance": str(uid), "data": data,
+            "message": {
+                "message_id": 1, "date": 0, "chat": {"id": uid, "type": "private"},
+                "from": {"id": 999000, "is_bot": True, "first_name": "Bench"}, "text": "."
+            },
+        },
+    }
+
+
+def timed(callback, record):
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            record(callback.__name__, time.perf_counter() - started)
+    wrapper.__name__ = callback.__name__
+    return wrapper
+
+
+# Bitta o'lchov (bola jarayonda): bot.py shu yerda, DATA_DIR o'rnatilgandan keyin yuklanadi
+async def run_child(users, seed):
+    import bot
+    from fake_api import FakeBotAPI
+    from telegram import Update
+    from telegram.ext import CallbackQueryHandler
+
+    logging.getLogger().setLevel(logging.WARNING)
+    api = FakeBotAPI(latency=float(os.getenv("BENCH_API_LATENCY", "0")))
+    application = bot.build_application(api)
+    samples = {}
+    written = {"bytes": 0, "records": 0}
+
+    def record(name, seconds):
+        samples.setdefault(name, []).append(seconds)
+
+    # Callbacklar marshrut bo'yicha, qolgan handlerlar callback nomi bo'yicha o'lchanadi
+    def on_dispatch(name, lookup_seconds, handler_seconds):
+        record(f"callback:{name}", handler_seconds)
+
+    bot.callback_router.on_dispatch = on_dispatch
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, CallbackQueryHandler):
+                continue
+            handler.callback = timed(handler.callback, record)
+
+    observer = bot.storage.writer.observer
+
+    def observe_write(seconds, records, written_bytes):
+        written["bytes"] += written_bytes
+        written["records"] += records
+        if observer is not None:
+            observer(seconds, records, written_bytes)
+
+    bot.storage.writer.observer = observe_write
+    rng = random.Random(seed)
+    update_ids = iter(range(1, 10 ** 9))
+    processor = application.update_processor
+    counters = {"updates": 0, "tests": 0}
+
+    async def send(data):
+        update = Update.de_json(data, application.bot)
+        started = time.perf_counter()
+        await processor.process_update(update, application.process_update(update))
+        record("update", time.perf_counter() - started)
+        counters["updates"] += 1
+
+    async def student(uid):
+        await send(make_message(uid, next(update_ids), "/start"))
+        await send(make_callback(uid, next(update_ids), f"class_{rng.choice(['5', '6', '7', '8', '9', '10', '11'])}"))
+        schools = [data for data in api.buttons(uid) if data and data.startswith("school_")]
+        await send(make_callback(uid, next(update_ids), rng.choice(schools) if schools else "school_other"))
+        await send(make_callback(uid, next(update_ids), "enter_phone"))
+        await send(make_message(uid, next(update_ids), f"+99890{uid % 10 ** 7:07d}"))
+        await send(make_callback(uid, next(update_ids), "confirm_group"))
+        await send(make_callback(uid, next(update_ids), "start_test"))
+        for _ in range(MAX_ANSWERS):
+            answers = [data for data in api.buttons(uid) if data and data.startswith("answer_")]
+            if not answers:
+                break
+            await send(make_callback(uid, next(update_ids), rng.choice(answers)))
+        counters["tests"] += 1
+        await send(make_callback(uid, next(update_ids), "show_results"))
+
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(student(100000 + i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+        await application.stop()
+    bot.close_storage()
+
+    return {
+        "users": users,
+        "updates": counters["updates"],
+        "tests": counters["tests"],
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(counters["updates"] / elapsed, 1) if elapsed else 0.0,
+        "bytes_written": written["bytes"],
+        "records_written": written["records"],
+        # Linuxda ru_maxrss kilobaytlarda
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "api_calls": api.calls,
+        "handlers": summarize(samples),
+    }
+
+
+# Har bir o'lchov toza ma'lumotlar katalogi bilan yangi jarayonda
+def run_measurement(users, backend, seed):
+    data_dir = tempfile.mkdtemp(prefix="bench_data_")
+    try:
+        for filename in DATA_FILES:
+            source = os.path.join(ROOT, "data", filename)
+            if os.path.exists(source):
+                shutil.copy(source, data_dir)
+        env = dict(
+            os.environ, DATA_DIR=data_dir, STORAGE_BACKEND=backend, METRICS_PORT="0",
+            BOT_TOKEN=os.getenv("BOT_TOKEN", "123456:bench"), ADMIN_ID=os.getenv("ADMIN_ID", "1"),
+            MY_GROUP=os.getenv("MY_GROUP", "@bench_group"), BOT_MODE="polling",
+        )
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", str(users), "--seed", str(seed)],
+            env=env, cwd=ROOT, capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            raise RuntimeError(f"{users} foydalanuvchi bilan o'lchov xato bilan tugadi:\n{output.stderr[-3000:]}")
+        return json.loads(output.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_run(run):
+    print(
+        f"\n{run['users']} foydalanuvchi: {run['updates']} yangilanish, {run['seconds']} s, "
+        f"{run['updates_per_second']} upd/s, yozildi {run['bytes_written'] / 1024:.0f} KB "
+        f"({run['records_written']} yozuv), RSS {run['peak_rss_mb']} MB"
+    )
+    print(f"  {'handler':<36}{'soni':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in run["handlers"].items():
+        print(f"  {name:<36}{stats['count']:>9}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+# Oldingi natija bilan solishtirish: o'tkazuvchanlik va har bir handlerning p95 nisbati
+def compare(current, previous):
+    old_runs = {run["users"]: run for run in previous["runs"]}
+    for run in current["runs"]:
+        old = old_runs.get(run["users"])
+        if old is None:
+            continue
+        print(f"\n{run['users']} foydalanuvchi, {previous.get('commit')} bilan solishtirish:")
+        print(f"  upd/s: {old['updates_per_second']} -> {run['updates_per_second']}")
+        print(f"  yozildi: {old['bytes_written']} -> {run['bytes_written']} bayt")
+        for name, stats in run["handlers"].items():
+            old_stats = old["handlers"].get(name)
+            if old_stats and old_stats["p95_ms"]:
+                ratio = stats["p95_ms"] / old_stats["p95_ms"]
+                marker = "  <-- sekinlashdi" if ratio > 1.2 else ""
+                print(f"  {name:<36} p95 {old_stats['p95_ms']} -> {stats['p95_ms']} ms (x{ratio:.2f}){marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot handlerlari uchun yuklama sinovi")
+    parser.add_argument("--users", default="100,1000,10000", help="Vergul bilan ajratilgan foydalanuvchilar soni (100 dan 100000 gacha)")
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="Natija fayli (standart: benchmarks/results/<sana>_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Solishtirish uchun oldingi natija fayli")
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        sys.path.insert(0, ROOT)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        print(json.dumps(asyncio.run(run_child(args.child, args.seed))))
+        return
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "backend": args.backend,
+        "python": sys.version.split()[0],
+        "runs": [],
+    }
+    for users in (int(value) for value in args.users.split(",")):
+        run = run_measurement(users, args.backend, args.seed)
+        report["runs"].append(run)
+        print_run(run)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}_{commit or 'nocommit'}_{args.backend}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nNatija saqlandi: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
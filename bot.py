@@ -1,22 +1,76 @@
+import asyncio
 import logging
+import math
 import random
-import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-from telegram.error import BadRequest, Forbidden, TelegramError
+from telegram.ext import Application, ChatMemberHandler, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from storage import open_storage
+from question_bank import QuestionIndex, BUCKET_SIZE, validate_questions
+from reloader import FileWatcher, read_json
+from broadcast import BroadcastManager, retry_after_seconds
+from export import build_export, xlsx_available
+from stats import StatsStore, LEVELS, level_for
+from analytics import run_analysis
+from adaptive import AdaptiveEngine
+from render import RenderCache
+from router import CallbackRouter
+from locks import PerUserUpdateProcessor
+from membership import MembershipCache, ADMIN_STATUSES, MEMBER_STATUSES, is_participant_error
+from sharding import shard_for
+from metrics import REGISTRY, InstrumentedRequest, PhaseTimer, instrument_handlers, observe_route, observe_write, start_http_server
 
 # Konfiguratsiya va global o'zgaruvchilar
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = os.getenv("ADMIN_ID")
 MY_GROUP = os.getenv("MY_GROUP")  # Guruh ID'si yoki linki (masalan, t.me/Zarafshan_Matematika)
-DATA_DIR = "data"
+DATA_DIR = os.getenv("DATA_DIR", "data")  # Ma'lumotlar katalogi (yuklama sinovi vaqtinchalik katalog beradi)
 COURSES_FILE = os.path.join(DATA_DIR, "courses.json")
 QUESTIONS_FILE = os.path.join(DATA_DIR, "questions.json")
 SCHOOLS_FILE = os.path.join(DATA_DIR, "schools.json")
 USER_DATA_FILE = os.path.join(DATA_DIR, "user_data.json")
 RESULTS_FILE = os.path.join(DATA_DIR, "results.json")
+RESULTS_ARCHIVE_FILE = os.path.join(DATA_DIR, "results_archive.jsonl")  # Eski natijalar (faqat eksport va tahlil uchun o'qiladi)
+BROADCASTS_DIR = os.path.join(DATA_DIR, "broadcasts")
+SQLITE_FILE = os.path.join(DATA_DIR, "bot.db")
+STATS_FILE = os.path.join(DATA_DIR, "stats.json")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")  # json yoki sqlite
+COMPACT_EVERY = int(os.getenv("COMPACT_EVERY", "1000"))  # Jurnal shuncha yozuvdan keyin snapshotga siqiladi
+RESULT_HISTORY = max(5, int(os.getenv("RESULT_HISTORY", "10")))  # Har bir o'quvchining xotirada turadigan oxirgi natijalari soni
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))  # Fon yozuvchi navbatidagi kalitlar chegarasi
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "2"))  # O'zgargan yozuvlar shuncha soniyada bir marta yoziladi
+RELOAD_INTERVAL = int(os.getenv("RELOAD_INTERVAL", "10"))  # Savollar, kurslar va maktablar fayllarini tekshirish oralig'i
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))  # Tarqatmada parallel yuboruvchilar soni
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # Tarqatmada soniyasiga xabarlar (Telegram umumiy cheklovi ~30)
+STORAGE_STATS_INTERVAL = int(os.getenv("STORAGE_STATS_INTERVAL", "300"))  # Yozish statistikasini logga chiqarish oralig'i
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "10"))  # Admin ro'yxatlarida bir sahifadagi o'quvchilar soni
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # Prometheus /metrics porti, 0 - o'chirilgan
+ADAPTIVE_TEST = os.getenv("ADAPTIVE_TEST", "0") == "1"  # 1 - savollar qiyinlik bo'yicha adaptiv tanlanadi (IRT)
+ADAPTIVE_MAX_QUESTIONS = int(os.getenv("ADAPTIVE_MAX_QUESTIONS", "10"))  # Adaptiv testdagi eng ko'p savollar soni
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling yoki webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Telegram yuboradigan tashqi manzil (masalan, https://bot.example.uz/telegram)
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")  # Mahalliy server manzili (oldida reverse proxy turadi)
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # X-Telegram-Bot-Api-Secret-Token sarlavhasi bilan tekshiriladi
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org")  # Sinov uchun mahalliy soxta Bot API manzili
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))  # Bot API ga qayta ishlatiladigan ulanishlar soni
+GROUP_STATUS_TTL = int(os.getenv("GROUP_STATUS_TTL", "600"))  # Botning guruhdagi admin holati shuncha soniya keshda turadi
+MEMBERSHIP_TTL = int(os.getenv("MEMBERSHIP_TTL", "3600"))  # Foydalanuvchining guruh a'zoligi shuncha soniya keshda turadi
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))  # A'zolik keshidagi foydalanuvchilar chegarasi
+MEMBERSHIP_CHECK_INTERVAL = int(os.getenv("MEMBERSHIP_CHECK_INTERVAL", "300"))  # A'zolikni qayta tekshirish vazifasi oralig'i
+MEMBERSHIP_CHECK_PERIOD = int(os.getenv("MEMBERSHIP_CHECK_PERIOD", "86400"))  # Har bir o'quvchi taxminan shuncha soniyada bir marta tekshiriladi
+MEMBERSHIP_CHECK_RATE = float(os.getenv("MEMBERSHIP_CHECK_RATE", "5"))  # Qayta tekshirishda soniyasiga getChatMember so'rovlari
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "256"))  # Parallel qayta ishlanadigan yangilanishlar (1 - ketma-ket)
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))  # workers.py ishga tushirgan jarayon raqami
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))  # Jarayonlar soni (1 dan ko'p bo'lsa saqlash faqat sqlite)
+STATS_PEER_FILES = []
+if WORKER_COUNT > 1:
+    STATS_FILE = os.path.join(DATA_DIR, f"stats.{WORKER_INDEX}.json")  # Har bir worker o'z hisoblagichlarini saqlaydi
+    STATS_PEER_FILES = [os.path.join(DATA_DIR, f"stats.{i}.json") for i in range(WORKER_COUNT) if i != WORKER_INDEX]
 
 # Log faylini sozlash
 logging.basicConfig(
@@ -25,31 +79,105 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Foydalanuvchilar, natijalar va tugallanmagan testlar saqlash interfeysi orqali ishlaydi
+storage = open_storage(
+    STORAGE_BACKEND, USER_DATA_FILE, RESULTS_FILE, SQLITE_FILE,
+    compact_every=COMPACT_EVERY, max_pending=WRITE_QUEUE_SIZE,
+    history_size=RESULT_HISTORY, archive_file=RESULTS_ARCHIVE_FILE
+)
+
+# Yuklangan fayllar versiyasi (mazmun xeshi)
+data_versions = {}
+
 # Ma'lumotlarni yuklash
 def load_data():
     data = {}
-    for filename in [COURSES_FILE, QUESTIONS_FILE, SCHOOLS_FILE, USER_DATA_FILE, RESULTS_FILE]:
+    for filename in [COURSES_FILE, QUESTIONS_FILE, SCHOOLS_FILE]:
         key = os.path.basename(filename).split('.')[0]
         try:
             if os.path.exists(filename):
-                with open(filename, 'r', encoding='utf-8') as f:
-                    data[key] = json.load(f)
+                data[key], data_versions[filename] = read_json(filename)
             else:
                 data[key] = {}
         except Exception as e:
             logger.error(f"Faylni yuklashda xato '{filename}': {e}")
             data[key] = {}
-    return data['courses'], data['questions'], data['schools'], data['user_data'], data['results']
+    return data['courses'], data['questions'], data['schools']
 
-# Ma'lumotlarni saqlash
-def save_data(data, filename):
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Faylni saqlashda xato '{filename}': {e}")
+# Fayllar import paytida emas, init_data() da yuklanadi
+courses, questions_pool, schools = {}, {}, {}
+question_index = None
+adaptive_engine = None
+data_watcher = None
+
+# Admin statistikasi uchun yig'ma hisoblagichlar (fayl bo'lmasa post_init da tarixdan quriladi)
+aggregates = StatsStore(STATS_FILE, peer_files=STATS_PEER_FILES)
+aggregates_loaded = False
+
+# Ishga tushish bosqichlari vaqti (init_data, build_application, post_init), post_init oxirida logga chiqadi
+startup_timer = PhaseTimer()
+data_initialized = False
+
+# Yangilanishlar foydalanuvchi qulfi ostida bajariladi (locks.py). Qulflar handlerdan tashqarida
+# ham ishlatiladi: fon vazifasi yoki tarqatma foydalanuvchi yozuvini o'qib-o'zgartirib-yozganda
+# shu foydalanuvchining qulfini oladi, aks holda bir vaqtda ishlayotgan handler o'zining eski
+# nusxasini yozib o'zgarishni o'chirib yuborardi (SQLite engine'da get_user nusxa qaytaradi).
+update_processor = PerUserUpdateProcessor(max(1, CONCURRENT_UPDATES))
+
+def user_lock(user_id):
+    return update_processor.locks.get(int(user_id))
+
+# Botni bloklagan yoki topilmagan foydalanuvchini faolsiz deb belgilash: keyingi tarqatmalar uni o'tkazib yuboradi
+async def mark_unreachable(user_id, reason):
+    async with user_lock(user_id):
+        user_info = storage.get_user(user_id)
+        if user_info is not None and user_info.get("active", True):
+            user_info["active"] = False
+            user_info["inactive_reason"] = reason
+            storage.put_user(user_id, user_info)
+
+# Guruh (MY_GROUP) bir marta aniqlanadi; bot va foydalanuvchilar holati keshda
+group_membership = MembershipCache(
+    MY_GROUP, bot_status_ttl=GROUP_STATUS_TTL, member_ttl=MEMBERSHIP_TTL, max_users=MEMBERSHIP_CACHE_SIZE
+)
 
-courses, questions_pool, schools, user_data, results = load_data()
+broadcaster = BroadcastManager(
+    BROADCASTS_DIR, concurrency=BROADCAST_CONCURRENCY, rate=BROADCAST_RATE, on_unreachable=mark_unreachable
+)
+
+# O'lchovlar: handler va Bot API vaqtlari metrics.py da, holat ko'rsatkichlari so'rov paytida hisoblanadi
+REGISTRY.gauge("bot_startup_seconds", "Ishga tushish vaqti", lambda: startup_timer.total)
+REGISTRY.gauge("bot_tests_in_progress", "Tugallanmagan testlar", storage.count_tests)
+REGISTRY.gauge("bot_broadcast_queue_depth", "Tarqatma navbatidagi qabul qiluvchilar", lambda: broadcaster.queue_depth)
+REGISTRY.gauge("bot_storage_dirty_records", "Yozilishi kutilayotgan o'zgargan yozuvlar", lambda: storage.write_stats()["pending"])
+REGISTRY.gauge("bot_storage_writer_queue", "Fon yozuvchi navbatidagi yozuvlar", lambda: storage.write_stats()["queued"])
+REGISTRY.gauge(
+    "bot_storage_deferred_records", "Fon yozuvchi navbati to'la bo'lgani uchun keyingi flush'ga qoldirilgan yozuvlar",
+    lambda: storage.write_stats()["deferred"]
+)
+REGISTRY.gauge("bot_storage_write_amplification", "Mantiqiy o'zgarishlar / fizik yozuvlar", lambda: storage.write_stats()["ratio"])
+metrics_server = None
+
+# Kurslar faylini tekshirish
+def validate_courses(data):
+    if not isinstance(data, dict):
+        raise ValueError("kurslar fayli lug'at bo'lishi kerak")
+    for key, course in data.items():
+        if not isinstance(course, dict) or not course.get('name'):
+            raise ValueError(f"'{key}' kursida nom yo'q")
+        if not isinstance(course.get('levels', {}), dict):
+            raise ValueError(f"'{key}' kursida darajalar lug'at bo'lishi kerak")
+
+# Maktablar faylini tekshirish
+def validate_schools(data):
+    if not isinstance(data, dict) or not isinstance(data.get('schools'), dict):
+        raise ValueError("maktablar fayli {\"schools\": {...}} ko'rinishida bo'lishi kerak")
+
+DATA_VALIDATORS = {
+    COURSES_FILE: validate_courses,
+    QUESTIONS_FILE: validate_questions,
+    SCHOOLS_FILE: validate_schools
+}
 
 # Asosiy menyu (oddiy foydalanuvchilar uchun)
 MAIN_KEYBOARD = InlineKeyboardMarkup([
@@ -63,10 +191,58 @@ MAIN_KEYBOARD = InlineKeyboardMarkup([
 ADMIN_MENU_KEYBOARD = InlineKeyboardMarkup([
     [InlineKeyboardButton("👥 Barcha o'quvchilar", callback_data="admin_users")],
     [InlineKeyboardButton("📊 Barcha natijalar", callback_data="admin_results")],
+    [InlineKeyboardButton("📈 Statistika", callback_data="admin_stats")],
     [InlineKeyboardButton("📢 Barchaga xabar", callback_data="admin_broadcast")],
     [InlineKeyboardButton("🏠 Asosiy menyu", callback_data="main_menu")]
 ])
 
+# Maktablar va kurslar menyulari, kurs matnlari va savollar init_data da bir marta quriladi
+# va fayl yangilanganda reload_data_files da qayta quriladi
+render_cache = RenderCache()
+
+# Ma'lumot fayllari, foydalanuvchilar va hisoblagichlarni yuklash. build_application dan
+# chaqiriladi, shuning uchun bot.py ni import qilish arzon; ikkinchi chaqiruv hech narsa qilmaydi.
+def init_data():
+    global courses, questions_pool, schools, question_index, adaptive_engine, data_watcher
+    global aggregates_loaded, data_initialized
+    if data_initialized:
+        return
+    with startup_timer.phase("ma'lumot fayllari"):
+        courses, questions_pool, schools = load_data()
+        data_watcher = FileWatcher([COURSES_FILE, QUESTIONS_FILE, SCHOOLS_FILE])
+    with startup_timer.phase("savollar indeksi va menyular"):
+        question_index = QuestionIndex(questions_pool, version=data_versions.get(QUESTIONS_FILE))
+        adaptive_engine = AdaptiveEngine(question_index, max_questions=ADAPTIVE_MAX_QUESTIONS)
+        render_cache.set_schools(schools, data_versions.get(SCHOOLS_FILE))
+        render_cache.set_courses(courses, data_versions.get(COURSES_FILE))
+        render_cache.set_questions(questions_pool, data_versions.get(QUESTIONS_FILE))
+    with startup_timer.phase(f"saqlash ({STORAGE_BACKEND})"):
+        storage.load()
+        for name, seconds in storage.load_timings.items():
+            startup_timer.add(name, seconds)
+    storage.writer.observer = observe_write
+    with startup_timer.phase("statistika"):
+        aggregates_loaded = aggregates.load()
+    data_initialized = True
+
+# O'qituvchi haqida matn (o'zgarmas, oddiy matn ko'rinishi ham oldindan tayyorlanadi)
+TEACHER_INFO_TEXT = (
+    "👨‍🏫 **O'zim haqimda**\n\n"
+    "Salom! Men Shoxrux Ibrohimovman\. Matematika bo'yicha tajribali o'qituvchiman\.\n"
+    "8 yildan ortiq o'qituvchilik tajribam bor\. Toshkent axborot texnologiyalari Universitetini tugatganman, hozirda kombinatda Muhandis dasturchi bo'lib ishlayman\. Matematikadan alimpistman: Nurota tumanida 7\-9 sinflar matematikadan alimpiadada birinchi o'rinni olganman\. Navoiy 1\-litseyda 2 kursda Navoiy shahrida 1\-o'rin, Navoiy viloyat bosqichida 5\-o'rinni olganman\.\n\n"
+    "**KURSLARIM**\n\n"
+    "Kurslarimni asosan 0 dan boshlab o'taman\. Turk sifir matematika kabi kitoblar bor, tarjima qilganman\. O'zi shu kitoblardan o'quvchilarga 0 dan bilim beraman\. Bu kitoblar orqali qiynalmay, unchalik miyaga nagruzka bermay, fundamental matematikani puxta o'rganib olishingiz mumkin\. O'rta darajaga kelsak, bilimingiz fundamentalda yaxshi bo'lgach, toplam 1996\-2003 maktab darsliklari shu kitoblar o'tiladi\. Bundan ham o'tib olgach, eng oxirida Puza geometriya, Algebra, Skanavi kabi kuchli kitoblarda ishlaymiz\.\n\n"
+    "**NATIJALAR**\n\n"
+    "0 dan boshlab o'rganuvchilarga 2 yilda bemalol Milliy sertifikatga topshirish va yuqori natijalar olishgacha tayyorlayman\. Bir yilda ham eplasa bo'ladi, bu 0 dan boshlasangiz ham o'zingizning olish qobiliyatingizga bog'liq\. Kimdurlar bitta kitobni 4 oyda tugatib, yana qayta ishlab chiqmasa bo'lmaydigan darajada esidan chiqarib yuboradi, kimdur esa 7 oyda ishlab tugatib, lekin mukammal tugatgan, esidan mavzularni ishlash usullarini esidan chiqarib yubormagan bo'ladi\. Hullas shunaqa gaplar\.\n\n"
+    "**Kursga qo'shilish uchun**\n"
+    "📞 Aloqa: \+998507551023\n"
+    "@Shoxrux_Ibrohimov"
+)
+TEACHER_INFO_PLAIN = TEACHER_INFO_TEXT.replace('\\', '')
+
+BACK_TO_MENU_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Asosiy menyu", callback_data="main_menu")]])
+BACK_TO_COURSES_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Kurslar ro'yxati", callback_data="courses_list")]])
+
 # Telefon raqami so'rash menyusi
 PHONE_KEYBOARD = InlineKeyboardMarkup([
     [InlineKeyboardButton("📱 Telefon raqamini kiritish", callback_data="enter_phone")],
@@ -82,7 +258,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, use
     ])
     text = (
         f"📜 *{quote}*\n\n"
-        f"Xush kelibsiz, {user_data.get(user_id, {}).get('first_name', 'aziz foydalanuvchi')}!\n"
+        f"Xush kelibsiz, {(storage.get_user(user_id) or {}).get('first_name', 'aziz foydalanuvchi')}!\n"
         f"Matematika bilimlaringizni sinash uchun *Sinov testi* tugmasini bosing "
         f"yoki boshqa imkoniyatlarni ko'rish uchun tugmalardan birini tanlang."
     )
@@ -109,8 +285,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(user.id)
     logger.info(f"Foydalanuvchi {user_id}: /start buyrug'i qabul qilindi.")
     
-    if user_id not in user_data:
-        user_data[user_id] = {
+    user_info = storage.get_user(user_id)
+    if user_info is None:
+        user_info = {
             "first_name": user.first_name,
             "last_name": user.last_name,
             "username": user.username,
@@ -122,17 +299,18 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "test_count_today": 0,
             "waiting_for": None
         }
-        save_data(user_data, USER_DATA_FILE)
-
-    if user_id not in results:
-        results[user_id] = []
-        save_data(results, RESULTS_FILE)
-    
-    if user_data.get(user_id, {}).get("class") and user_data.get(user_id, {}).get("school") and user_data.get(user_id, {}).get("phone") and user_data.get(user_id, {}).get("group_joined"):
+        storage.put_user(user_id, user_info)
+    elif not user_info.get("active", True):
+        # Botni qayta ishga tushirgan foydalanuvchi yana tarqatmalarni oladi
+        user_info["active"] = True
+        user_info.pop("inactive_reason", None)
+        storage.put_user(user_id, user_info)
+    
+    if user_info.get("class") and user_info.get("school") and user_info.get("phone") and user_info.get("group_joined"):
         await show_main_menu(update, context, user_id)
         return
     
-    if not user_data[user_id].get("class"):
+    if not user_info.get("class"):
         classes_keyboard = InlineKeyboardMarkup([
             [
                 InlineKeyboardButton("5-sinf", callback_data="class_5"),
@@ -156,11 +334,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    if not user_data[user_id].get("school"):
+    if not user_info.get("school"):
         # Bu yerda class tanlangan deb hisoblaymiz, lekin start da emas, handle_class dan chaqiriladi
         pass
     
-    if not user_data[user_id].get("phone"):
+    if not user_info.get("phone"):
         await update.message.reply_text(
             f"Telefon raqamingizni kiriting yoki Telegramdagi raqamingizni yuboring:",
             reply_markup=PHONE_KEYBOARD,
@@ -168,7 +346,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    if not user_data[user_id].get("group_joined"):
+    if not user_info.get("group_joined"):
         await handle_group_join(update, context)
 
 # Sinf tanlaganda
@@ -179,22 +357,13 @@ async def handle_class_selection(update: Update, context: ContextTypes.DEFAULT_T
     user_id = str(query.from_user.id)
     selected_class = query.data.split("_")[1]
     
-    user_data[user_id]["class"] = selected_class
-    save_data(user_data, USER_DATA_FILE)
+    user_info = storage.get_user(user_id)
+    user_info["class"] = selected_class
+    storage.put_user(user_id, user_info)
     
-    school_keys = list(schools.get("schools", {}).keys())
-    keyboard_rows = []
-    for i in range(0, len(school_keys), 2):
-        row = school_keys[i:i+2]
-        keyboard_rows.append([InlineKeyboardButton(f"{key} maktab", callback_data=f"school_{key}") for key in row])
-
-    keyboard_rows.append([InlineKeyboardButton("Boshqa maktab", callback_data="school_other")])
-
-    school_keyboard = InlineKeyboardMarkup(keyboard_rows)
-
     await query.edit_message_text(
         f"Tushundim, siz {selected_class}-sinf o'quvchisi ekansiz. Qaysi maktab o'quvchisisiz?",
-        reply_markup=school_keyboard,
+        reply_markup=render_cache.school_keyboard,
         parse_mode='Markdown'
     )
 
@@ -207,8 +376,9 @@ async def handle_school_selection(update: Update, context: ContextTypes.DEFAULT_
     school_data = query.data.split("_")[1]
     
     school_name = schools.get("schools", {}).get(school_data, "Boshqa maktab") if school_data != "other" else "Boshqa maktab"
-    user_data[user_id]["school"] = school_name
-    save_data(user_data, USER_DATA_FILE)
+    user_info = storage.get_user(user_id)
+    user_info["school"] = school_name
+    storage.put_user(user_id, user_info)
     
     await query.edit_message_text(
         f"Demak, siz {school_name} o'quvchisisiz! Telefon raqamingizni kiriting yoki Telegramdagi raqamingizni yuboring:",
@@ -221,18 +391,19 @@ async def handle_phone_selection(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     user_id = str(query.from_user.id)
+    user_info = storage.get_user(user_id)
     
     if query.data == "enter_phone":
-        user_data[user_id]["waiting_for"] = "phone"
-        save_data(user_data, USER_DATA_FILE)
+        user_info["waiting_for"] = "phone"
+        storage.put_user(user_id, user_info)
         await query.edit_message_text(
             "📱 Telefon raqamingizni quyidagi formatda kiriting: +998901234567\n"
             "Raqam '+' bilan boshlanishi va kamida 12 ta belgidan iborat bo'lishi kerak.",
             parse_mode='Markdown'
         )
     elif query.data == "share_phone":
-        user_data[user_id]["waiting_for"] = "share_phone"
-        save_data(user_data, USER_DATA_FILE)
+        user_info["waiting_for"] = "share_phone"
+        storage.put_user(user_id, user_info)
         keyboard = ReplyKeyboardMarkup(
             [[KeyboardButton("📞 Raqamni yuborish", request_contact=True)]],
             one_time_keyboard=True,
@@ -254,35 +425,15 @@ async def handle_phone_selection(update: Update, context: ContextTypes.DEFAULT_T
 # Guruhga a'zo bo'lish
 async def handle_group_join(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
-    if not MY_GROUP:
+    if not group_membership.configured:
         logger.error("MY_GROUP environment o'zgaruvchisi sozlanmagan!")
         await context.bot.send_message(user_id, "Guruh sozlanmagan. Ma'muriyat bilan bog'laning.")
         return
     
-    # Guruh linkini to'g'ri formatlash (t.me/Zarafshan_Matematika uchun)
-    if 'Zarafshan_Matematika' in MY_GROUP:
-        group_link = "https://t.me/Zarafshan_Matematika"
-        group_id = "@Zarafshan_Matematika"
-    else:
-        # Umumiy formatlash
-        if MY_GROUP.startswith('t.me/'):
-            group_username = MY_GROUP.split('/')[-1]
-            group_link = f"https://t.me/{group_username}"
-            group_id = f"@{group_username}"
-        elif MY_GROUP.startswith('@'):
-            group_link = f"https://t.me/{MY_GROUP[1:]}"
-            group_id = MY_GROUP
-        elif MY_GROUP.startswith('-'):
-            group_link = f"https://t.me/c/{MY_GROUP[4:]}/1"  # Private guruh uchun
-            group_id = MY_GROUP
-        else:
-            group_link = f"https://t.me/{MY_GROUP}"
-            group_id = f"@{MY_GROUP}"
-    
     keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("✅ Tasdiqlash", callback_data="confirm_group")]])
     text = (
         f"Ro'yxatdan o'tishni yakunlash uchun quyidagi guruhga a'zo bo'ling:\n"
-        f"{group_link}\n\n"
+        f"{group_membership.link}\n\n"
         f"A'zo bo'lganingizdan so'ng, *Tasdiqlash* tugmasini bosing."
     )
     
@@ -291,7 +442,7 @@ async def handle_group_join(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.callback_query.message.edit_text(text, reply_markup=keyboard, parse_mode=None)  # Markdown o'chirildi
         else:
             await context.bot.send_message(user_id, text, reply_markup=keyboard, parse_mode=None)
-        logger.info(f"Foydalanuvchi {user_id}: Guruhga a'zo bo'lish so'raldi. Guruh ID: {group_id}")
+        logger.info(f"Foydalanuvchi {user_id}: Guruhga a'zo bo'lish so'raldi. Guruh ID: {group_membership.chat_ref}")
     except BadRequest as e:
         logger.error(f"Guruh xabari yuborishda xato: {e}")
         await context.bot.send_message(user_id, "Xabar yuborishda xatolik yuz berdi. Qayta urinib ko'ring.")
@@ -302,32 +453,19 @@ async def handle_group_confirmation(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     user_id = str(query.from_user.id)
     
-    if not MY_GROUP:
+    if not group_membership.configured:
         await query.edit_message_text("Guruh sozlanmagan. Ma'muriyat bilan bog'laning.", parse_mode=None)
         return
     
-    # Guruh ID'sini to'g'ri formatlash (t.me/Zarafshan_Matematika uchun)
-    if 'Zarafshan_Matematika' in MY_GROUP:
-        chat_id = "@Zarafshan_Matematika"
-    else:
-        # Umumiy formatlash
-        if MY_GROUP.startswith('t.me/'):
-            chat_id = f"@{MY_GROUP.split('/')[-1]}"
-        elif MY_GROUP.startswith('@'):
-            chat_id = MY_GROUP
-        elif MY_GROUP.startswith('-'):
-            chat_id = MY_GROUP
-        else:
-            chat_id = f"@{MY_GROUP}"
-    
+    chat_id = group_membership.chat_ref
     try:
         logger.info(f"Guruh ID tekshirilmoqda: {chat_id}")
         
-        # Botning guruhda ekanligini va admin ekanligini tekshirish
+        # Botning guruhda ekanligini va admin ekanligini tekshirish (holat keshdan, fonda yangilanadi)
         try:
-            bot_member = await context.bot.get_chat_member(chat_id=chat_id, user_id=context.bot.id)
-            if bot_member.status not in ['administrator', 'creator']:
-                logger.error(f"Bot {chat_id} guruhida admin emas: {bot_member.status}")
+            bot_status = await group_membership.get_bot_status(context.bot)
+            if bot_status not in ADMIN_STATUSES:
+                logger.error(f"Bot {chat_id} guruhida admin emas: {bot_status}")
                 await query.edit_message_text(
                     f"Bot {chat_id} guruhida admin sifatida bo'lishi kerak. Iltimos, botni guruhda admin qiling.",
                     parse_mode=None
@@ -342,10 +480,11 @@ async def handle_group_confirmation(update: Update, context: ContextTypes.DEFAUL
             return
         
         # Foydalanuvchining guruhdagi holatini tekshirish
-        member = await context.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-        if member.status in ['member', 'administrator', 'creator']:
-            user_data[user_id]["group_joined"] = True
-            save_data(user_data, USER_DATA_FILE)
+        if await group_membership.is_member(context.bot, user_id):
+            user_info = storage.get_user(user_id)
+            user_info["group_joined"] = True
+            user_info["group_checked_at"] = datetime.now().isoformat(timespec='seconds')
+            storage.put_user(user_id, user_info)
             await query.edit_message_text(
                 "✅ Guruhga a'zo bo'ldingiz! Endi asosiy menyudan foydalanishingiz mumkin.",
                 reply_markup=MAIN_KEYBOARD,
@@ -383,40 +522,31 @@ async def show_teacher_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    text = (
-        "👨‍🏫 **O'zim haqimda**\n\n"
-        "Salom! Men Shoxrux Ibrohimovman\. Matematika bo'yicha tajribali o'qituvchiman\.\n"
-        "8 yildan ortiq o'qituvchilik tajribam bor\. Toshkent axborot texnologiyalari Universitetini tugatganman, hozirda kombinatda Muhandis dasturchi bo'lib ishlayman\. Matematikadan alimpistman: Nurota tumanida 7\-9 sinflar matematikadan alimpiadada birinchi o'rinni olganman\. Navoiy 1\-litseyda 2 kursda Navoiy shahrida 1\-o'rin, Navoiy viloyat bosqichida 5\-o'rinni olganman\.\n\n"
-        "**KURSLARIM**\n\n"
-        "Kurslarimni asosan 0 dan boshlab o'taman\. Turk sifir matematika kabi kitoblar bor, tarjima qilganman\. O'zi shu kitoblardan o'quvchilarga 0 dan bilim beraman\. Bu kitoblar orqali qiynalmay, unchalik miyaga nagruzka bermay, fundamental matematikani puxta o'rganib olishingiz mumkin\. O'rta darajaga kelsak, bilimingiz fundamentalda yaxshi bo'lgach, toplam 1996\-2003 maktab darsliklari shu kitoblar o'tiladi\. Bundan ham o'tib olgach, eng oxirida Puza geometriya, Algebra, Skanavi kabi kuchli kitoblarda ishlaymiz\.\n\n"
-        "**NATIJALAR**\n\n"
-        "0 dan boshlab o'rganuvchilarga 2 yilda bemalol Milliy sertifikatga topshirish va yuqori natijalar olishgacha tayyorlayman\. Bir yilda ham eplasa bo'ladi, bu 0 dan boshlasangiz ham o'zingizning olish qobiliyatingizga bog'liq\. Kimdurlar bitta kitobni 4 oyda tugatib, yana qayta ishlab chiqmasa bo'lmaydigan darajada esidan chiqarib yuboradi, kimdur esa 7 oyda ishlab tugatib, lekin mukammal tugatgan, esidan mavzularni ishlash usullarini esidan chiqarib yubormagan bo'ladi\. Hullas shunaqa gaplar\.\n\n"
-        "**Kursga qo'shilish uchun**\n"
-        "📞 Aloqa: \+998507551023\n"
-        "@Shoxrux_Ibrohimov"
-    )
-    
-    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Asosiy menyu", callback_data="main_menu")]])
     try:
-        await query.edit_message_text(text, reply_markup=keyboard, parse_mode='MarkdownV2')
+        await query.edit_message_text(TEACHER_INFO_TEXT, reply_markup=BACK_TO_MENU_KEYBOARD, parse_mode='MarkdownV2')
     except BadRequest as e:
         logger.error(f"Markdown parsing xatosi: {e}")
         # Agar Markdown xatosi bo'lsa, oddiy matn sifatida yuborish
-        await query.edit_message_text(text.replace('\\', ''), reply_markup=keyboard, parse_mode=None)
+        await query.edit_message_text(TEACHER_INFO_PLAIN, reply_markup=BACK_TO_MENU_KEYBOARD, parse_mode=None)
 
 # Natijalarni ko'rsatish (oddiy user uchun)
 async def show_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = str(query.from_user.id)
-    user_results = results.get(user_id, [])
+    user_results = storage.get_results(user_id)
     
     if not user_results:
         text = "Sizda hali natijalar yo'q. Sinov testini topshirib ko'ring!"
         await query.edit_message_text(text, reply_markup=MAIN_KEYBOARD)
         return
     
-    result_text = "📊 Sizning natijalaringiz:\n\n"
+    totals = storage.get_result_totals(user_id)
+    result_text = (
+        f"📊 Sizning natijalaringiz:\n\n"
+        f"Jami testlar: {totals['count']}, eng yaxshi natija: {totals['best']:.1f}%, "
+        f"o'rtacha: {totals['average']:.1f}%\n\n"
+    )
     for i, res in enumerate(user_results[-5:], 1):
         percentage = (res['score'] / res['total']) * 100 if res['total'] > 0 else 0
         result_text += (
@@ -427,49 +557,242 @@ async def show_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await query.edit_message_text(result_text, reply_markup=MAIN_KEYBOARD, parse_mode='Markdown')
 
-# Admin: Barcha o'quvchilar
-async def admin_show_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Admin ro'yxatlari sahifalab ko'rsatiladi. Callback ma'lumoti (64 baytdan oshmaydi):
+#   apage_<ro'yxat>_<maydon>_<qiymat>_<kursor>   ro'yxat: users|results, maydon: all|class|school,
+#                                                kursor: 0 (birinchi sahifa), n<k> (keyingi), p<k> (oldingi)
+#   afilter_<ro'yxat>_<maydon>                  sinf yoki maktab tanlash menyusi
+# Maktab filtri callback'da schools.json kaliti bilan uzatiladi, saqlangan nomga shu yerda aylantiriladi.
+ADMIN_LISTS = {
+    "users": ("👥 **Barcha o'quvchilar:**", "O'quvchilar yo'q."),
+    "results": ("📊 **Barcha natijalar:**", "Natijalar yo'q.")
+}
+CLASS_VALUES = ["5", "6", "7", "8", "9", "10", "11"]
+
+def resolve_filter(field, value):
+    if field == "school":
+        if value == "other":
+            return "Boshqa maktab"
+        return schools.get("schools", {}).get(value, value)
+    return value
+
+def build_page_keyboard(list_name, field, value, prev_cursor, next_cursor):
+    base = f"apage_{list_name}_{field}_{value}"
+    nav_row = []
+    if prev_cursor is not None:
+        nav_row.append(InlineKeyboardButton("⬅️ Oldingi", callback_data=f"{base}_p{prev_cursor}"))
+    if next_cursor is not None:
+        nav_row.append(InlineKeyboardButton("Keyingi ➡️", callback_data=f"{base}_n{next_cursor}"))
+    keyboard = [nav_row] if nav_row else []
+    keyboard.append([
+        InlineKeyboardButton("🎓 Sinf bo'yicha", callback_data=f"afilter_{list_name}_class"),
+        InlineKeyboardButton("🏫 Maktab bo'yicha", callback_data=f"afilter_{list_name}_school")
+    ])
+    if field != "all":
+        keyboard.append([InlineKeyboardButton("❌ Filtrni olib tashlash", callback_data=f"apage_{list_name}_all_-_0")])
+    keyboard.append([InlineKeyboardButton("🔙 Admin menyu", callback_data="main_menu")])
+    return InlineKeyboardMarkup(keyboard)
+
+def format_user_line(number, info):
+    phone = info.get('phone', 'Kiritilmagan')
+    school = info.get('school', 'Kiritilmagan')
+    cls = info.get('class', 'Kiritilmagan')
+    full_name = f"{info.get('first_name', '')} {info.get('last_name', '')}".strip() or 'Noma\'lum'
+    return f"{number}. {full_name} (Sinf: {cls}, Maktab: {school}, Telefon: {phone})\n"
+
+def format_user_results(uid, info):
+    full_name = f"{info.get('first_name', '')} {info.get('last_name', '')}".strip() or 'Noma\'lum'
+    totals = storage.get_result_totals(uid)
+    text = f"**{full_name} (ID: {uid}):** {totals['count']} ta test, o'rtacha {totals['average']:.1f}%\n"
+    for res in storage.get_results(uid)[-3:]:
+        percentage = (res['score'] / res['total']) * 100 if res['total'] > 0 else 0
+        text += f"   - {res['subject'].capitalize()}: {res['score']}/{res['total']} ({percentage:.1f}%) - {res['date'][:19].replace('T', ' ')}\n"
+    return text + "\n"
+
+# Admin: ro'yxatning bitta sahifasi. Faqat shu sahifadagi yozuvlar o'qiladi va matnga aylantiriladi.
+async def admin_show_page(update: Update, context: ContextTypes.DEFAULT_TYPE, list_name="users", field="all", value="-", cursor="0"):
     query = update.callback_query
     await query.answer()
-    
-    if not user_data:
-        text = "O'quvchilar yo'q."
-        await query.edit_message_text(text, reply_markup=ADMIN_MENU_KEYBOARD)
+
+    after = before = None
+    if cursor.startswith("n"):
+        after = int(cursor[1:])
+    elif cursor.startswith("p"):
+        before = int(cursor[1:])
+
+    title, empty_text = ADMIN_LISTS[list_name]
+    filter_field = None if field == "all" else field
+    filter_value = resolve_filter(field, value) if filter_field else None
+    page, prev_cursor, next_cursor = storage.page_users(
+        after=after, before=before, limit=ADMIN_PAGE_SIZE,
+        field=filter_field, value=filter_value, with_results=list_name == "results"
+    )
+    keyboard = build_page_keyboard(list_name, field, value, prev_cursor, next_cursor)
+
+    if not page:
+        await query.edit_message_text(empty_text, reply_markup=keyboard)
         return
-    
-    users_text = "👥 **Barcha o'quvchilar:**\n\n"
-    for i, (uid, info) in enumerate(user_data.items(), 1):
-        phone = info.get('phone', 'Kiritilmagan')
-        school = info.get('school', 'Kiritilmagan')
-        cls = info.get('class', 'Kiritilmagan')
-        full_name = f"{info.get('first_name', '')} {info.get('last_name', '')}".strip() or 'Noma\'lum'
-        users_text += f"{i}. {full_name} (Sinf: {cls}, Maktab: {school}, Telefon: {phone})\n"
-    
-    await query.edit_message_text(users_text, reply_markup=ADMIN_MENU_KEYBOARD, parse_mode='Markdown')
+
+    text = title + "\n"
+    if filter_field:
+        text += f"_{'Sinf' if field == 'class' else 'Maktab'}: {filter_value}_\n"
+    text += "\n"
+    for i, (uid, info) in enumerate(page, 1):
+        if list_name == "users":
+            text += format_user_line(i, info)
+        else:
+            text += format_user_results(uid, info)
+
+    await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
+
+# Admin: ro'yxatni sinf yoki maktab bo'yicha saralash uchun qiymat tanlash
+async def admin_choose_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    _, list_name, field = query.data.split("_")
+
+    if field == "class":
+        choices = [(f"{cls}-sinf", cls) for cls in CLASS_VALUES]
+        text = "Qaysi sinf o'quvchilarini ko'rsatay?"
+    else:
+        choices = [(f"{key} maktab", key) for key in schools.get("schools", {})] + [("Boshqa maktab", "other")]
+        text = "Qaysi maktab o'quvchilarini ko'rsatay?"
+    keyboard = [
+        [InlineKeyboardButton(label, callback_data=f"apage_{list_name}_{field}_{value}_0") for label, value in choices[i:i+3]]
+        for i in range(0, len(choices), 3)
+    ]
+    keyboard.append([InlineKeyboardButton("🔙 Orqaga", callback_data=f"apage_{list_name}_all_-_0")])
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+# apage_<ro'yxat>_<maydon>_<qiymat>_<kursor> tugmalari
+async def admin_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _, list_name, field, value, cursor = update.callback_query.data.split('_')
+    await admin_show_page(update, context, list_name, field, value, cursor)
+
+# Admin: Barcha o'quvchilar
+async def admin_show_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await admin_show_page(update, context, "users")
 
 # Admin: Barcha natijalar
 async def admin_show_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await admin_show_page(update, context, "results")
+
+# Admin: /export [csv|xlsx] - o'quvchilar va natijalar jadvali. Fayl fon oqimida yoziladi,
+# shuning uchun eksport davomida boshqa o'quvchilarning so'rovlari to'xtab qolmaydi.
+async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.effective_user.id)
+    if user_id != ADMIN_ID:
+        return
+
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in ("csv", "xlsx"):
+        await update.message.reply_text("Foydalanish: /export yoki /export xlsx")
+        return
+    if fmt == "xlsx" and not xlsx_available():
+        await update.message.reply_text("XLSX uchun openpyxl o'rnatilmagan, CSV yuboriladi.")
+        fmt = "csv"
+
+    await update.message.reply_text("⏳ Eksport tayyorlanmoqda...")
+    await storage.drain_dirty()
+    try:
+        filename, count = await asyncio.to_thread(build_export, storage, fmt)
+    except Exception as e:
+        logger.error(f"Eksportda xato: {e}")
+        await update.message.reply_text("Eksportni tayyorlashda xato yuz berdi.")
+        return
+
+    try:
+        with open(filename, 'rb') as f:
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=f,
+                filename=f"oquvchilar_{datetime.now():%Y%m%d_%H%M}.{fmt}",
+                caption=f"📥 Eksport: {count} qator"
+            )
+    finally:
+        os.remove(filename)
+
+# Admin: yig'ma statistika. Hisoblagichlardan o'qiladi, natijalar ro'yxati aylanib chiqilmaydi.
+def build_stats_text():
+    data = aggregates.combined()
+    overall = data["overall"]
+    if not overall["count"]:
+        return "Hali birorta test yakunlanmagan."
+
+    def levels_line(group):
+        return ", ".join(f"{level}: {group['levels'].get(level, 0)}" for level in LEVELS)
+
+    text = (
+        f"📈 *Statistika*\n\n"
+        f"Jami testlar: {overall['count']}, o'rtacha natija: {StatsStore.average(overall):.1f}%\n"
+        f"Darajalar: {levels_line(overall)}\n\n"
+        f"🏫 *Maktablar bo'yicha:*\n"
+    )
+    for name, group in sorted(data["schools"].items(), key=lambda item: -item[1]["count"]):
+        text += f"   {name}: {group['count']} ta test, {StatsStore.average(group):.1f}%\n"
+    text += "\n🎓 *Sinflar bo'yicha:*\n"
+    for name, group in sorted(data["classes"].items(), key=lambda item: int(item[0]) if item[0].isdigit() else 99):
+        text += f"   {name}-sinf: {group['count']} ta test, {StatsStore.average(group):.1f}% ({levels_line(group)})\n"
+    hardest = aggregates.hardest_questions(data=data)
+    if hardest:
+        text += "\n❓ *Eng qiyin savollar:*\n"
+        for key, rate, attempts in hardest:
+            subject, question_id = key.split(":")
+            text += f"   {subject.capitalize()} #{question_id}: {rate:.0f}% to'g'ri ({attempts} urinish)\n"
+    return text
+
+# Admin: /stats (yoki /stats rebuild - hisoblagichlarni natijalar tarixidan qayta qurish)
+async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.effective_user.id)
+    if user_id != ADMIN_ID:
+        return
+
+    if context.args and context.args[0] == "rebuild":
+        await update.message.reply_text("⏳ Statistika qayta hisoblanmoqda...")
+        await rebuild_aggregates()
+    await update.message.reply_text(build_stats_text(), reply_markup=ADMIN_MENU_KEYBOARD, parse_mode='Markdown')
+
+async def admin_show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    
-    if not results:
-        text = "Natijalar yo'q."
-        await query.edit_message_text(text, reply_markup=ADMIN_MENU_KEYBOARD)
+    await query.edit_message_text(build_stats_text(), reply_markup=ADMIN_MENU_KEYBOARD, parse_mode='Markdown')
+
+# Admin: /analytics - savollar tahlili (qiyinlik, ajratish indeksi, distraktorlar).
+# Shubhali savollar (belgisi ko'p bo'lganlari birinchi) ko'rsatiladi.
+async def admin_analytics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.effective_user.id)
+    if user_id != ADMIN_ID:
         return
-    
-    results_text = "📊 **Barcha natijalar:**\n\n"
-    for uid, user_results in results.items():
-        if not user_results:
-            continue
-        info = user_data.get(uid, {})
-        full_name = f"{info.get('first_name', '')} {info.get('last_name', '')}".strip() or 'Noma\'lum'
-        results_text += f"**{full_name} (ID: {uid}):**\n"
-        for res in user_results[-3:]:
-            percentage = (res['score'] / res['total']) * 100 if res['total'] > 0 else 0
-            results_text += f"   - {res['subject'].capitalize()}: {res['score']}/{res['total']} ({percentage:.1f}%) - {res['date'][:19].replace('T', ' ')}\n"
-        results_text += "\n"
-    
-    await query.edit_message_text(results_text, reply_markup=ADMIN_MENU_KEYBOARD, parse_mode='Markdown')
+
+    subject = context.args[0] if context.args else "matem"
+    questions_list = questions_pool.get(subject, [])
+    if not questions_list:
+        await update.message.reply_text(f"'{subject}' fani bo'yicha savollar topilmadi.")
+        return
+
+    await storage.drain_dirty()
+    report, answers_count, tests_count, elapsed = await asyncio.to_thread(
+        run_analysis, storage.iter_export(), questions_list, subject
+    )
+    flagged = sorted((item for item in report if item["flags"]), key=lambda item: -len(item["flags"]))
+
+    text = (
+        f"🔬 Savollar tahlili ({subject}): {tests_count} test, {answers_count} javob, {elapsed:.2f} s\n"
+        f"Shubhali savollar: {len(flagged)}/{len(report)}\n\n"
+    )
+    for item in flagged[:15]:
+        options = " / ".join(f"{share * 100:.0f}%" for share in item["options"])
+        text += (
+            f"#{item['id']}: p={item['difficulty']:.2f}, D={item['discrimination']:.2f}, {item['attempts']} urinish\n"
+            f"   Variantlar: {options}\n"
+            f"   ⚠️ {'; '.join(item['flags'])}\n"
+        )
+    await update.message.reply_text(text)
+
+# Hisoblagichlarni natijalar tarixidan fon oqimida qayta qurish
+async def rebuild_aggregates():
+    await storage.drain_dirty()
+    count = await asyncio.to_thread(aggregates.rebuild, storage.iter_export())
+    logger.info(f"Statistika tarixdan qayta qurildi: {count} ta natija.")
 
 # Admin: Barchaga xabar tayyorlash
 async def admin_broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -477,10 +800,15 @@ async def admin_broadcast_start(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     user_id = str(query.from_user.id)
     
-    user_data[user_id]["waiting_for"] = "broadcast"
-    save_data(user_data, USER_DATA_FILE)
+    user_info = storage.get_user(user_id)
+    user_info["waiting_for"] = "broadcast"
+    storage.put_user(user_id, user_info)
     
-    text = "📢 Xabaringizni yuboring (matn yoki rasm + izoh bilan). Yuborganingizdan keyin barcha o'quvchilarga jo'natiladi."
+    total_count, active_count = storage.count_users()
+    text = (
+        "📢 Xabaringizni yuboring (matn yoki rasm + izoh bilan). Yuborganingizdan keyin barcha o'quvchilarga jo'natiladi.\n\n"
+        f"Xabar yetib boradigan o'quvchilar: {active_count} (botni bloklagan: {total_count - active_count})"
+    )
     keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Bekor qilish", callback_data="admin_cancel_broadcast")]])
     await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
 
@@ -490,9 +818,10 @@ async def admin_cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
     user_id = str(query.from_user.id)
     
-    if user_data[user_id].get("waiting_for") == "broadcast":
-        user_data[user_id]["waiting_for"] = None
-        save_data(user_data, USER_DATA_FILE)
+    user_info = storage.get_user(user_id)
+    if user_info.get("waiting_for") == "broadcast":
+        user_info["waiting_for"] = None
+        storage.put_user(user_id, user_info)
     
     await show_main_menu(update, context, user_id)
 
@@ -501,11 +830,15 @@ async def start_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = str(query.from_user.id)
-    user = user_data.get(user_id, {})
+    user = storage.get_user(user_id) or {}
     
-    if not user.get("class") or not user.get("school") or not user.get("phone") or not user.get("group_joined"):
+    if not user.get("class") or not user.get("school") or not user.get("phone"):
         await query.edit_message_text("Iltimos, avval sinfingiz, maktabingiz, telefon raqamingizni kiriting va guruhga a'zo bo'ling.", reply_markup=MAIN_KEYBOARD)
         return
+    # A'zolik fonda qayta tekshiriladi (reverify_membership), bu yerda faqat saqlangan belgi o'qiladi
+    if not user.get("group_joined"):
+        await handle_group_join(update, context)
+        return
 
     today = datetime.now().date()
     last_test_date = user.get("last_test_date")
@@ -518,62 +851,109 @@ async def start_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     if last_test_date != today:
-        user_data[user_id]["test_count_today"] = 0
+        user["test_count_today"] = 0
     
-    user_data[user_id]["test_count_today"] += 1
-    user_data[user_id]["last_test_date"] = today.strftime("%Y-%m-%d")
-    save_data(user_data, USER_DATA_FILE)
+    user["test_count_today"] += 1
+    user["last_test_date"] = today.strftime("%Y-%m-%d")
+    storage.put_user(user_id, user)
     
     questions_list = questions_pool.get("matem", [])
     if not questions_list:
         await query.edit_message_text("Kechirasiz, savollar bazasida savollar topilmadi.", reply_markup=MAIN_KEYBOARD)
         return
 
+    # Tanlov seed orqali takrorlanadigan qilinadi, testda faqat savol ID'lari saqlanadi
+    seed = random.randrange(2 ** 32)
+    rng = random.Random(seed)
+
+    # Adaptiv rejimda birinchi savol o'rta qiyinlikdan olinadi, qolganlari javoblarga qarab tanlanadi
+    if ADAPTIVE_TEST:
+        first_question = adaptive_engine.first_question("matem", rng)
+        if first_question is None:
+            await query.edit_message_text("Test uchun yetarli savollar topilmadi. Iltimos, ma'muriyat bilan bog'laning.", reply_markup=MAIN_KEYBOARD)
+            return
+        storage.put_test(user_id, {
+            'subject': "matem",
+            'score': 0,
+            'current_question': 0,
+            'seed': seed,
+            'bank_version': question_index.version,
+            'question_ids': [first_question],
+            'answers': [],
+            'question_message_id': None,
+            'adaptive': True,
+            'max_questions': adaptive_engine.max_questions
+        })
+        await ask_question(update, context)
+        return
+
     user_questions = []
-    for i in range(0, 100, 10):
-        group_questions = [q for q in questions_list if i < q.get('id', 0) <= i + 10]
+    for bucket in range(10):
+        group_questions = question_index.bucket("matem", bucket)
         if group_questions:
-            user_questions.append(random.choice(group_questions))
+            user_questions.append(rng.choice(group_questions))
         else:
-            logger.warning(f"ID oralig'i {i+1}-{i+10} bo'yicha savol topilmadi.")
+            logger.warning(f"ID oralig'i {bucket * BUCKET_SIZE + 1}-{(bucket + 1) * BUCKET_SIZE} bo'yicha savol topilmadi.")
             
     if len(user_questions) < 10:
         await query.edit_message_text("Test uchun yetarli savollar topilmadi. Iltimos, ma'muriyat bilan bog'laning.", reply_markup=MAIN_KEYBOARD)
         return
         
-    user_data[user_id]["current_test"] = {
+    storage.put_test(user_id, {
         'subject': "matem",
         'score': 0,
         'current_question': 0,
-        'questions': user_questions,
+        'seed': seed,
+        'bank_version': question_index.version,
+        'question_ids': user_questions,
         'answers': [],
         'question_message_id': None
-    }
-    save_data(user_data, USER_DATA_FILE)
+    })
     
     await ask_question(update, context)
 
+# Savolni ID bo'yicha indeksdan topish. Test boshlangan versiyadagi savol qaytariladi,
+# shuning uchun savollar bazasi test davomida yangilansa ham test buzilmaydi.
+def get_question(subject, question_id, version=None):
+    return question_index.get(subject, question_id, version)
+
+# Tugallanmagan testni olish. Eski formatdagi (savollar to'liq nusxalangan) test ID'larga o'tkaziladi.
+# Javoblar ixcham ko'rinishda: [savol_id, foydalanuvchi_javobi, to'g'ri (1/0)]
+def get_current_test(user_id):
+    user_test = storage.get_test(user_id)
+    if user_test and 'questions' in user_test:
+        user_test['question_ids'] = [q['id'] for q in user_test.pop('questions')]
+        user_test['answers'] = [
+            [ans['question_id'], ans['user_answer'], int(ans['is_correct'])] for ans in user_test['answers']
+        ]
+    return user_test
+
 # Savol so'rash
 async def ask_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
-    user_test = user_data.get(user_id, {}).get("current_test")
+    user_test = get_current_test(user_id)
     
     if not user_test:
         return
 
     current_q_index = user_test.get('current_question', 0)
-    total_q_count = len(user_test['questions'])
+    total_q_count = len(user_test['question_ids'])
 
     if current_q_index >= total_q_count:
         await finish_test(update, context)
         return
     
-    question_data = user_test['questions'][current_q_index]
+    question_data = get_question(user_test['subject'], user_test['question_ids'][current_q_index], user_test.get('bank_version'))
+    if not question_data:
+        logger.error(f"Savol topilmadi: {user_test['question_ids'][current_q_index]}")
+        await context.bot.send_message(user_id, "Test jarayonida xatolik yuz berdi. Iltimos, qayta urinib ko'ring.")
+        await finish_test(update, context)
+        return
     
-    keyboard = [[InlineKeyboardButton(option, callback_data=f'answer_{i}')] for i, option in enumerate(question_data['options'])]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    question_body, reply_markup, _ = render_cache.question(user_test['subject'], question_data, current_q_index)
     
-    question_text = f"📝 Savol {current_q_index + 1}/{total_q_count}:\n\n{question_data['question']}"
+    # Adaptiv testda savollar soni oldindan ma'lum emas, eng ko'p soni ko'rsatiladi
+    question_text = f"📝 Savol {current_q_index + 1}/{user_test.get('max_questions', total_q_count)}:\n\n{question_body}"
     
     try:
         if user_test.get('question_message_id'):
@@ -590,8 +970,7 @@ async def ask_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=reply_markup
             )
             user_test['question_message_id'] = message.message_id
-        
-        save_data(user_data, USER_DATA_FILE)
+            storage.put_test(user_id, user_test)
     except BadRequest as e:
         logger.error(f"Savol yuborishda xato: {e}")
         await context.bot.send_message(user_id, "Test jarayonida xatolik yuz berdi. Iltimos, qayta urinib ko'ring.")
@@ -603,78 +982,85 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     user_id = str(query.from_user.id)
     
-    user_test = user_data.get(user_id, {}).get("current_test")
-    if not user_test:
+    user_test = get_current_test(user_id)
+    if not user_test or user_test['current_question'] >= len(user_test['question_ids']):
         return
 
-    answer_index = int(query.data.split('_')[1])
-    question_data = user_test['questions'][user_test['current_question']]
+    # answer_<savol raqami>_<variant>: boshqa savolga tegishli javob (ikki marta bosish, eski xabar)
+    # e'tiborsiz qoldiriladi. Eski answer_<variant> ko'rinishi joriy savolga tegishli deb olinadi.
+    parts = query.data.split('_')
+    if len(parts) == 3 and int(parts[1]) != user_test['current_question']:
+        logger.info(f"Foydalanuvchi {user_id}: {parts[1]}-savolga takroriy javob e'tiborsiz qoldirildi.")
+        return
+    answer_index = int(parts[-1])
+    question_id = user_test['question_ids'][user_test['current_question']]
+    question_data = get_question(user_test['subject'], question_id, user_test.get('bank_version'))
     
-    is_correct = (answer_index == question_data['correct'])
+    is_correct = question_data is not None and answer_index == question_data['correct']
     if is_correct:
         user_test['score'] += 1
     
-    user_test['answers'].append({
-        'question_id': question_data['id'],
-        'user_answer': answer_index,
-        'correct_answer': question_data['correct'],
-        'is_correct': is_correct,
-        'explanation': question_data.get('explanation', "Yechim topilmadi.")
-    })
+    user_test['answers'].append([question_id, answer_index, int(is_correct)])
     
+    # Adaptiv testda navbatdagi savol bahoga qarab qo'shiladi; qo'shilmasa test shu yerda tugaydi
+    if user_test.get('adaptive'):
+        rng = random.Random(f"{user_test['seed']}:{len(user_test['answers'])}")
+        next_question = adaptive_engine.next_question(user_test['subject'], user_test, rng)
+        if next_question is not None:
+            user_test['question_ids'].append(next_question)
+
     user_test['current_question'] += 1
-    save_data(user_data, USER_DATA_FILE)
+    storage.put_test(user_id, user_test)
     
     await ask_question(update, context)
 
 # Testni yakunlash
 async def finish_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
-    user_test = user_data.get(user_id, {}).get("current_test")
+    user_test = get_current_test(user_id)
     
     if not user_test:
         return
         
     score = user_test['score']
-    total = len(user_test['questions'])
+    total = len(user_test['question_ids'])
     subject = user_test['subject']
     
     # Natijani saqlash
-    results.setdefault(user_id, []).append({
+    # Javoblar ixcham ko'rinishda natija bilan birga saqlanadi (savollar tahlili uchun)
+    result = {
         "score": score,
         "total": total,
         "subject": subject,
-        "date": datetime.now().isoformat()
-    })
-    save_data(results, RESULTS_FILE)
+        "date": datetime.now().isoformat(),
+        "answers": user_test['answers']
+    }
+    # Adaptiv testda daraja to'g'ri javoblar foizidan emas, qobiliyat bahosidan (theta) aniqlanadi
+    if user_test.get('adaptive') and 'level' in user_test:
+        result["theta"] = user_test['theta']
+        result["level"] = user_test['level']
+    # Avval statistika: fonda qayta qurish ketayotgan bo'lsa, natija tarixda ko'rinishidan oldin
+    # eslab qolingan bo'ladi va ikki marta sanalmaydi
+    aggregates.record(storage.get_user(user_id) or {}, result, user_test['answers'])
+    storage.add_result(user_id, result)
     
     # Noto'g'ri javoblar uchun yechimlarni yig'ish
     wrong_answers_explanations = ""
-    for ans in user_test['answers']:
-        if not ans['is_correct']:
-            original_question = next((q for q in questions_pool.get(subject, []) if q['id'] == ans['question_id']), None)
+    for question_id, user_answer, is_correct in user_test['answers']:
+        if not is_correct:
+            original_question = get_question(subject, question_id, user_test.get('bank_version'))
             if original_question:
-                wrong_answers_explanations += (
-                    f"❌ **{original_question['question']}**\n"
-                    f"To'g'ri javob: {original_question['options'][original_question['correct']]}\n"
-                    f"Yechim: {original_question.get('explanation', 'Yechim topilmadi.')}\n\n"
-                )
+                wrong_answers_explanations += render_cache.question(subject, original_question)[2]
 
     # Test ma'lumotlarini o'chirish
-    if "current_test" in user_data[user_id]:
-        del user_data[user_id]["current_test"]
-    save_data(user_data, USER_DATA_FILE)
+    storage.delete_test(user_id)
+    # Test yakuni muhim o'tish: natija keyingi davriy yozishni kutmasdan darhol yoziladi
+    storage.flush_dirty()
     
     # Natija xabarini tayyorlash
     percentage = (score / total) * 100 if total > 0 else 0
-    level = "boshlang'ich"
-    if percentage >= 80:
-        level = "yuqori"
-    elif percentage >= 50:
-        level = "o'rta"
+    level = result.get("level") or level_for(score, total)
     
-    course_data = courses.get(subject, {})
-    recommended_course = course_data.get("levels", {}).get(level, {})
     
     result_text = (
         f"🎯 Test yakunlandi!\n\n"
@@ -688,16 +1074,7 @@ async def finish_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
         result_text += "*Noto'g'ri javoblaringiz yechimlari:*\n"
         result_text += wrong_answers_explanations
 
-    result_text += (
-        f"📚 Sizga tavsiya etilayotgan kurs: *{course_data.get('name', 'Nomalum')}*\n"
-        f"🕐 Vaqti: {recommended_course.get('time', 'Malumot kiritilmagan')}\n"
-        f"👨‍🏫 O'qituvchi: {recommended_course.get('teacher', 'Malumot kiritilmagan')}\n"
-        f"📍 Manzil: {recommended_course.get('location', 'Malumot kiritilmagan')}\n"
-        f"💰 Narxi: {recommended_course.get('price', 'Malumot kiritilmagan')}\n\n"
-        f"📚 Kitoblar: {recommended_course.get('description', 'Malumot kiritilmagan')}\n\n"
-        f"📞 *Ro'yxatdan o'tish uchun: +998507551023*\n"
-        f"*@Shoxrux_Ibrohimov*"
-    )
+    result_text += render_cache.recommendation(subject, level, courses.get(subject, {}))
     
     try:
         if update.callback_query:
@@ -716,87 +1093,43 @@ async def finish_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except BadRequest as e:
         logger.error(f"Natija xabarini yuborishda xato: {e}")
 
-# Callback querylarni boshqarish
+# Callback querylarni boshqarish (marshrutlar fayl oxirida ro'yxatdan o'tkaziladi)
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    data = query.data
-    
-    if data.startswith('class_'):
-        await handle_class_selection(update, context)
-    elif data.startswith('school_'):
-        await handle_school_selection(update, context)
-    elif data == 'enter_phone' or data == 'share_phone':
-        await handle_phone_selection(update, context)
-    elif data == 'confirm_group':
-        await handle_group_confirmation(update, context)
-    elif data == 'teacher_info':
-        await show_teacher_info(update, context)
-    elif data == 'courses_list':
-        await show_courses_info(update, context)
-    elif data.startswith('course_info_'):
-        await show_course_details(update, context)
-    elif data == 'show_results':
-        await show_results(update, context)
-    elif data == 'start_test':
-        await start_test(update, context)
-    elif data == 'main_menu':
-        await show_main_menu(update, context, str(query.from_user.id))
-    elif data == 'admin_users':
-        await admin_show_users(update, context)
-    elif data == 'admin_results':
-        await admin_show_results(update, context)
-    elif data == 'admin_broadcast':
-        await admin_broadcast_start(update, context)
-    elif data == 'admin_cancel_broadcast':
-        await admin_cancel_broadcast(update, context)
+    await callback_router.dispatch(update, context)
 
 # Kurslar haqida ma'lumot
 async def show_courses_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    keyboard = [[InlineKeyboardButton(course['name'], callback_data=f"course_info_{key}")] for key, course in courses.items()]
-    reply_markup = InlineKeyboardMarkup(keyboard + [[InlineKeyboardButton("🏠 Asosiy menyu", callback_data="main_menu")]])
-    
     text = "📚 Bizning kurslarimiz haqida ma'lumot olish uchun quyidagi tugmalardan birini tanlang: kurs o'qituvchisi tel raqami: +998507551023"
-    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    await query.edit_message_text(text, reply_markup=render_cache.courses_keyboard, parse_mode='Markdown')
 
 # Kurs haqida batafsil ma'lumot
 async def show_course_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     course_key = query.data.split("_")[2]
-    course_data = courses.get(course_key, {})
+    course_text = render_cache.course_details.get(course_key)
     
-    if not course_data:
+    if not course_text:
         await query.edit_message_text("Kurs ma'lumoti topilmadi.", reply_markup=MAIN_KEYBOARD)
         return
     
-    course_text = f"📚 **{course_data['name']}**\n\n"
-    for level, level_data in course_data.get('levels', {}).items():
-        course_text += (
-            f"🎯 **{level.capitalize()} daraja:**\n"
-            f"   🕐 Vaqt: {level_data.get('time', 'Malumot kiritilmagan')}\n"
-            f"   👨‍🏫 O'qituvchi: {level_data.get('teacher', 'Malumot kiritilmagan')}\n"
-            f"   📍 Manzil: {level_data.get('location', 'Malumot kiritilmagan')}\n"
-            f"   💰 Narx: {level_data.get('price', 'Malumot kiritilmagan')}\n\n"
-            f"   📚 Kitoblar: {level_data.get('description', 'Malumot kiritilmagan')}\n\n"
-        )
-    
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Kurslar ro'yxati", callback_data="courses_list")]])
-    await query.edit_message_text(course_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await query.edit_message_text(course_text, reply_markup=BACK_TO_COURSES_KEYBOARD, parse_mode='Markdown')
 
 # Matnli xabarlarni qayta ishlash (telefon va broadcast uchun)
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
-    waiting_for = user_data[user_id].get("waiting_for")
+    user_info = storage.get_user(user_id) or {}
+    waiting_for = user_info.get("waiting_for")
     
     if waiting_for == "phone":
         phone = update.message.text.strip()
         if phone.startswith('+') and len(phone) >= 12:
-            user_data[user_id]["phone"] = phone
-            user_data[user_id]["waiting_for"] = None
-            save_data(user_data, USER_DATA_FILE)
+            user_info["phone"] = phone
+            user_info["waiting_for"] = None
+            storage.put_user(user_id, user_info)
             await update.message.reply_text(
                 f"Raqam saqlandi: {phone}\n\nEndi guruhga a'zo bo'ling!",
                 reply_markup=ReplyKeyboardRemove(),
@@ -828,27 +1161,16 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     elif waiting_for == "broadcast" and user_id == ADMIN_ID:
-        message_text = update.message.text
-        sent_count = 0
-        failed_count = 0
-        for uid in user_data.keys():
-            if uid == user_id:
-                continue
-            try:
-                await context.bot.send_message(chat_id=uid, text=message_text, parse_mode='Markdown')
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Foydalanuvchiga xabar yuborishda xato {uid}: {e}")
-                failed_count += 1
-        
-        user_data[user_id]["waiting_for"] = None
-        save_data(user_data, USER_DATA_FILE)
+        user_info["waiting_for"] = None
+        storage.put_user(user_id, user_info)
         
-        await update.message.reply_text(f"Xabar {sent_count} o'quvchiga yuborildi. Muvaffaqiyatsiz: {failed_count}")
+        # Xabar fonda yuboriladi, admin holat xabarida jonli hisobotni ko'radi
+        recipients = [uid for uid in storage.user_ids(active_only=True) if uid != user_id]
+        await broadcaster.start(context.application, {"text": update.message.text}, recipients, user_id)
         await show_main_menu(update, context, user_id)
         return
     
-    if "current_test" in user_data.get(user_id, {}):
+    if storage.get_test(user_id):
         await context.bot.send_message(user_id, "Iltimos, testni tugatish uchun tugmalardan foydalaning.")
     else:
         await show_main_menu(update, context, user_id)
@@ -856,12 +1178,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Kontakt yuborilganda (Telegram raqami)
 async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
-    if user_data[user_id].get("waiting_for") == "share_phone":
+    user_info = storage.get_user(user_id) or {}
+    if user_info.get("waiting_for") == "share_phone":
         contact = update.message.contact
         phone = contact.phone_number
-        user_data[user_id]["phone"] = phone
-        user_data[user_id]["waiting_for"] = None
-        save_data(user_data, USER_DATA_FILE)
+        user_info["phone"] = phone
+        user_info["waiting_for"] = None
+        storage.put_user(user_id, user_info)
         await update.message.reply_text(
             f"Raqam saqlandi: {phone}\n\nEndi guruhga a'zo bo'ling!",
             reply_markup=ReplyKeyboardRemove(),
@@ -872,45 +1195,276 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Rasmli xabarlar uchun (broadcast uchun)
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
-    waiting_for = user_data[user_id].get("waiting_for")
+    user_info = storage.get_user(user_id) or {}
+    waiting_for = user_info.get("waiting_for")
     
     if waiting_for == "broadcast" and user_id == ADMIN_ID:
         photo = update.message.photo[-1]
         caption = update.message.caption or ""
-        sent_count = 0
-        failed_count = 0
-        for uid in user_data.keys():
-            if uid == user_id:
-                continue
-            try:
-                await context.bot.send_photo(chat_id=uid, photo=photo.file_id, caption=caption, parse_mode='Markdown')
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Foydalanuvchiga rasm yuborishda xato {uid}: {e}")
-                failed_count += 1
+        user_info["waiting_for"] = None
+        storage.put_user(user_id, user_info)
         
-        user_data[user_id]["waiting_for"] = None
-        save_data(user_data, USER_DATA_FILE)
-        
-        await update.message.reply_text(f"Rasmli xabar {sent_count} o'quvchiga yuborildi. Muvaffaqiyatsiz: {failed_count}")
+        recipients = [uid for uid in storage.user_ids(active_only=True) if uid != user_id]
+        await broadcaster.start(context.application, {"photo": photo.file_id, "caption": caption}, recipients, user_id)
         await show_main_menu(update, context, user_id)
         return
 
-# Asosiy funksiya
-def main():
-    logger.info("Bot ishga tushirildi.")
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
+# Savollar, kurslar va maktablar fayllari o'zgarganini tekshirish. O'zgargan fayl fon oqimida
+# o'qiladi, tekshiriladi va shundan keyingina indeks va menyular bilan birga almashtiriladi.
+# Xato bo'lsa eski versiya ishlashda davom etadi.
+async def reload_data_files(context: ContextTypes.DEFAULT_TYPE):
+    global courses, questions_pool, schools
+    for filename in data_watcher.changed():
+        try:
+            data, version = await asyncio.to_thread(read_json, filename)
+            DATA_VALIDATORS[filename](data)
+        except Exception as e:
+            logger.error(f"Faylni qayta yuklashda xato '{filename}', eski versiya qoldi: {e}")
+            continue
+        if version == data_versions.get(filename):
+            continue
         
-    application = Application.builder().token(BOT_TOKEN).build()
+        if filename == QUESTIONS_FILE:
+            changed = question_index.update(data, version)
+            render_cache.set_questions(data, version)
+            questions_pool = data
+            logger.info(f"Savollar bazasi yangilandi (versiya {version}): {changed} ta savol o'zgardi.")
+        elif filename == COURSES_FILE:
+            courses = data
+            render_cache.set_courses(data, version)
+            logger.info(f"Kurslar yangilandi (versiya {version}).")
+        elif filename == SCHOOLS_FILE:
+            schools = data
+            render_cache.set_schools(data, version)
+            logger.info(f"Maktablar yangilandi (versiya {version}).")
+        data_versions[filename] = version
+
+# O'zgargan yozuvlarni davriy ravishda fon yozuvchiga topshirish
+async def flush_storage(context: ContextTypes.DEFAULT_TYPE):
+    storage.flush_dirty()
+    snapshot = aggregates.dump()
+    if snapshot is not None:
+        await asyncio.to_thread(aggregates.save, snapshot)
+
+# Yozish kuchayishi (mantiqiy o'zgarishlar / fizik yozuvlar) statistikasi
+async def log_storage_stats(context: ContextTypes.DEFAULT_TYPE):
+    stats = storage.write_stats()
+    logger.info(
+        f"Saqlash: {stats['mutations']} o'zgarish, {stats['writes']} fizik yozuv, "
+        f"nisbat {stats['ratio']:.2f}, kutilmoqda {stats['pending']}, navbatda {stats['queued']}, "
+        f"qoldirilgan {stats['deferred']}"
+    )
+
+# Guruhga qo'shilish/chiqish (chat_member) va botning o'z holati (my_chat_member) - a'zolik keshi yangilanadi.
+# Guruhdan chiqqan o'quvchining belgisi darhol olib tashlanadi.
+async def track_group_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_member = update.chat_member or update.my_chat_member
+    if group_membership.on_member_update(chat_member, context.bot.id) and update.chat_member:
+        member = chat_member.new_chat_member
+        if member.status not in MEMBER_STATUSES:
+            # O'zi chiqib ketgan bo'lsa, bu yangilanish allaqachon uning qulfi ostida bajarilmoqda
+            if update.effective_user and update.effective_user.id == member.user.id:
+                record_membership(str(member.user.id), member.status)
+            else:
+                async with user_lock(member.user.id):
+                    record_membership(str(member.user.id), member.status)
+
+# Qayta tekshirish natijasini yozish: a'zo emas bo'lsa test uchun guruhga qayta qo'shilishi kerak.
+# Foydalanuvchi qulfi (user_lock) ostida chaqiriladi.
+def record_membership(user_id, status):
+    user_info = storage.get_user(user_id)
+    if user_info is None:
+        return
+    is_member = status in MEMBER_STATUSES
+    if user_info.get("group_joined") and not is_member:
+        logger.info(f"Foydalanuvchi {user_id}: guruhda emas ({status}), a'zolik belgisi olib tashlandi.")
+    user_info["group_joined"] = is_member
+    user_info["group_status"] = str(status)
+    user_info["group_checked_at"] = datetime.now().isoformat(timespec='seconds')
+    storage.put_user(user_id, user_info)
+
+# A'zolikni qayta tekshirish holati: ro'yxatdagi joriy o'rin va bir ishga tushishdagi o'quvchilar soni
+membership_check = {"cursor": None, "batch": None}
+
+# A'zolikni ommaviy qayta tekshirish. Har MEMBERSHIP_CHECK_INTERVAL soniyada foydalanuvchilar
+# ro'yxatidan navbatdagi sahifa olinadi; sahifa kattaligi shunday tanlanadiki, butun ro'yxat
+# MEMBERSHIP_CHECK_PERIOD ichida bir marta aylanib chiqiladi. So'rovlar MEMBERSHIP_CHECK_RATE
+# tezligida yuboriladi; RetryAfter yoki tarmoq xatosida sahifa keyingi safar qaytadan olinadi
+# (tekshirilganlari group_checked_at bo'yicha o'tkazib yuboriladi).
+async def reverify_membership(context: ContextTypes.DEFAULT_TYPE):
+    if membership_check["batch"] is None or membership_check["cursor"] is None:
+        total, _ = storage.count_users()
+        membership_check["batch"] = max(1, math.ceil(total * MEMBERSHIP_CHECK_INTERVAL / MEMBERSHIP_CHECK_PERIOD))
+
+    users, _, next_cursor = storage.page_users(after=membership_check["cursor"], limit=membership_check["batch"])
+    fresh_after = datetime.now() - timedelta(seconds=MEMBERSHIP_CHECK_PERIOD / 2)
+    checked = revoked = 0
+    for user_id, user in users:
+        if not user.get("group_joined"):
+            continue
+        checked_at = user.get("group_checked_at")
+        if checked_at and datetime.fromisoformat(checked_at) > fresh_after:
+            continue
+        try:
+            status = await group_membership.get_status(context.bot, user_id, fresh=True)
+        except RetryAfter as e:
+            logger.warning(f"A'zolikni tekshirish to'xtatildi: Telegram {retry_after_seconds(e):.0f} s kutishni so'radi.")
+            return
+        except BadRequest as e:
+            # Guruhda hech qachon bo'lmagan foydalanuvchi uchun Telegram "user not found" qaytaradi.
+            # Guruh bilan bog'liq xato ("chat not found" - MY_GROUP noto'g'ri yoki bot guruhda emas)
+            # hammaga tegishli: belgilar olib tashlanmaydi, tekshiruv to'xtatiladi.
+            if not is_participant_error(e):
+                logger.error(f"A'zolikni tekshirish to'xtatildi (foydalanuvchi {user_id}): {e}")
+                return
+            status = "left"
+        except TelegramError as e:
+            logger.error(f"A'zolikni tekshirish to'xtatildi: {e}")
+            return
+        async with user_lock(user_id):
+            record_membership(user_id, status)
+        checked += 1
+        revoked += status not in MEMBER_STATUSES
+        await asyncio.sleep(1 / MEMBERSHIP_CHECK_RATE)
+
+    membership_check["cursor"] = next_cursor
+    if checked:
+        logger.info(f"A'zolik qayta tekshirildi: {checked} o'quvchi, {revoked} tasi guruhda emas.")
+
+# Botning guruhdagi admin holatini keshi muddati tugashidan oldin fonda yangilash
+async def refresh_group_status(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await group_membership.refresh_bot_status(context.bot)
+    except TelegramError as e:
+        logger.error(f"Botning guruhdagi holatini yangilashda xato: {e}")
+
+async def main_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_main_menu(update, context, str(update.callback_query.from_user.id))
+
+# Callback marshrutlari: aniq qiymatlar va parametrli prefikslar
+callback_router = CallbackRouter(is_admin=lambda user_id: user_id == ADMIN_ID, on_dispatch=observe_route)
+callback_router.prefix('class_', handle_class_selection)
+callback_router.prefix('school_', handle_school_selection)
+callback_router.exact('enter_phone', handle_phone_selection)
+callback_router.exact('share_phone', handle_phone_selection)
+callback_router.exact('confirm_group', handle_group_confirmation)
+callback_router.exact('teacher_info', show_teacher_info)
+callback_router.exact('courses_list', show_courses_info)
+callback_router.prefix('course_info_', show_course_details)
+callback_router.exact('show_results', show_results)
+callback_router.exact('start_test', start_test)
+callback_router.prefix('answer_', handle_answer)
+callback_router.exact('main_menu', main_menu_callback)
+callback_router.exact('admin_users', admin_show_users, admin_only=True)
+callback_router.exact('admin_results', admin_show_results, admin_only=True)
+callback_router.prefix('apage_', admin_page_callback, admin_only=True)
+callback_router.prefix('afilter_', admin_choose_filter, admin_only=True)
+callback_router.exact('admin_stats', admin_show_stats, admin_only=True)
+callback_router.exact('admin_broadcast', admin_broadcast_start, admin_only=True)
+callback_router.exact('admin_cancel_broadcast', admin_cancel_broadcast, admin_only=True)
+
+# Ishga tushganda to'xtab qolgan tarqatmalarni davom ettirish
+async def post_init(application: Application):
+    global metrics_server
+    with startup_timer.phase("post_init"):
+        # Bir nechta jarayonda tarqatmalarni faqat admin yangilanishlari tushadigan worker davom ettiradi
+        if WORKER_COUNT == 1 or shard_for(ADMIN_ID, WORKER_COUNT) == WORKER_INDEX:
+            broadcaster.resume_pending(application)
+        # Bir nechta jarayonda tarixni faqat worker 0 sanaydi, qolganlari o'z testlaridan boshlaydi
+        if not aggregates_loaded and WORKER_INDEX == 0:
+            with startup_timer.phase("statistikani qayta qurish"):
+                await rebuild_aggregates()
+        with startup_timer.phase("guruhni aniqlash"):
+            await group_membership.resolve(application.bot)
+        if METRICS_PORT:
+            port = METRICS_PORT + WORKER_INDEX
+            try:
+                metrics_server = await start_http_server(METRICS_HOST, port)
+            except OSError as e:
+                logger.error(f"Metrics serverini ishga tushirib bo'lmadi ({METRICS_HOST}:{port}): {e}")
+    logger.info(startup_timer.report())
+
+async def post_shutdown(application: Application):
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+
+# To'xtashda navbatdagi barcha yozuvlar diskka tushiriladi, so'ng saqlash yopiladi
+def close_storage():
+    storage.flush()
+    storage.close()
+    snapshot = aggregates.dump()
+    if snapshot is not None:
+        aggregates.save(snapshot)
+    logger.info(f"Saqlash statistikasi: {storage.write_stats()}")
+
+# Application ni qurish: ma'lumotlar (init_data), handlerlar va davriy vazifalar. Webhook
+# rejimida Updater kerak emas - yangilanishlarni webhook server update_queue ga qo'yadi.
+def build_application(request=None):
+    init_data()
+    with startup_timer.phase("Application qurish"):
+        application = _build_application(request)
+    return application
+
+def _build_application(request):
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_BASE_URL.rstrip('/')}/bot")
+        .base_file_url(f"{TELEGRAM_BASE_URL.rstrip('/')}/file/bot")
+        .request(request or InstrumentedRequest(connection_pool_size=HTTP_POOL_SIZE))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    # Turli foydalanuvchilar parallel, bitta foydalanuvchining yangilanishlari navbat bilan
+    builder = builder.concurrent_updates(update_processor)
+    if BOT_MODE == "webhook":
+        builder = builder.updater(None)
+    application = builder.build()
     
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("export", admin_export))
+    application.add_handler(CommandHandler("stats", admin_stats))
+    application.add_handler(CommandHandler("analytics", admin_analytics))
     application.add_handler(CallbackQueryHandler(handle_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     application.add_handler(MessageHandler(filters.CONTACT, handle_contact))
+    application.add_handler(ChatMemberHandler(track_group_member, ChatMemberHandler.ANY_CHAT_MEMBER))
+    # Barcha handlerlar vaqt o'lchagich bilan o'raladi
+    instrument_handlers(application)
+    
+    application.job_queue.run_repeating(flush_storage, interval=FLUSH_INTERVAL, first=FLUSH_INTERVAL, name="flush_storage")
+    application.job_queue.run_repeating(reload_data_files, interval=RELOAD_INTERVAL, first=RELOAD_INTERVAL, name="reload_data_files")
+    if group_membership.configured:
+        application.job_queue.run_repeating(
+            refresh_group_status, interval=GROUP_STATUS_TTL / 2, first=GROUP_STATUS_TTL / 2, name="refresh_group_status"
+        )
+        # Bir nechta jarayonda qayta tekshirish faqat bitta workerda (barcha o'quvchilar umumiy bazada)
+        if WORKER_INDEX == 0:
+            application.job_queue.run_repeating(
+                reverify_membership, interval=MEMBERSHIP_CHECK_INTERVAL, first=MEMBERSHIP_CHECK_INTERVAL, name="reverify_membership"
+            )
+    application.job_queue.run_repeating(log_storage_stats, interval=STORAGE_STATS_INTERVAL, first=STORAGE_STATS_INTERVAL, name="storage_stats")
+    return application
+
+# Asosiy funksiya
+def main():
+    logger.info(f"Bot ishga tushirildi ({BOT_MODE} rejimi).")
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+        
+    application = build_application()
     
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        from webhook import WebhookServer, run_webhook
+        server = WebhookServer(application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+        asyncio.run(run_webhook(application, server, WEBHOOK_URL, allowed_updates=Update.ALL_TYPES))
+    else:
+        # chat_member yangilanishlari faqat so'ralganda keladi
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+    close_storage()
 
 if __name__ == "__main__":
     main()
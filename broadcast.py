@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+# Yetkazish natijalari
+SENT = "ok"
+BLOCKED = "blocked"        # Forbidden: foydalanuvchi botni bloklagan yoki akkaunti o'chirilgan
+NOT_FOUND = "not_found"    # Chat topilmadi
+RETRY_AFTER = "retry_after"
+TRANSIENT = "transient"    # Tarmoq xatolari, qayta urinib ko'riladi
+FAILED = "fail"
+
+UNREACHABLE = (BLOCKED, NOT_FOUND)
+TRANSIENT_RETRIES = 3
+
+
+# Yuborish xatosini natija turiga ajratish. BadRequest NetworkError'ning vorisi, shuning uchun oldin tekshiriladi.
+def classify_error(error):
+    if isinstance(error, RetryAfter):
+        return RETRY_AFTER
+    if isinstance(error, Forbidden):
+        return BLOCKED
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        if "chat not found" in message or "user not found" in message:
+            return NOT_FOUND
+        return FAILED
+    if isinstance(error, NetworkError):
+        return TRANSIENT
+    return FAILED
+
+
+# RetryAfter.retry_after kutubxona versiyasiga qarab soniya yoki timedelta bo'ladi
+def retry_after_seconds(error):
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+# Token-bucket tezlik cheklovchisi: soniyasiga `rate` ta so'rov, `capacity` tagacha to'plangan zaxira.
+# RetryAfter kelganda pause() barcha yuboruvchilarni ko'rsatilgan vaqtgacha to'xtatadi.
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Bitta tarqatma ishi. Holat ikki faylda saqlanadi:
+#   <id>.json  ish ma'lumotlari (xabar, qabul qiluvchilar, admin xabari)
+#   <id>.log   har bir qabul qiluvchi uchun natija qatori: "<user_id> <natija>"
+# Jarayon to'xtab qolsa, ish .log dagi qabul qiluvchilarni o'tkazib yuborib davom ettiriladi.
+class BroadcastJob:
+    def __init__(self, directory, job_id, message, recipients, admin_chat_id, status_message_id=None):
+        self.job_id = job_id
+        self.message = message
+        self.recipients = recipients
+        self.admin_chat_id = admin_chat_id
+        self.status_message_id = status_message_id
+        self.meta_filename = os.path.join(directory, f"{job_id}.json")
+        self.log_filename = os.path.join(directory, f"{job_id}.log")
+        self.sent = 0
+        self.unreachable = 0
+        self.failed = 0
+        self.done = set()
+        self._log = None
+
+    @classmethod
+    def load(cls, meta_filename):
+        with open(meta_filename, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        job = cls(
+            os.path.dirname(meta_filename), meta['job_id'], meta['message'], meta['recipients'],
+            meta['admin_chat_id'], meta.get('status_message_id')
+        )
+        if os.path.exists(job.log_filename):
+            with open(job.log_filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2:
+                        job._count(parts[0], parts[1])
+        return job
+
+    def save_meta(self):
+        atomic_write_json(self.meta_filename, {
+            "job_id": self.job_id,
+            "message": self.message,
+            "recipients": self.recipients,
+            "admin_chat_id": self.admin_chat_id,
+            "status_message_id": self.status_message_id
+        })
+
+    @property
+    def remaining(self):
+        return len(self.recipients) - len(self.done)
+
+    def _count(self, user_id, outcome):
+        self.done.add(user_id)
+        if outcome == SENT:
+            self.sent += 1
+        elif outcome in UNREACHABLE:
+            self.unreachable += 1
+        else:
+            self.failed += 1
+
+    def record(self, user_id, outcome):
+        if self._log is None:
+            self._log = open(self.log_filename, 'a', encoding='utf-8')
+        self._log.write(f"{user_id} {outcome}\n")
+        self._count(user_id, outcome)
+
+    def checkpoint(self):
+        if self._log is not None:
+            self._log.flush()
+
+    def finish(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        for filename in (self.meta_filename, self.log_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+# Tarqatmalarni boshqaruvchi: cheklangan sonli parallel yuboruvchi, umumiy tezlik cheklovchisi,
+# adminga jonli hisobot va to'xtab qolgan ishlarni qayta ishga tushirish.
+# Botni bloklagan yoki topilmagan foydalanuvchilar `await on_unreachable(user_id, natija)` orqali
+# bot.py ga xabar qilinadi, u ularni faolsiz deb belgilaydi va keyingi tarqatmalar ularni o'tkazib yuboradi.
+class BroadcastManager:
+    def __init__(self, directory, concurrency=8, rate=25, progress_interval=3, on_unreachable=None):
+        self.directory = directory
+        self.on_unreachable = on_unreachable
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.bucket = TokenBucket(rate)
+        self.jobs = {}
+
+    # Navbatda kutayotgan qabul qiluvchilar soni (barcha ishlar bo'yicha)
+    @property
+    def queue_depth(self):
+        return sum(job.remaining for job in self.jobs.values())
+
+    async def start(self, application, message, recipients, admin_chat_id):
+        os.makedirs(self.directory, exist_ok=True)
+        job_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        job = BroadcastJob(self.directory, job_id, message, recipients, admin_chat_id)
+        status = await application.bot.send_message(admin_chat_id, self._progress_text(job))
+        job.status_message_id = status.message_id
+        await asyncio.to_thread(job.save_meta)
+        self.jobs[job_id] = job
+        application.create_task(self._run(application, job), name=f"broadcast-{job_id}")
+        return job
+
+    # Bot qayta ishga tushganda tugallanmagan ishlarni davom ettirish
+    def resume_pending(self, application):
+        if not os.path.isdir(self.directory):
+            return
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                job = BroadcastJob.load(os.path.join(self.directory, filename))
+            except Exception as e:
+                logger.error(f"Tarqatma holatini o'qishda xato '{filename}': {e}")
+                continue
+            logger.info(f"Tarqatma {job.job_id} davom ettirilmoqda: {job.remaining} ta qabul qiluvchi qoldi.")
+            self.jobs[job.job_id] = job
+            application.create_task(self._run(application, job), name=f"broadcast-{job.job_id}")
+
+    async def _send(self, bot, user_id, message):
+        if message.get("photo"):
+            await bot.send_photo(chat_id=user_id, photo=message["photo"], caption=message.get("caption", ""), parse_mode='Markdown')
+        else:
+            await bot.send_message(chat_id=user_id, text=message["text"], parse_mode='Markdown')
+
+    async def _deliver(self, bot, job, user_id):
+        attempts = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self._send(bot, user_id, job.message)
+                return SENT
+            except Exception as e:
+                outcome = classify_error(e)
+                if outcome == RETRY_AFTER:
+                    delay = retry_after_seconds(e)
+                    logger.warning(f"Tarqatma {job.job_id}: RetryAfter {delay} soniya.")
+                    self.bucket.pause(delay)
+                    continue
+                if outcome == TRANSIENT and attempts < TRANSIENT_RETRIES:
+                    attempts += 1
+                    await asyncio.sleep(2 ** attempts)
+                    continue
+                if outcome in UNREACHABLE:
+                    logger.info(f"Foydalanuvchi {user_id} yetib bo'lmaydi ({outcome}): {e}")
+                else:
+                    logger.error(f"Foydalanuvchiga xabar yuborishda xato {user_id}: {e}")
+                return outcome if outcome != TRANSIENT else FAILED
+
+    async def _worker(self, bot, job, recipients):
+        for user_id in recipients:
+            outcome = await self._deliver(bot, job, user_id)
+            job.record(user_id, outcome)
+            if outcome in UNREACHABLE and self.on_unreachable:
+                await self.on_unreachable(user_id, outcome)
+
+    async def _run(self, application, job):
+        bot = application.bot
+        pending = iter([uid for uid in job.recipients if uid not in job.done])
+        reporter = asyncio.create_task(self._report_progress(bot, job))
+        try:
+            # Barcha yuboruvchilar bitta iteratordan navbatdagi qabul qiluvchini oladi
+            await asyncio.gather(*(self._worker(bot, job, pending) for _ in range(self.concurrency)))
+        finally:
+            reporter.cancel()
+            job.checkpoint()
+        await self._update_status(bot, job, final=True)
+        await asyncio.to_thread(job.finish)
+        self.jobs.pop(job.job_id, None)
+        logger.info(
+            f"Tarqatma {job.job_id} yakunlandi: {job.sent} yuborildi, {job.unreachable} yetib bo'lmaydi, "
+            f"{job.failed} muvaffaqiyatsiz."
+        )
+
+    async def _report_progress(self, bot, job):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            job.checkpoint()
+            await self._update_status(bot, job)
+
+    def _progress_text(self, job, final=False):
+        processed = len(job.done)
+        counts = (
+            f"Yuborildi: {job.sent}, botni bloklagan/topilmadi: {job.unreachable}, "
+            f"muvaffaqiyatsiz: {job.failed}"
+        )
+        if final:
+            return f"✅ Tarqatma yakunlandi ({len(job.recipients)} o'quvchi).\n{counts}"
+        return f"📢 Xabar yuborilmoqda: {processed}/{len(job.recipients)}\n{counts}"
+
+    async def _update_status(self, bot, job, final=False):
+        if not job.status_message_id:
+            return
+        try:
+            await bot.edit_message_text(
+                chat_id=job.admin_chat_id, message_id=job.status_message_id, text=self._progress_text(job, final)
+            )
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.error(f"Tarqatma holatini yangilashda xato: {e}")
+        except Exception as e:
+            logger.error(f"Tarqatma holatini yangilashda xato: {e}")
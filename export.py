@@ -0,0 +1,84 @@
+import csv
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX ixtiyoriy, openpyxl o'rnatilmagan bo'lsa faqat CSV
+    Workbook = None
+
+EXPORT_COLUMNS = [
+    "user_id", "first_name", "last_name", "username", "class", "school", "phone", "group_joined", "active",
+    "subject", "score", "total", "percentage", "date"
+]
+
+
+def xlsx_available():
+    return Workbook is not None
+
+
+# Har bir natija uchun bitta qator; natijasi yo'q o'quvchi natija ustunlari bo'sh bitta qator bo'lib chiqadi.
+# Qatorlar generator orqali bittadan beriladi, butun jadval xotirada yig'ilmaydi.
+def export_rows(storage):
+    for user_id, user, user_results in storage.iter_export():
+        profile = [
+            user_id, user.get("first_name") or "", user.get("last_name") or "", user.get("username") or "",
+            user.get("class") or "", user.get("school") or "", user.get("phone") or "",
+            int(bool(user.get("group_joined"))), int(user.get("active", True))
+        ]
+        if not user_results:
+            yield profile + ["", "", "", "", ""]
+            continue
+        for result in user_results:
+            total = result.get("total") or 0
+            percentage = round(result.get("score", 0) / total * 100, 1) if total else 0
+            yield profile + [
+                result.get("subject", ""), result.get("score", 0), total, percentage,
+                (result.get("date") or "")[:19].replace("T", " ")
+            ]
+
+
+# CSV Excel'da to'g'ri ochilishi uchun BOM bilan (utf-8-sig) yoziladi
+def write_csv(rows, filename):
+    count = 0
+    with open(filename, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+# write_only rejimida openpyxl qatorlarni xotirada ushlamay faylga oqizadi
+def write_xlsx(rows, filename):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Natijalar")
+    sheet.append(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(filename)
+    return count
+
+
+# Eksport faylini vaqtinchalik papkada yaratish. Fon oqimida (asyncio.to_thread) chaqiriladi.
+# Qaytadi: (fayl yo'li, qatorlar soni); faylni yuborgandan keyin chaqiruvchi o'chiradi.
+def build_export(storage, fmt="csv"):
+    if fmt == "xlsx" and Workbook is None:
+        raise RuntimeError("XLSX uchun openpyxl o'rnatilmagan")
+    fd, filename = tempfile.mkstemp(prefix=f"export_{datetime.now():%Y%m%d_%H%M%S}_", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        writer = write_xlsx if fmt == "xlsx" else write_csv
+        count = writer(export_rows(storage), filename)
+    except Exception:
+        os.remove(filename)
+        raise
+    logger.info(f"Eksport tayyor: {count} qator -> '{filename}'")
+    return filename, count
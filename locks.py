@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import weakref
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+# Foydalanuvchi bo'yicha asyncio qulflari. Qulflar WeakValueDictionary da turadi: hech bir
+# yangilanish ushlab turmagan qulf avtomatik o'chadi, shuning uchun lug'at faqat hozir
+# ishlanayotgan foydalanuvchilar soniga teng bo'ladi.
+class UserLocks:
+    def __init__(self):
+        self._locks = weakref.WeakValueDictionary()
+
+    def get(self, user_id):
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[user_id] = lock
+        return lock
+
+    def __len__(self):
+        return len(self._locks)
+
+
+# Yangilanishlar parallel qayta ishlanadi (eng ko'pi `max_concurrent_updates` ta), lekin bitta
+# foydalanuvchining yangilanishlari uning qulfi ostida kelgan tartibda birin-ketin bajariladi:
+# handlerlar test holatini await nuqtalari orasida o'qib-yozsa ham bir-biriga aralashmaydi.
+# Avval foydalanuvchi qulfi, keyin umumiy semafor olinadi: qulfni kutayotgan yangilanishlar
+# semafor o'rnini band qilmaydi, shuning uchun tugmani tez-tez bosayotgan bitta foydalanuvchi
+# boshqalarni to'xtatib qo'ya olmaydi. Foydalanuvchisi yo'q yangilanishlar (masalan, kanal
+# postlari) qulfsiz bajariladi.
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates=256):
+        super().__init__(max_concurrent_updates)
+        self.locks = UserLocks()
+
+    # BaseUpdateProcessor.process_update semaforni oladi va do_process_update ni chaqiradi
+    async def process_update(self, update, coroutine):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            await super().process_update(update, coroutine)
+            return
+        async with self.locks.get(user.id):
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
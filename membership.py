@@ -0,0 +1,146 @@
+import collections
+import logging
+import time
+
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+ADMIN_STATUSES = ('administrator', 'creator')
+
+# get_chat_member BadRequest xatosi faqat shu foydalanuvchiga tegishli (u guruhda hech qachon
+# bo'lmagan) bo'lsa, uning holati 'left' deb olinadi. Boshqa BadRequest ("chat not found",
+# huquq yetmasligi) guruhning o'ziga tegishli va barcha foydalanuvchilarga bir xil qaytadi.
+PARTICIPANT_ERRORS = ("user not found", "participant_id_invalid")
+
+
+def is_participant_error(error):
+    message = str(error).lower()
+    return any(text in message for text in PARTICIPANT_ERRORS)
+
+
+# MY_GROUP qiymatidan (t.me/nom, @nom, -100..., nom) guruh ID'si va havolasini olish
+def resolve_group(my_group):
+    # Guruh linkini to'g'ri formatlash (t.me/Zarafshan_Matematika uchun)
+    if 'Zarafshan_Matematika' in my_group:
+        return "@Zarafshan_Matematika", "https://t.me/Zarafshan_Matematika"
+    if my_group.startswith('t.me/'):
+        group_username = my_group.split('/')[-1]
+        return f"@{group_username}", f"https://t.me/{group_username}"
+    if my_group.startswith('@'):
+        return my_group, f"https://t.me/{my_group[1:]}"
+    if my_group.startswith('-'):
+        return my_group, f"https://t.me/c/{my_group[4:]}/1"  # Private guruh uchun
+    return f"@{my_group}", f"https://t.me/{my_group}"
+
+
+# Guruh a'zoligi keshi. Guruh bir marta aniqlanadi (ishga tushganda get_chat bilan raqamli ID
+# olinadi), botning admin holati `bot_status_ttl` soniya saqlanadi va fon vazifasi uni muddati
+# tugashidan oldin yangilaydi, shuning uchun tasdiqlash tugmasi faqat foydalanuvchini tekshiradi.
+#
+# Foydalanuvchilar holati LRU keshda (eng ko'pi `max_users` ta) turadi. API dan olingan faqat
+# ijobiy natija `member_ttl` soniya saqlanadi: hali a'zo bo'lmagan o'quvchi guruhga qo'shilib
+# qayta bossa, javob keshdan emas, Telegramdan olinadi. chat_member yangilanishlari (bot guruhda
+# admin bo'lsa keladi) keshni darhol yangilaydi: qo'shilgan yoziladi, chiqib ketgan o'chiriladi.
+class MembershipCache:
+    def __init__(self, my_group, bot_status_ttl=600, member_ttl=3600, max_users=10000):
+        self.chat_ref, self.link = resolve_group(my_group) if my_group else (None, None)
+        self.chat_id = self.chat_ref
+        self.bot_status_ttl = bot_status_ttl
+        self.member_ttl = member_ttl
+        self.max_users = max_users
+        self.bot_status = None
+        self._bot_status_at = 0.0
+        self._members = collections.OrderedDict()
+        self.hits = 0
+        self.api_calls = 0
+
+    @property
+    def configured(self):
+        return self.chat_ref is not None
+
+    # @username ni raqamli ID ga aylantirish (chat_member yangilanishlari raqamli ID bilan keladi)
+    async def resolve(self, bot):
+        if not self.configured:
+            return
+        try:
+            chat = await bot.get_chat(self.chat_ref)
+            self.chat_id = chat.id
+            logger.info(f"Guruh aniqlandi: {self.chat_ref} -> {self.chat_id}")
+        except TelegramError as e:
+            logger.error(f"Guruhni aniqlab bo'lmadi '{self.chat_ref}': {e}")
+        try:
+            await self.refresh_bot_status(bot)
+        except TelegramError as e:
+            logger.error(f"Botning guruhdagi holatini tekshirishda xato: {e}")
+
+    async def refresh_bot_status(self, bot):
+        self.api_calls += 1
+        member = await bot.get_chat_member(chat_id=self.chat_id, user_id=bot.id)
+        self.bot_status = member.status
+        self._bot_status_at = time.monotonic()
+        return self.bot_status
+
+    # Botning guruhdagi holati (keshdan, muddati o'tgan bo'lsa Telegramdan)
+    async def get_bot_status(self, bot):
+        if self.bot_status is not None and time.monotonic() - self._bot_status_at < self.bot_status_ttl:
+            return self.bot_status
+        return await self.refresh_bot_status(bot)
+
+    def _cached(self, user_id):
+        entry = self._members.get(user_id)
+        if entry is None:
+            return None
+        status, checked_at = entry
+        if time.monotonic() - checked_at >= self.member_ttl:
+            del self._members[user_id]
+            return None
+        self._members.move_to_end(user_id)
+        return status
+
+    def record(self, user_id, status):
+        self._members[user_id] = (status, time.monotonic())
+        self._members.move_to_end(user_id)
+        if len(self._members) > self.max_users:
+            self._members.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self._members.pop(str(user_id), None)
+
+    # Foydalanuvchining guruhdagi holati: 'member', 'left', ... fresh=True bo'lsa (qayta tekshirish)
+    # keshdagi ijobiy javob ishlatilmaydi, holat Telegramdan so'raladi va kesh yangilanadi.
+    async def get_status(self, bot, user_id, fresh=False):
+        user_id = str(user_id)
+        status = None if fresh else self._cached(user_id)
+        if status is not None:
+            self.hits += 1
+            return status
+        self.api_calls += 1
+        member = await bot.get_chat_member(chat_id=self.chat_id, user_id=user_id)
+        if member.status in MEMBER_STATUSES:
+            self.record(user_id, member.status)
+        else:
+            self.invalidate(user_id)
+        return member.status
+
+    async def is_member(self, bot, user_id):
+        return await self.get_status(bot, user_id) in MEMBER_STATUSES
+
+    # chat_member / my_chat_member yangilanishi (ChatMemberUpdated). Boshqa guruhlarniki e'tiborsiz.
+    def on_member_update(self, chat_member, bot_id):
+        if not self.configured or str(chat_member.chat.id) not in (str(self.chat_id), self.chat_ref):
+            return False
+        member = chat_member.new_chat_member
+        if member.user.id == bot_id:
+            self.bot_status = member.status
+            self._bot_status_at = time.monotonic()
+            logger.info(f"Botning guruhdagi holati o'zgardi: {member.status}")
+        elif member.status in MEMBER_STATUSES:
+            self.record(str(member.user.id), member.status)
+        else:
+            self.invalidate(member.user.id)
+        return True
+
+    def stats(self):
+        return {"cached": len(self._members), "hits": self.hits, "api_calls": self.api_calls}
@@ -0,0 +1,254 @@
+import asyncio
+import bisect
+import contextlib
+import functools
+import logging
+import threading
+import time
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# Hisoblagich (faqat o'sadi), yorliqlar qiymati bo'yicha
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+# Gistogramma: har bir kuzatuv bisect bilan bitta katakka tushadi, jami yig'indi bilan birga
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', le))} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+# Qiymati so'rov paytida funksiyadan olinadigan o'lchov (navbat uzunligi, faol testlar, ...)
+class Gauge:
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            lines.append(f"{self.name} {_format_value(self.function())}")
+        except Exception as e:
+            logger.error(f"'{self.name}' o'lchovini hisoblashda xato: {e}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function):
+        return self.register(Gauge(name, documentation, function))
+
+    # Prometheus matn formati (text/plain; version=0.0.4)
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+handler_latency = REGISTRY.histogram("bot_handler_seconds", "Handler bajarilish vaqti", ["handler"])
+handler_errors = REGISTRY.counter("bot_handler_errors_total", "Xato bilan tugagan handlerlar", ["handler"])
+route_latency = REGISTRY.histogram("bot_callback_route_seconds", "Callback marshruti handler vaqti", ["route"])
+api_latency = REGISTRY.histogram("bot_api_request_seconds", "Bot API so'rovlari vaqti", ["method"])
+api_requests = REGISTRY.counter("bot_api_requests_total", "Bot API so'rovlari", ["method", "code"])
+storage_write_latency = REGISTRY.histogram(
+    "bot_storage_write_seconds", "Fon yozuvchi partiyasini yozish vaqti", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+storage_write_bytes = REGISTRY.counter("bot_storage_write_bytes_total", "Diskka yozilgan baytlar")
+storage_write_records = REGISTRY.counter("bot_storage_write_records_total", "Diskka yozilgan yozuvlar")
+
+
+# Handler atrofida vaqt o'lchagich (handlerning o'zi o'zgarmaydi)
+def instrument(name, callback):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+# Application ga qo'shilgan barcha handlerlarni o'rash (main() dagi add_handler lardan keyin chaqiriladi)
+def instrument_handlers(application):
+    count = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if not getattr(handler.callback, "__wrapped__", None):
+                handler.callback = instrument(handler.callback.__name__, handler.callback)
+                count += 1
+    return count
+
+
+# CallbackRouter.on_dispatch uchun
+def observe_route(name, lookup_seconds, handler_seconds):
+    route_latency.observe(handler_seconds, name)
+
+
+# BackgroundWriter.observer uchun (fon oqimidan chaqiriladi)
+def observe_write(seconds, records, written_bytes):
+    storage_write_latency.observe(seconds)
+    storage_write_records.inc(amount=records)
+    storage_write_bytes.inc(amount=written_bytes)
+
+
+# Bot API so'rovlarini o'lchaydigan HTTPXRequest: usul nomi va javob kodi bo'yicha
+class InstrumentedRequest(HTTPXRequest):
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        code = "error"
+        try:
+            code, payload = await super().do_request(url, method, request_data, **kwargs)
+            return code, payload
+        finally:
+            api_latency.observe(time.perf_counter() - started, api_method)
+            api_requests.inc(api_method, str(code))
+
+
+# Ishga tushish bosqichlari vaqti. Bosqich `with timer.phase(nom):` bilan o'lchanadi; ichma-ich
+# bosqichlar (yoki add() bilan qo'shilgan qism bosqichlar) hisobotda surilib ko'rsatiladi va
+# jami vaqtga ikki marta qo'shilmaydi. Faqat bitta oqimdan ishlatiladi.
+class PhaseTimer:
+    def __init__(self):
+        self.phases = []
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        entry = [name, self._depth, 0.0]
+        self.phases.append(entry)
+        self._depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry[2] = time.perf_counter() - started
+            self._depth -= 1
+
+    def add(self, name, seconds):
+        self.phases.append([name, self._depth, seconds])
+
+    @property
+    def total(self):
+        return sum(seconds for _, depth, seconds in self.phases if depth == 0)
+
+    def report(self):
+        lines = [f"Ishga tushish vaqti: {self.total * 1000:.0f} ms"]
+        for name, depth, seconds in self.phases:
+            lines.append(f"  {'  ' * depth}{name}: {seconds * 1000:.1f} ms")
+        return "\n".join(lines)
+
+
+# /metrics uchun minimal HTTP server (faqat GET, ulanish har so'rovdan keyin yopiladi)
+async def _serve(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", REGISTRY.render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics so'rovida xato: {e}")
+    finally:
+        writer.close()
+
+
+async def start_http_server(host, port):
+    server = await asyncio.start_server(_serve, host, port)
+    logger.info(f"Metrics: http://{host}:{port}/metrics")
+    return server
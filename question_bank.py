@@ -0,0 +1,136 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SIZE = 10
+HISTORY_SIZE = 5  # Shuncha eski versiya boshlangan testlar uchun saqlab turiladi
+
+
+# Savol ID'si qaysi oraliqqa tushadi: 1-10 -> 0, 11-20 -> 1, ...
+def bucket_of(question_id):
+    return (question_id - 1) // BUCKET_SIZE
+
+
+# Savollar bazasi indeksi. Har bir fan uchun:
+#   by_id         id -> savol
+#   buckets       ID oralig'i -> savol id'lari
+#   by_section    bo'lim -> savol id'lari
+#   by_difficulty qiyinlik -> savol id'lari
+# Savollar yuklanganda bir marta quriladi. update() qayta yuklangan bazani eskisi bilan
+# solishtiradi va faqat qo'shilgan, o'zgargan yoki o'chirilgan savollarni qayta indekslaydi.
+#
+# Har bir baza `version` bilan belgilanadi. Yangilanishda almashtirilgan yoki o'chirilgan
+# savollarning eski nusxalari tarixda qoladi, shuning uchun eski versiyada boshlangan test
+# get(..., version=eski) orqali o'sha savollarni ko'rishda davom etadi.
+class QuestionIndex:
+    def __init__(self, questions_pool=None, version=None):
+        self.by_id = {}
+        self.buckets = {}
+        self.by_section = {}
+        self.by_difficulty = {}
+        self.version = version
+        self._history = []
+        if questions_pool:
+            self.update(questions_pool, version)
+
+    def _add(self, subject, question):
+        question_id = question['id']
+        self.by_id.setdefault(subject, {})[question_id] = question
+        self.buckets.setdefault(subject, {}).setdefault(bucket_of(question_id), []).append(question_id)
+        self.by_section.setdefault(subject, {}).setdefault(question.get('section'), []).append(question_id)
+        self.by_difficulty.setdefault(subject, {}).setdefault(question.get('difficulty'), []).append(question_id)
+
+    def _remove(self, subject, question):
+        question_id = question['id']
+        del self.by_id[subject][question_id]
+        for groups, key in (
+            (self.buckets[subject], bucket_of(question_id)),
+            (self.by_section[subject], question.get('section')),
+            (self.by_difficulty[subject], question.get('difficulty')),
+        ):
+            groups[key].remove(question_id)
+            if not groups[key]:
+                del groups[key]
+
+    # Indeksni yangi savollar bazasiga moslashtirish. O'zgargan savollar soni qaytariladi.
+    def update(self, questions_pool, version=None):
+        added = 0
+        replaced = {}
+        for subject in list(self.by_id):
+            if subject not in questions_pool:
+                for question_id, question in self.by_id[subject].items():
+                    replaced[(subject, question_id)] = question
+                for index in (self.by_id, self.buckets, self.by_section, self.by_difficulty):
+                    index.pop(subject, None)
+
+        for subject, questions in questions_pool.items():
+            old = self.by_id.get(subject, {})
+            new = {}
+            for question in questions:
+                if 'id' not in question:
+                    logger.warning(f"ID'siz savol o'tkazib yuborildi ({subject}): {question.get('question')}")
+                    continue
+                new[question['id']] = question
+
+            for question_id in old.keys() - new.keys():
+                replaced[(subject, question_id)] = old[question_id]
+                self._remove(subject, old[question_id])
+            for question_id, question in new.items():
+                previous = old.get(question_id)
+                if previous is None:
+                    self._add(subject, question)
+                    added += 1
+                elif previous != question:
+                    replaced[(subject, question_id)] = previous
+                    self._remove(subject, previous)
+                    self._add(subject, question)
+                else:
+                    self.by_id[subject][question_id] = question
+
+        if version != self.version:
+            if self.version is not None:
+                self._history.append((self.version, replaced))
+                del self._history[:-HISTORY_SIZE]
+            self.version = version
+        return added + len(replaced)
+
+    # Savolni olish. `version` berilsa, savol o'sha versiyadagi ko'rinishida qaytariladi:
+    # shu versiyadan keyingi birinchi almashtirishda saqlangan nusxa, aks holda joriysi.
+    def get(self, subject, question_id, version=None):
+        if version is not None and version != self.version:
+            reached = False
+            for old_version, replaced in self._history:
+                reached = reached or old_version == version
+                if reached and (subject, question_id) in replaced:
+                    return replaced[(subject, question_id)]
+        return self.by_id.get(subject, {}).get(question_id)
+
+    def bucket(self, subject, bucket):
+        return self.buckets.get(subject, {}).get(bucket, [])
+
+    def section(self, subject, section):
+        return self.by_section.get(subject, {}).get(section, [])
+
+    def difficulty(self, subject, difficulty):
+        return self.by_difficulty.get(subject, {}).get(difficulty, [])
+
+
+# Savollar faylini tekshirish: fan -> savollar ro'yxati, har bir savolda noyob id,
+# matn, kamida ikkita variant va to'g'ri javob indeksi bo'lishi kerak
+def validate_questions(questions_pool):
+    if not isinstance(questions_pool, dict):
+        raise ValueError("savollar fayli lug'at bo'lishi kerak")
+    for subject, questions in questions_pool.items():
+        if not isinstance(questions, list):
+            raise ValueError(f"'{subject}' fani savollari ro'yxat bo'lishi kerak")
+        seen = set()
+        for question in questions:
+            question_id = question.get('id')
+            if not isinstance(question_id, int) or question_id in seen:
+                raise ValueError(f"'{subject}' fanida noto'g'ri yoki takroriy id: {question_id}")
+            seen.add(question_id)
+            options = question.get('options')
+            if not question.get('question') or not isinstance(options, list) or len(options) < 2:
+                raise ValueError(f"{question_id}-savolda matn yoki variantlar yo'q")
+            if not isinstance(question.get('correct'), int) or not 0 <= question['correct'] < len(options):
+                raise ValueError(f"{question_id}-savolda to'g'ri javob indeksi noto'g'ri")
@@ -0,0 +1,34 @@
+import hashlib
+import json
+
+from snapshot_cache import file_stamp as _stamp, read_cache, write_cache
+
+
+# JSON faylni o'qish. Versiya sifatida mazmunning qisqa sha1 xeshi qaytariladi, shuning uchun
+# fayl o'zgarmagan bo'lsa qayta ishga tushirilgandan keyin ham versiya bir xil qoladi.
+# Fayl o'zgarmagan bo'lsa (mtime va hajm) ma'lumot va versiya ikkilik keshdan olinadi.
+def read_json(filename):
+    cached = read_cache(filename, "json")
+    if cached is not None:
+        return cached
+    with open(filename, 'rb') as f:
+        content = f.read()
+    result = json.loads(content.decode('utf-8')), hashlib.sha1(content).hexdigest()[:12]
+    write_cache(filename, "json", result)
+    return result
+
+
+# Fayllarni mtime bo'yicha kuzatish. changed() oxirgi tekshiruvdan beri o'zgargan fayllarni qaytaradi.
+class FileWatcher:
+    def __init__(self, filenames):
+        self._stamps = {filename: _stamp(filename) for filename in filenames}
+
+    def changed(self):
+        result = []
+        for filename, old_stamp in self._stamps.items():
+            stamp = _stamp(filename)
+            if stamp != old_stamp:
+                self._stamps[filename] = stamp
+                if stamp is not None:
+                    result.append(filename)
+        return result
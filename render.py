@@ -0,0 +1,133 @@
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+NO_INFO = "Malumot kiritilmagan"
+
+
+# Maktablar menyusi (schools.json dan)
+def build_school_keyboard(schools):
+    school_keys = list(schools.get("schools", {}).keys())
+    keyboard_rows = []
+    for i in range(0, len(school_keys), 2):
+        row = school_keys[i:i+2]
+        keyboard_rows.append([InlineKeyboardButton(f"{key} maktab", callback_data=f"school_{key}") for key in row])
+
+    keyboard_rows.append([InlineKeyboardButton("Boshqa maktab", callback_data="school_other")])
+    return InlineKeyboardMarkup(keyboard_rows)
+
+
+# Kurslar menyusi (courses.json dan)
+def build_courses_keyboard(courses):
+    keyboard = [[InlineKeyboardButton(course['name'], callback_data=f"course_info_{key}")] for key, course in courses.items()]
+    return InlineKeyboardMarkup(keyboard + [[InlineKeyboardButton("🏠 Asosiy menyu", callback_data="main_menu")]])
+
+
+# Kurs haqida batafsil ma'lumot (barcha darajalar)
+def render_course_details(course_data):
+    course_text = f"📚 **{course_data['name']}**\n\n"
+    for level, level_data in course_data.get('levels', {}).items():
+        course_text += (
+            f"🎯 **{level.capitalize()} daraja:**\n"
+            f"   🕐 Vaqt: {level_data.get('time', NO_INFO)}\n"
+            f"   👨‍🏫 O'qituvchi: {level_data.get('teacher', NO_INFO)}\n"
+            f"   📍 Manzil: {level_data.get('location', NO_INFO)}\n"
+            f"   💰 Narx: {level_data.get('price', NO_INFO)}\n\n"
+            f"   📚 Kitoblar: {level_data.get('description', NO_INFO)}\n\n"
+        )
+    return course_text
+
+
+# Test yakunidagi tavsiya qilingan kurs bloki
+def render_recommendation(course_data, level):
+    recommended_course = course_data.get("levels", {}).get(level, {})
+    return (
+        f"📚 Sizga tavsiya etilayotgan kurs: *{course_data.get('name', 'Nomalum')}*\n"
+        f"🕐 Vaqti: {recommended_course.get('time', NO_INFO)}\n"
+        f"👨‍🏫 O'qituvchi: {recommended_course.get('teacher', NO_INFO)}\n"
+        f"📍 Manzil: {recommended_course.get('location', NO_INFO)}\n"
+        f"💰 Narxi: {recommended_course.get('price', NO_INFO)}\n\n"
+        f"📚 Kitoblar: {recommended_course.get('description', NO_INFO)}\n\n"
+        f"📞 *Ro'yxatdan o'tish uchun: +998507551023*\n"
+        f"*@Shoxrux_Ibrohimov*"
+    )
+
+
+# Javob variantlari menyusi. Callback: answer_<savol tartib raqami>_<variant>; tartib raqami
+# javobni aynan shu savolga bog'laydi - eski xabardagi yoki ikki marta bosilgan tugma rad etiladi.
+def build_answer_keyboard(question, index):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(option, callback_data=f'answer_{index}_{i}')] for i, option in enumerate(question['options'])
+    ])
+
+
+def render_explanation(question):
+    return (
+        f"❌ **{question['question']}**\n"
+        f"To'g'ri javob: {question['options'][question['correct']]}\n"
+        f"Yechim: {question.get('explanation', 'Yechim topilmadi.')}\n\n"
+    )
+
+
+# Savol: matn, javob variantlari menyusi va noto'g'ri javob uchun yechim bloki
+def render_question(question, index=0):
+    return question['question'], build_answer_keyboard(question, index), render_explanation(question)
+
+
+# Tayyor ko'rinishlar keshi. Menyular, kurs matnlari va savollar fayl yuklanganda yoki qayta
+# yuklanganda bir marta quriladi va fayl versiyasi bilan belgilanadi; handlerlar faqat
+# foydalanuvchiga xos qismlarni (savol raqami, ball) qo'shadi.
+#
+# Savol keshi kalit bo'yicha savol obyektining o'zini ham saqlaydi: savollar bazasining eski
+# versiyasida boshlangan test almashtirilgan savolni so'rasa, u keshdan emas, joyida chiziladi.
+# Javob menyusi savolning testdagi tartib raqamiga bog'liq, shuning uchun u birinchi so'ralganda
+# (savol, raqam) juftligi uchun quriladi va keyingi safar qayta ishlatiladi.
+class RenderCache:
+    def __init__(self):
+        self.versions = {}
+        self.school_keyboard = None
+        self.courses_keyboard = None
+        self.course_details = {}
+        self.recommendations = {}
+        self._questions = {}
+
+    def set_schools(self, schools, version=None):
+        self.school_keyboard = build_school_keyboard(schools)
+        self.versions["schools"] = version
+
+    def set_courses(self, courses, version=None):
+        self.courses_keyboard = build_courses_keyboard(courses)
+        self.course_details = {key: render_course_details(course) for key, course in courses.items()}
+        self.recommendations = {
+            (key, level): render_recommendation(course, level)
+            for key, course in courses.items()
+            for level in list(course.get("levels", {})) + ["boshlang'ich", "o'rta", "yuqori"]
+        }
+        self.versions["courses"] = version
+
+    def set_questions(self, questions_pool, version=None):
+        rendered = {}
+        for subject, questions in questions_pool.items():
+            for question in questions:
+                if 'id' in question:
+                    rendered[(subject, question['id'])] = (question, question['question'], render_explanation(question), {})
+        self._questions = rendered
+        self.versions["questions"] = version
+        return len(rendered)
+
+    # (matn, menyu, yechim bloki); index - savolning testdagi tartib raqami
+    def question(self, subject, question, index=0):
+        entry = self._questions.get((subject, question['id']))
+        if entry is None or entry[0] is not question:
+            return render_question(question, index)
+        _, text, explanation, keyboards = entry
+        keyboard = keyboards.get(index)
+        if keyboard is None:
+            keyboard = keyboards[index] = build_answer_keyboard(question, index)
+        return text, keyboard, explanation
+
+    def recommendation(self, subject, level, course_data):
+        text = self.recommendations.get((subject, level))
+        return text if text is not None else render_recommendation(course_data, level)
@@ -0,0 +1,76 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Bitta marshrut: handler(update, context), admin_only - faqat admin uchun
+class Route:
+    def __init__(self, name, handler, admin_only=False):
+        self.name = name
+        self.handler = handler
+        self.admin_only = admin_only
+
+
+# Callback ma'lumotlari bo'yicha marshrutlash jadvali. Aniq qiymatlar (main_menu, start_test, ...)
+# lug'atdan bitta qidiruv bilan, parametrli qiymatlar (answer_, class_, course_info_, ...) prefiks
+# daraxti (trie) orqali topiladi: qidiruv narxi marshrutlar soniga emas, prefiks uzunligiga bog'liq,
+# bir nechta prefiks mos kelsa eng uzuni tanlanadi.
+#
+# Har bir chaqiruvdan keyin on_dispatch(marshrut_nomi, qidiruv_soniyasi, handler_soniyasi) chaqiriladi
+# (o'lchov uchun); shu bilan birga marshrutlar bo'yicha hisoblagichlar `stats` da yig'iladi:
+# nom -> [chaqiruvlar, qidiruv vaqti yig'indisi, handler vaqti yig'indisi].
+class CallbackRouter:
+    def __init__(self, is_admin=None, on_dispatch=None):
+        self.is_admin = is_admin or (lambda user_id: False)
+        self.on_dispatch = on_dispatch
+        self.stats = {}
+        self._exact = {}
+        self._trie = {}
+
+    def exact(self, data, handler, admin_only=False, name=None):
+        self._exact[data] = Route(name or data, handler, admin_only)
+
+    def prefix(self, prefix, handler, admin_only=False, name=None):
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = Route(name or prefix, handler, admin_only)
+
+    def resolve(self, data):
+        route = self._exact.get(data)
+        if route is not None:
+            return route
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(None, route)
+        return route
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        started = time.perf_counter()
+        route = self.resolve(query.data or "")
+        resolved = time.perf_counter()
+
+        if route is None:
+            logger.warning(f"Noma'lum callback: '{query.data}' (foydalanuvchi {query.from_user.id})")
+            await query.answer()
+            return
+        if route.admin_only and not self.is_admin(str(query.from_user.id)):
+            logger.warning(f"Foydalanuvchi {query.from_user.id}: admin bo'limiga ruxsatsiz kirish ({route.name}).")
+            await query.answer("Bu bo'lim faqat admin uchun.", show_alert=True)
+            return
+
+        try:
+            await route.handler(update, context)
+        finally:
+            finished = time.perf_counter()
+            counters = self.stats.setdefault(route.name, [0, 0.0, 0.0])
+            counters[0] += 1
+            counters[1] += resolved - started
+            counters[2] += finished - resolved
+            if self.on_dispatch is not None:
+                self.on_dispatch(route.name, resolved - started, finished - resolved)
@@ -0,0 +1,22 @@
+# Foydalanuvchi qaysi workerga tegishli. Bir foydalanuvchining barcha yangilanishlari
+# bitta workerning navbatiga tushadi, shuning uchun ular kelgan tartibda qayta ishlanadi.
+def shard_for(user_id, count):
+    try:
+        return int(user_id) % count
+    except (TypeError, ValueError):
+        return 0
+
+
+# Yangilanishni Update obyektiga aylantirmasdan foydalanuvchi ID'sini topish
+# (message.from, callback_query.from, chat_member.from, poll_answer.user, ...)
+def update_user_id(data):
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
@@ -0,0 +1,57 @@
+import logging
+import os
+import pickle
+
+logger = logging.getLogger(__name__)
+
+# Kesh formati o'zgarsa oshiriladi: eski keshlar e'tiborsiz qoldiriladi va qayta yoziladi
+CACHE_FORMAT = 1
+
+
+# Faylning o'zgarganini bilish uchun belgi: o'zgartirilgan vaqt (ns) va hajm
+def file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def cache_filename(filename):
+    return f"{filename}.cache"
+
+
+# JSON faylning ikkilik nusxasi (pickle, protocol 5) yonidagi <fayl>.cache da saqlanadi.
+# Kesh boshida (format, tur, manba fayl belgisi) sarlavhasi turadi: JSON fayl qo'lda
+# o'zgartirilsa yoki keshni boshqa turdagi o'quvchi yozgan bo'lsa, kesh ishlatilmaydi.
+# Kesh faqat botning o'z data katalogidan o'qiladi.
+def read_cache(filename, kind):
+    stamp = file_stamp(filename)
+    if stamp is None:
+        return None
+    try:
+        with open(cache_filename(filename), 'rb') as f:
+            if pickle.load(f) != (CACHE_FORMAT, kind, stamp):
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Keshni o'qib bo'lmadi '{cache_filename(filename)}', JSON o'qiladi: {e}")
+        return None
+
+
+# Keshni yozish (manba fayl yozilgandan keyin chaqiriladi). Xato bo'lsa faqat ogohlantiriladi.
+def write_cache(filename, kind, value):
+    stamp = file_stamp(filename)
+    if stamp is None:
+        return
+    target = cache_filename(filename)
+    tmp_filename = f"{target}.tmp"
+    try:
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump((CACHE_FORMAT, kind, stamp), f, protocol=5)
+            pickle.dump(value, f, protocol=5)
+        os.replace(tmp_filename, target)
+    except Exception as e:
+        logger.warning(f"Keshni yozib bo'lmadi '{target}': {e}")
@@ -0,0 +1,201 @@
+import copy
+import json
+import logging
+import os
+import threading
+
+from storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ["boshlang'ich", "o'rta", "yuqori"]
+UNKNOWN = "Kiritilmagan"
+
+
+# Test natijasidan daraja (finish_test dagi chegaralar: 80% va 50%)
+def level_for(score, total):
+    percentage = (score / total) * 100 if total > 0 else 0
+    if percentage >= 80:
+        return "yuqori"
+    if percentage >= 50:
+        return "o'rta"
+    return "boshlang'ich"
+
+
+def _empty_group():
+    return {"count": 0, "score_sum": 0, "total_sum": 0, "levels": {}}
+
+
+def _empty():
+    return {"overall": _empty_group(), "schools": {}, "classes": {}, "questions": {}}
+
+
+def _add(group, score, total, level):
+    group["count"] += 1
+    group["score_sum"] += score
+    group["total_sum"] += total
+    group["levels"][level] = group["levels"].get(level, 0) + 1
+
+
+# Bitta natijani hisoblagichlarga qo'shish. answers: ixcham javoblar [savol_id, javob, to'g'ri (1/0)]
+def _record(data, user, result, answers):
+    score, total = result.get("score", 0), result.get("total", 0)
+    level = result.get("level") or level_for(score, total)
+    _add(data["overall"], score, total, level)
+    _add(data["schools"].setdefault(user.get("school") or UNKNOWN, _empty_group()), score, total, level)
+    _add(data["classes"].setdefault(user.get("class") or UNKNOWN, _empty_group()), score, total, level)
+    questions = data["questions"]
+    for question_id, _, is_correct in answers:
+        counter = questions.setdefault(f"{result.get('subject')}:{question_id}", [0, 0])
+        counter[0] += 1
+        counter[1] += 1 if is_correct else 0
+
+
+def _merge_group(target, group, sign):
+    for field in ("count", "score_sum", "total_sum"):
+        target[field] += sign * group[field]
+    for level, count in group["levels"].items():
+        target["levels"][level] = target["levels"].get(level, 0) + sign * count
+
+
+# Hisoblagichlar qo'shiladigan (additive): `other` ni `target` ga qo'shish, sign=-1 bo'lsa ayirish.
+# Ayirishdan keyin bo'shab qolgan maktab/sinf guruhlari va savollar olib tashlanadi.
+def merge_counters(target, other, sign=1):
+    _merge_group(target["overall"], other["overall"], sign)
+    for section in ("schools", "classes"):
+        groups = target[section]
+        for name, group in other[section].items():
+            _merge_group(groups.setdefault(name, _empty_group()), group, sign)
+            if groups[name]["count"] <= 0:
+                del groups[name]
+    questions = target["questions"]
+    for key, (attempts, correct) in other["questions"].items():
+        counter = questions.setdefault(key, [0, 0])
+        counter[0] += sign * attempts
+        counter[1] += sign * correct
+        if counter[0] <= 0:
+            del questions[key]
+    return target
+
+
+def _read(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Admin statistikasi uchun yig'ma hisoblagichlar. Natijalarni har safar qayta sanamaslik uchun
+# har bir yakunlangan test record() orqali O(1) (savollar soniga chiziqli) qo'shiladi:
+#   overall / schools[maktab] / classes[sinf]  testlar soni, ball va savollar yig'indisi, darajalar
+#   questions["fan:savol_id"]                  [urinishlar, to'g'ri javoblar]
+# Hisoblagichlar faylga davriy yoziladi va istalgan payt natijalar tarixidan qayta qurilishi mumkin.
+#
+# Bir nechta jarayonda (workers.py) har bir worker o'z faylida faqat o'zi yakunlagan testlarni
+# sanaydi; `peer_files` - qolgan workerlarning fayllari. combined() o'z hisoblagichlariga ularni
+# qo'shib beradi (fayllar FLUSH_INTERVAL kechikishi bilan yangilanadi). Tarixdan qayta qurishda
+# boshqalar sanagani ayiriladi, shuning uchun yig'indi har bir natijani bir marta sanaydi.
+#
+# Qayta qurish fon oqimida ishlaydi, record() esa event loop'da davom etadi: shu orada qo'shilgan
+# natijalar eslab qolinadi va tayyor hisoblagichlar lock ostida almashtirilganda ularga qo'shiladi
+# (tarixdan o'qilganlari ikki marta sanalmaydi).
+class StatsStore:
+    def __init__(self, filename, peer_files=()):
+        self.filename = filename
+        self.peer_files = list(peer_files)
+        self.data = _empty()
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._recorded = None
+
+    # Fayl bo'lmasa yoki buzilgan bo'lsa False qaytadi, chaqiruvchi tarixdan qayta quradi
+    def load(self):
+        if not os.path.exists(self.filename):
+            return False
+        try:
+            data = _read(self.filename)
+        except Exception as e:
+            logger.error(f"Statistika faylini yuklashda xato '{self.filename}': {e}")
+            return False
+        self.data = data
+        return True
+
+    # answers: ixcham javoblar [savol_id, javob, to'g'ri (1/0)]
+    def record(self, user, result, answers=()):
+        with self._lock:
+            _record(self.data, user, result, answers)
+            if self._recorded is not None:
+                self._recorded.append((user, result, answers))
+            self.dirty = True
+
+    # Tarixdan qayta qurish: (user_id, user, natijalar) uchliklari bo'yicha, fon oqimida chaqirilishi mumkin.
+    # Yangi hisoblagichlar alohida quriladi va tayyor bo'lgach lock ostida almashtiriladi.
+    def rebuild(self, rows):
+        with self._lock:
+            self._recorded = recorded = []
+        try:
+            data = _empty()
+            included = []
+            results_count = 0
+            for _, user, user_results in rows:
+                for result in user_results:
+                    _record(data, user, result, result.get("answers", ()))
+                    results_count += 1
+                    if recorded and any(entry[1] == result for entry in recorded):
+                        included.append(result)
+            merge_counters(data, self._peers_data(), sign=-1)
+            with self._lock:
+                for user, result, answers in recorded:
+                    if result in included:
+                        included.remove(result)
+                    else:
+                        _record(data, user, result, answers)
+                self.data = data
+                self.dirty = True
+        finally:
+            with self._lock:
+                self._recorded = None
+        return results_count
+
+    # Boshqa workerlar hisoblagichlari yig'indisi (fayli hali yo'q yoki buzilgan worker o'tkazib yuboriladi)
+    def _peers_data(self):
+        total = _empty()
+        for filename in self.peer_files:
+            if not os.path.exists(filename):
+                continue
+            try:
+                merge_counters(total, _read(filename))
+            except Exception as e:
+                logger.error(f"Statistika faylini o'qishda xato '{filename}': {e}")
+        return total
+
+    # Ko'rsatish uchun: bitta jarayonda o'z hisoblagichlari, aks holda barcha workerlar yig'indisi
+    def combined(self):
+        if not self.peer_files:
+            return self.data
+        return merge_counters(self._peers_data(), self.data)
+
+    # Yozish uchun nusxa: event loop oqimida olinadi, fayl esa save() bilan fon oqimida yoziladi
+    def dump(self):
+        if not self.dirty:
+            return None
+        with self._lock:
+            self.dirty = False
+            return copy.deepcopy(self.data)
+
+    def save(self, data):
+        atomic_write_json(self.filename, data)
+
+    # Guruh bo'yicha o'rtacha foiz
+    @staticmethod
+    def average(group):
+        return group["score_sum"] / group["total_sum"] * 100 if group["total_sum"] else 0
+
+    # Eng past o'tish foiziga ega savollar: [(kalit, foiz, urinishlar), ...]
+    def hardest_questions(self, limit=5, min_attempts=5, data=None):
+        data = data if data is not None else self.data
+        rates = [
+            (key, correct / attempts * 100, attempts)
+            for key, (attempts, correct) in data["questions"].items()
+            if attempts >= min_attempts
+        ]
+        rates.sort(key=lambda item: item[1])
+        return rates[:limit]
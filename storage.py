@@ -0,0 +1,1401 @@
+import argparse
+import array
+import asyncio
+import bisect
+import collections
+import contextlib
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from snapshot_cache import read_cache, write_cache
+
+logger = logging.getLogger(__name__)
+
+
+# Faylni atomar yozish: avval vaqtinchalik faylga yoziladi, diskka tushiriladi (fsync)
+# va os.replace bilan almashtiriladi. Yozish paytida jarayon o'ldirilsa ham eski fayl butun qoladi.
+def atomic_write_json(filename, data, indent=None):
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+# Tayyor JSON matnini atomar yozish
+def atomic_write_text(filename, text):
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+# Snapshot faylini o'qish (bo'sh fayl bo'sh lug'at hisoblanadi)
+def _read_snapshot(filename):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if not content.strip():
+        return {}
+    return json.loads(content)
+
+
+# Jurnal yozuvlarini lug'atga qo'llash. Oxirgi qator yarim yozilgan bo'lsa (jarayon yozish
+# paytida to'xtagan), u tashlab yuboriladi. Qo'llangan yozuvlar soni qaytariladi.
+def _replay_log(filename, data):
+    if not os.path.exists(filename):
+        return 0
+    count = 0
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Jurnalning {line_no}-qatori buzilgan, qolgan qismi o'tkazib yuborildi: '{filename}'")
+                break
+            if entry.get('d'):
+                data.pop(entry['k'], None)
+            else:
+                data[entry['k']] = entry['v']
+            count += 1
+    return count
+
+
+# Yarim yozilgan oxirgi qator kesib tashlanadi, aks holda keyingi yozuvlar unga qo'shilib buzilardi
+def _repair_log_tail(filename):
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+
+
+# Faqat qo'shib boriladigan jurnal (write-ahead log) va snapshot.
+# Har bir o'zgarish jurnalga bitta qator bo'lib yoziladi: {"k": kalit, "v": qiymat}
+# yoki o'chirish uchun {"k": kalit, "d": 1}. Jurnal `compact_every` yozuvdan oshganda
+# fon oqimida snapshot bilan birlashtiriladi (compaction).
+#
+# Snapshot yonida uning ikkilik keshi (snapshot_cache) saqlanadi: JSON fayl o'zgarmagan bo'lsa
+# ishga tushishda JSON emas, kesh o'qiladi. lazy=True bo'lsa snapshot qiymatlari dekodlanmasdan
+# JSON baytlari ko'rinishida qaytariladi va ularni chaqiruvchi kerak bo'lganda o'zi ochadi.
+class LogStore:
+    def __init__(self, filename, compact_every=1000, lazy=False):
+        self.filename = filename
+        self.lazy = lazy
+        self.log_filename = f"{filename}.log"
+        self.old_log_filename = f"{filename}.log.old"
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._log = None
+        self._log_entries = 0
+        self._compactor = None
+
+    # Snapshot o'qiladi, so'ng avval tugallanmagan siqishdan qolgan jurnal, keyin joriy jurnal qo'llanadi
+    def load(self):
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            data = self._load_snapshot()
+        except Exception as e:
+            logger.error(f"Faylni yuklashda xato '{self.filename}': {e}")
+            data = {}
+        _replay_log(self.old_log_filename, data)
+        self._log_entries = _replay_log(self.log_filename, data)
+        _repair_log_tail(self.log_filename)
+        self._log = open(self.log_filename, 'a', encoding='utf-8')
+        return data
+
+    @property
+    def _cache_kind(self):
+        return "raw" if self.lazy else "full"
+
+    # Snapshot keshdan, kesh eskirgan yoki yo'q bo'lsa JSON dan o'qiladi va kesh qayta yoziladi
+    def _load_snapshot(self):
+        data = read_cache(self.filename, self._cache_kind)
+        if data is not None:
+            return data
+        data = _read_snapshot(self.filename)
+        if self.lazy:
+            data = {key: _dumps(value).encode('utf-8') for key, value in data.items()}
+        if data:
+            write_cache(self.filename, self._cache_kind, data)
+        return data
+
+    # Snapshot va uning keshini yozish. lazy rejimda dekodlanmagan qiymatlar JSON ga qayta
+    # o'girilmaydi, baytlari to'g'ridan-to'g'ri qo'shiladi.
+    def _write_snapshot(self, data):
+        if not self.lazy:
+            atomic_write_json(self.filename, data)
+            write_cache(self.filename, self._cache_kind, data)
+            return
+        raw = {
+            key: value if isinstance(value, bytes) else _dumps(value).encode('utf-8')
+            for key, value in data.items()
+        }
+        atomic_write_text(self.filename, "{" + ",".join(
+            f"{json.dumps(key, ensure_ascii=False)}:{value.decode('utf-8')}" for key, value in raw.items()
+        ) + "}")
+        write_cache(self.filename, self._cache_kind, raw)
+
+    # Qiymat oldindan JSON satriga aylantirilgan bo'lsa, jurnal qatori shu satrdan yig'iladi
+    @staticmethod
+    def encode_put(key, value_json):
+        return f'{{"k":{json.dumps(key, ensure_ascii=False)},"v":{value_json}}}\n'
+
+    def put(self, key, value):
+        return self.append_lines([self.encode_put(key, _dumps(value))])
+
+    def delete(self, key):
+        return self.append_lines([_dumps({"k": key, "d": 1}) + "\n"])
+
+    # Qatorlar bitta write() chaqiruvi bilan qo'shiladi, shuning uchun uzilish faqat oxirgi qatorni buzishi mumkin
+    def append_lines(self, lines):
+        chunk = "".join(lines)
+        with self._lock:
+            self._log.write(chunk)
+            self._log.flush()
+            self._log_entries += len(lines)
+            needs_compaction = self._log_entries >= self.compact_every
+        if needs_compaction:
+            self.compact()
+        return len(chunk.encode('utf-8'))
+
+    # Joriy jurnal .old nomiga o'tkaziladi va fon oqimida snapshotga qo'shiladi.
+    # Yangi yozuvlar shu paytda yangi jurnalga tushaveradi.
+    def compact(self, wait=False):
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                compactor = self._compactor
+            elif self._log_entries == 0 and not os.path.exists(self.old_log_filename):
+                return
+            else:
+                # Oldingi siqish tugallanmagan bo'lsa, avval o'sha .old jurnal birlashtiriladi
+                if not os.path.exists(self.old_log_filename):
+                    self._log.close()
+                    os.replace(self.log_filename, self.old_log_filename)
+                    self._log = open(self.log_filename, 'a', encoding='utf-8')
+                    self._log_entries = 0
+                compactor = threading.Thread(
+                    target=self._compact_worker,
+                    name=f"compact-{os.path.basename(self.filename)}",
+                    daemon=True
+                )
+                self._compactor = compactor
+                compactor.start()
+        if wait:
+            compactor.join()
+
+    def _compact_worker(self):
+        try:
+            data = self._load_snapshot()
+            count = _replay_log(self.old_log_filename, data)
+            self._write_snapshot(data)
+            os.remove(self.old_log_filename)
+            logger.info(f"Jurnal siqildi '{self.filename}': {count} ta yozuv snapshotga qo'shildi.")
+        except Exception as e:
+            logger.error(f"Jurnalni siqishda xato '{self.filename}': {e}")
+
+    # To'xtashdan oldin jurnal snapshotga birlashtiriladi va fayl yopiladi
+    def close(self):
+        if self._log is None:
+            return
+        # Fonda ishlayotgan siqish tugashi kutiladi, so'ng undan keyin yozilganlar ham birlashtiriladi
+        self.compact(wait=True)
+        self.compact(wait=True)
+        with self._lock:
+            self._log.close()
+            self._log = None
+
+
+# Faqat qo'shib boriladigan natijalar arxivi (JSON Lines): har bir qator {"u": user_id, "r": natija}.
+# Halqa buferdan chiqqan eski natijalar shu yerga yoziladi. Bot ishlayotganda fayl faqat yoziladi,
+# eksport va tahlil uchun esa foydalanuvchi bo'yicha o'qiladi: index() qatorlar joylarini (bayt)
+# yig'adi - natijalarning o'zi ochilmaydi - va reader() har bir foydalanuvchining natijalarini
+# navbati kelganda shu joylardan o'qiydi. Xotirada butun arxiv emas, faqat qatorlar joylari turadi.
+class ResultArchive:
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._file = None
+
+    def open(self):
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _repair_log_tail(self.filename)
+        self._file = open(self.filename, 'a', encoding='utf-8')
+
+    @staticmethod
+    def encode(user_id, result_json):
+        return f'{{"u":{json.dumps(user_id, ensure_ascii=False)},"r":{result_json}}}\n'
+
+    def append_lines(self, lines):
+        chunk = "".join(lines)
+        with self._lock:
+            self._file.write(chunk)
+            self._file.flush()
+        return len(chunk.encode('utf-8'))
+
+    # Foydalanuvchi -> uning qatorlari boshlanadigan joylar, yozilgan tartibda. Qatordan faqat "u"
+    # ochiladi; oxirgi tugallanmagan qator (hali yozilayotgan) hisobga olinmaydi.
+    def index(self):
+        offsets = {}
+        if not os.path.exists(self.filename):
+            return offsets
+        decoder = json.JSONDecoder()
+        with open(self.filename, 'rb') as f:
+            offset = 0
+            for line_no, line in enumerate(f, 1):
+                start, offset = offset, offset + len(line)
+                if not line.endswith(b"\n") or not line.strip():
+                    continue
+                try:
+                    user_id = decoder.raw_decode(line[5:line.index(b',"r":')].decode('utf-8'))[0]
+                except ValueError:
+                    logger.warning(f"Arxivning {line_no}-qatori buzilgan, o'tkazib yuborildi: '{self.filename}'")
+                    continue
+                offsets.setdefault(user_id, array.array('q')).append(start)
+        return offsets
+
+    # Eksport davomida ochiq turadigan o'quvchi: read(joylar) -> shu qatorlardagi natijalar
+    @contextlib.contextmanager
+    def reader(self):
+        if not os.path.exists(self.filename):
+            yield lambda offsets: []
+            return
+        with open(self.filename, 'rb') as f:
+            def read(offsets):
+                results = []
+                for offset in offsets:
+                    f.seek(offset)
+                    try:
+                        results.append(json.loads(f.readline())['r'])
+                    except (ValueError, KeyError):
+                        logger.warning(f"Arxivdagi {offset}-baytdagi qator buzilgan, o'tkazib yuborildi: '{self.filename}'")
+                return results
+            yield read
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def result_percentage(result):
+    total = result.get("total") or 0
+    return result.get("score", 0) / total * 100 if total else 0.0
+
+
+def _totals(count, best, percent_sum):
+    return {"count": count, "best": best, "average": percent_sum / count if count else 0.0}
+
+
+# Foydalanuvchi natijalari: oxirgi `size` ta natija halqa buferda (deque), undan eskisi append()
+# natijasi sifatida qaytariladi va arxivga yoziladi. Umumiy ko'rsatkichlar (soni, eng yaxshi va
+# o'rtacha foiz) barcha natijalar bo'yicha yuritiladi, shuning uchun arxivni o'qish kerak emas.
+# Saqlash formati: {"recent": [...], "count": n, "best": foiz, "percent_sum": foizlar yig'indisi}.
+class ResultHistory:
+    __slots__ = ("recent", "count", "best", "percent_sum")
+
+    def __init__(self, size, recent=(), count=0, best=0.0, percent_sum=0.0):
+        self.recent = collections.deque(recent, maxlen=size)
+        self.count = count
+        self.best = best
+        self.percent_sum = percent_sum
+
+    # Saqlangan qiymatdan tiklash. Eski format (barcha natijalar ro'yxati) ham o'qiladi:
+    # ko'rsatkichlar ro'yxatdan hisoblanadi. Ikkala holatda ham buferga sig'maganlari (overflow,
+    # masalan RESULT_HISTORY kamaytirilgandan keyin) arxivga yozish uchun alohida qaytariladi.
+    @classmethod
+    def from_json(cls, data, size):
+        if isinstance(data, dict):
+            recent = data["recent"]
+            overflow = recent[:-size] if len(recent) > size else []
+            history = cls(size, recent[len(overflow):], data["count"], data["best"], data["percent_sum"])
+            return history, overflow
+        overflow = data[:-size] if len(data) > size else []
+        history = cls(size)
+        for result in overflow:
+            history._count(result)
+        for result in data[len(overflow):]:
+            history.append(result)
+        return history, overflow
+
+    def to_json(self):
+        return {"recent": list(self.recent), "count": self.count, "best": self.best, "percent_sum": self.percent_sum}
+
+    def _count(self, result):
+        percentage = result_percentage(result)
+        self.count += 1
+        self.best = max(self.best, percentage)
+        self.percent_sum += percentage
+
+    # Natijani qo'shish. Bufer to'la bo'lsa, undan chiqib ketgan eng eski natija qaytariladi.
+    def append(self, result):
+        evicted = self.recent[0] if len(self.recent) == self.recent.maxlen else None
+        self.recent.append(result)
+        self._count(result)
+        return evicted
+
+    def totals(self):
+        return _totals(self.count, self.best, self.percent_sum)
+
+
+_MISSING = object()
+
+# Admin ro'yxatlarini shu maydonlar bo'yicha saralash mumkin (ikkala engine'da ham ikkilamchi indeks bor)
+PAGE_FIELDS = ("class", "school")
+
+
+# Fon yozuvchi oqim. Handlerlar yozuvni navbatga qo'yadi va darhol davom etadi, diskka yozish
+# alohida oqimda bajariladi. Navbat kalit bo'yicha ishlaydi: bir kalitga kelgan yangi qiymat
+# eskisining o'rnini egallaydi (yoki `merge` bilan qo'shiladi), shuning uchun bir foydalanuvchining
+# ketma-ket o'zgarishlari bitta yozuvga birlashadi. Navbatda `max_pending` dan ortiq kalit
+# to'planib qolsa, yangi kalit qo'yuvchi joy bo'shaguncha kutadi - shuning uchun event loop
+# oqimidan submit() faqat has_room() tekshirilgandan keyin chaqiriladi (Storage.flush_dirty).
+#
+# apply_batch yozilgan baytlar sonini qaytaradi; `observer(soniya, yozuvlar, baytlar)` berilgan
+# bo'lsa, har bir partiyadan keyin fon oqimida chaqiriladi (o'lchov uchun).
+class BackgroundWriter:
+    def __init__(self, apply_batch, commit=None, max_pending=10000, name="storage-writer"):
+        self._apply_batch = apply_batch
+        self._commit = commit
+        self.max_pending = max_pending
+        self.lock = threading.Condition()
+        self._pending = {}
+        self._inflight = {}
+        self._closed = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.written = 0
+        self.observer = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, value, merge=None):
+        with self.lock:
+            self.submitted += 1
+            if key in self._pending:
+                old = self._pending[key]
+                self._pending[key] = merge(old, value) if merge else value
+                self.coalesced += 1
+                return
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self.lock.wait()
+            self._pending[key] = value
+            self.lock.notify_all()
+
+    # Navbatda turgan (hali partiyaga olinmagan) kalitlar soni
+    @property
+    def queued(self):
+        return len(self._pending)
+
+    # Navbatda yangi kalit uchun joy bormi. Navbatga faqat event loop qo'yadi, fon oqimi esa uni
+    # faqat bo'shatadi, shuning uchun True javobdan keyingi bitta submit() kutib qolmaydi.
+    def has_room(self):
+        return len(self._pending) < self.max_pending
+
+    # Navbatda joy bo'shaguncha kutish (event loop'dan tashqarida: to'xtashda yoki to_thread orqali)
+    def wait_for_room(self, timeout=None):
+        with self.lock:
+            return self.lock.wait_for(lambda: self.has_room() or self._closed, timeout)
+
+    # Hali bazaga tushmagan barcha yozuvlar: avval yozilayotgan partiya, keyin navbat. lock ichida chaqiriladi.
+    def unwritten(self):
+        return list(self._inflight.items()) + list(self._pending.items())
+
+    # Hali bazaga tushmagan qiymat (navbatda yoki yozilayotgan paytda). lock ichida chaqiriladi.
+    def peek(self, key):
+        value = self._pending.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._inflight.get(key, _MISSING)
+        return value
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self._pending and not self._closed:
+                    self.lock.wait()
+                if not self._pending:
+                    return
+                self._inflight, self._pending = self._pending, {}
+                batch = list(self._inflight.items())
+                self.lock.notify_all()
+            started = time.perf_counter()
+            written_bytes = 0
+            try:
+                written_bytes = self._apply_batch(batch) or 0
+            except Exception as e:
+                logger.error(f"Fon yozuvchida xato ({len(batch)} ta yozuv): {e}")
+            with self.lock:
+                # Commit va navbatdagi nusxani o'chirish bir lock ichida: o'qiyotgan handler
+                # yozuvni ikki marta ham, umuman ko'rmasligi ham mumkin emas
+                try:
+                    if self._commit:
+                        self._commit()
+                except Exception as e:
+                    logger.error(f"Fon yozuvchida commit xatosi: {e}")
+                self._inflight = {}
+                self.batches += 1
+                self.written += len(batch)
+                self.lock.notify_all()
+            if self.observer is not None:
+                self.observer(time.perf_counter() - started, len(batch), written_bytes)
+
+    # Navbatdagi barcha yozuvlar diskka tushguncha kutish
+    def flush(self, timeout=None):
+        with self.lock:
+            return self.lock.wait_for(lambda: not self._pending and not self._inflight, timeout)
+
+    def close(self):
+        with self.lock:
+            self._closed = True
+            self.lock.notify_all()
+        self._thread.join()
+
+
+# Saqlash interfeysi. bot.py dagi barcha handlerlar faqat shu metodlar orqali ishlaydi.
+# Yozuvlar "o'qish -> o'zgartirish -> put_*" tartibida yangilanadi: get_* qaytargan lug'at
+# engine ichidagi obyekt bo'lishi ham, nusxa bo'lishi ham mumkin.
+#
+# put_* darhol yozmaydi, faqat yozuvni "o'zgargan" (dirty) deb belgilaydi. flush_dirty()
+# belgilangan yozuvlarni JSON ga aylantirib fon yozuvchiga beradi; u bot.py da davriy ravishda
+# va muhim o'tishlarda (test yakunlanganda) chaqiriladi. Shu oraliqda bir yozuvning barcha
+# o'zgarishlari bitta fizik yozuvga aylanadi.
+class Storage:
+    writer = None
+
+    def __init__(self):
+        self._dirty = {}
+        self.mutations = 0
+        # Fon yozuvchi navbati to'la bo'lgani uchun keyingi flush'ga qoldirilgan yozuvlar soni
+        self.deferred = 0
+        # load() bosqichlari va ularning davomiyligi (soniya), ishga tushish hisobotiga qo'shiladi
+        self.load_timings = {}
+
+    def load(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _mark_dirty(self, key, value, append=False):
+        self.mutations += 1
+        if append:
+            self._dirty.setdefault(key, []).append(value)
+        else:
+            self._dirty[key] = value
+
+    # Engine kalit va qiymatni fon yozuvchiga beradi (handler oqimida chaqiriladi)
+    def _write(self, key, value):
+        raise NotImplementedError
+
+    # O'zgargan yozuvlarni fon yozuvchiga topshirish. Faqat event loop oqimidan chaqiriladi va hech
+    # qachon kutmaydi: fon yozuvchi navbati to'la bo'lsa (disk sekin), qolgan yozuvlar dirty'da
+    # qoladi, u yerda ham kalit bo'yicha birlashadi va keyingi flush'da topshiriladi.
+    # Dirty'da qolgan yozuvlar sonini qaytaradi.
+    def flush_dirty(self):
+        if self.writer is None:
+            return len(self._dirty)
+        dirty, self._dirty = self._dirty, {}
+        items = iter(dirty.items())
+        for key, value in items:
+            if not self.writer.has_room():
+                self._dirty[key] = value
+                self._dirty.update(items)
+                self.deferred += len(self._dirty)
+                break
+            self._write(key, value)
+        return len(self._dirty)
+
+    # Coroutine'lar uchun: barcha o'zgarishlar fon yozuvchiga topshirilguncha kutish (eksport va
+    # qayta qurishdan oldin). Navbatda joy bo'shashi event loop'ni to'xtatmasdan boshqa oqimda kutiladi.
+    async def drain_dirty(self):
+        while self.writer is not None and self.flush_dirty():
+            await asyncio.to_thread(self.writer.wait_for_room)
+
+    # Barcha o'zgarishlarni diskka tushirish (to'xtashdan oldin chaqiriladi, kutishi mumkin).
+    # Fon yozuvchi yo'q bo'lsa (load() dan oldin yoki close() dan keyin) yozadigan joy yo'q.
+    def flush(self):
+        if self.writer is None:
+            return
+        while self.flush_dirty():
+            self.writer.wait_for_room()
+        self.writer.flush()
+
+    # Yozish kuchayishi: mantiqiy o'zgarishlar soni / fizik yozuvlar soni
+    def write_stats(self):
+        writes = self.writer.written if self.writer is not None else 0
+        return {
+            "mutations": self.mutations,
+            "writes": writes,
+            "pending": len(self._dirty),
+            "queued": self.writer.queued if self.writer is not None else 0,
+            "deferred": self.deferred,
+            "ratio": self.mutations / writes if writes else 0.0
+        }
+
+    # Foydalanuvchilar
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    def put_user(self, user_id, user):
+        raise NotImplementedError
+
+    # active_only=True bo'lsa botni bloklagan (active=False) foydalanuvchilar chiqarib tashlanadi
+    def user_ids(self, active_only=False):
+        raise NotImplementedError
+
+    def iter_users(self):
+        raise NotImplementedError
+
+    # (jami, faol) foydalanuvchilar soni
+    def count_users(self):
+        raise NotImplementedError
+
+    # Foydalanuvchilar sahifasi (kursor bo'yicha). Kursor - foydalanuvchining barqaror tartib raqami:
+    # after=k dan keyingi yoki before=k dan oldingi `limit` ta yozuv olinadi. field/value berilsa
+    # faqat shu sinf yoki maktab, with_results=True bo'lsa faqat natijasi bor foydalanuvchilar.
+    # Qaytadi: ([(user_id, user), ...], oldingi_sahifa_kursori, keyingi_sahifa_kursori);
+    # kursor None bo'lsa u tomonda sahifa yo'q.
+    def page_users(self, after=None, before=None, limit=10, field=None, value=None, with_results=False):
+        raise NotImplementedError
+
+    # Engine limit+1 ta qatorni (kursor, user_id, user) so'ralgan yo'nalishda beradi, qolgani shu yerda
+    @staticmethod
+    def _make_page(rows, limit, after, before):
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+            prev_cursor = rows[0][0] if more else None
+            next_cursor = rows[-1][0] if rows else None
+        else:
+            prev_cursor = rows[0][0] if rows and after is not None else None
+            next_cursor = rows[-1][0] if more else None
+        return [(user_id, user) for _, user_id, user in rows], prev_cursor, next_cursor
+
+    # Natijalar. get_results faqat oxirgi natijalarni (eng ko'pi history_size ta) qaytaradi,
+    # get_result_totals esa barcha natijalar bo'yicha {"count", "best", "average"} ni.
+    def get_results(self, user_id):
+        raise NotImplementedError
+
+    def get_result_totals(self, user_id):
+        raise NotImplementedError
+
+    def add_result(self, user_id, result):
+        raise NotImplementedError
+
+    # To'liq tarix (arxiv bilan birga), migratsiya uchun
+    def iter_results(self):
+        raise NotImplementedError
+
+    # Eksport uchun: (user_id, user, to'liq natijalar tarixi) uchliklari. Fon oqimidan chaqirilishi mumkin,
+    # shuning uchun undan oldin event loop oqimida flush_dirty() chaqirilishi kerak.
+    def iter_export(self):
+        raise NotImplementedError
+
+    # Tugallanmagan testlar
+    def get_test(self, user_id):
+        raise NotImplementedError
+
+    def put_test(self, user_id, test):
+        raise NotImplementedError
+
+    def delete_test(self, user_id):
+        raise NotImplementedError
+
+    # Tugallanmagan testlar soni (o'lchov uchun, taxminiy bo'lishi mumkin)
+    def count_tests(self):
+        raise NotImplementedError
+
+
+# Dangasa natijalar: qiymat ochilmagan JSON baytlari, ResultHistory yoki eski formatdagi ro'yxat
+def _has_results(user_results):
+    if isinstance(user_results, bytes):
+        return user_results != b"[]"
+    if isinstance(user_results, ResultHistory):
+        return user_results.count > 0
+    return bool(user_results)
+
+
+# JSON engine: ma'lumotlar xotirada, o'zgarishlar fon oqimida LogStore jurnaliga yoziladi.
+# Tugallanmagan test eski formatdagidek foydalanuvchi yozuvining "current_test" maydonida turadi.
+#
+# Sahifalash uchun har bir foydalanuvchiga qo'shilish tartibidagi raqam beriladi (kursor) va
+# sinf/maktab bo'yicha tartiblangan raqamlar ro'yxati yuritiladi, shuning uchun N-sahifa
+# bisect bilan topiladi va butun ro'yxat aylanib chiqilmaydi.
+#
+# Natijalar dangasa yuklanadi: ishga tushishda har bir foydalanuvchining natijalari JSON baytlari
+# bo'lib qoladi va faqat shu foydalanuvchi birinchi marta so'ralganda (get_results/add_result)
+# ResultHistory ga ochiladi. Xotirada va results.json da har bir foydalanuvchining faqat oxirgi
+# `history_size` ta natijasi turadi, eskilari ResultArchive fayliga qo'shiladi. Eksport va tahlil
+# arxiv bilan to'liq tarixni vaqtincha o'qiydi, xotirada saqlamaydi.
+class JsonStorage(Storage):
+    def __init__(self, user_file, results_file, compact_every=1000, max_pending=10000, history_size=10, archive_file=None):
+        super().__init__()
+        self.users_log = LogStore(user_file, compact_every=compact_every)
+        self.results_log = LogStore(results_file, compact_every=compact_every, lazy=True)
+        self.archive = ResultArchive(archive_file or f"{os.path.splitext(results_file)[0]}_archive.jsonl")
+        self.history_size = history_size
+        self.max_pending = max_pending
+        self.writer = None
+        self.users = {}
+        self.results = {}
+        self._order = []
+        self._position = {}
+        self._field_index = {field: {} for field in PAGE_FIELDS}
+        self._indexed_values = {}
+        self._with_results = []
+        self._with_tests = set()
+
+    def load(self):
+        started = time.perf_counter()
+        self.users = self.users_log.load()
+        loaded_users = time.perf_counter()
+        self.results = self.results_log.load()
+        self.archive.open()
+        loaded_results = time.perf_counter()
+        for user_id, user in self.users.items():
+            self._index_user(user_id, user)
+        self._with_results = sorted(
+            self._position[uid] for uid, user_results in self.results.items()
+            if _has_results(user_results) and uid in self._position
+        )
+        self.load_timings = {
+            "foydalanuvchilar": loaded_users - started,
+            "natijalar": loaded_results - loaded_users,
+            "indekslar": time.perf_counter() - loaded_results,
+        }
+        self.writer = BackgroundWriter(self._apply_batch, max_pending=self.max_pending, name="json-writer")
+
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
+        self.users_log.close()
+        self.results_log.close()
+        self.archive.close()
+
+    # Qiymat handler oqimida JSON satriga aylantiriladi, keyin obyekt o'zgarsa ham yozuvga ta'sir qilmaydi.
+    # Arxiv yozuvlari qo'shib boriladi, shuning uchun navbatdagi qatorlar bilan birlashtiriladi.
+    def _write(self, key, value):
+        kind, user_id = key
+        if kind == "archive":
+            self.writer.submit((self.archive, user_id), [_dumps(result) for result in value], merge=lambda old, new: old + new)
+        elif kind == "results":
+            self.writer.submit((self.results_log, user_id), _dumps(value.to_json()))
+        else:
+            self.writer.submit((self.users_log, user_id), _dumps(value))
+
+    # Fon oqimida: har bir faylga partiya bitta write() bilan qo'shiladi. Arxiv birinchi yoziladi:
+    # uzilish bo'lsa natija yo'qolmaydi, ko'pi bilan eksportda ikki marta chiqadi.
+    def _apply_batch(self, batch):
+        lines_by_log = {self.archive: []}
+        for (log, key), value in batch:
+            if log is self.archive:
+                lines_by_log[log].extend(ResultArchive.encode(key, result_json) for result_json in value)
+            else:
+                lines_by_log.setdefault(log, []).append(LogStore.encode_put(key, value))
+        written_bytes = 0
+        for log, lines in lines_by_log.items():
+            if not lines:
+                continue
+            try:
+                written_bytes += log.append_lines(lines)
+            except Exception as e:
+                logger.error(f"Faylni saqlashda xato '{log.filename}': {e}")
+        return written_bytes
+
+    # Ikkilamchi indekslarni yangilash: faqat sinf yoki maktab o'zgargan bo'lsa ro'yxatlar tegiladi.
+    # Tugallanmagan testi borlar to'plami ham shu yerda yuritiladi (count_tests uchun).
+    def _index_user(self, user_id, user):
+        if user.get("current_test"):
+            self._with_tests.add(user_id)
+        else:
+            self._with_tests.discard(user_id)
+        position = self._position.get(user_id)
+        if position is None:
+            position = self._position[user_id] = len(self._order)
+            self._order.append(user_id)
+        values = tuple(user.get(field) for field in PAGE_FIELDS)
+        old_values = self._indexed_values.get(user_id)
+        if values == old_values:
+            return
+        for i, field in enumerate(PAGE_FIELDS):
+            groups = self._field_index[field]
+            if old_values is not None and old_values[i] != values[i]:
+                positions = groups[old_values[i]]
+                del positions[bisect.bisect_left(positions, position)]
+                if not positions:
+                    del groups[old_values[i]]
+            if old_values is None or old_values[i] != values[i]:
+                bisect.insort(groups.setdefault(values[i], []), position)
+        self._indexed_values[user_id] = values
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def put_user(self, user_id, user):
+        self.users[user_id] = user
+        self._index_user(user_id, user)
+        self._mark_dirty(("user", user_id), user)
+
+    def user_ids(self, active_only=False):
+        if active_only:
+            return [uid for uid, user in self.users.items() if user.get("active", True)]
+        return list(self.users.keys())
+
+    def iter_users(self):
+        return iter(list(self.users.items()))
+
+    def count_users(self):
+        return len(self.users), sum(1 for user in self.users.values() if user.get("active", True))
+
+    def page_users(self, after=None, before=None, limit=10, field=None, value=None, with_results=False):
+        if field is not None:
+            positions = self._field_index[field].get(value, [])
+        elif with_results:
+            positions = self._with_results
+        else:
+            positions = range(len(self._order))
+        # Maydon va natija filtri birga bo'lsa, natijasizlar sahifa to'lguncha o'tkazib yuboriladi
+        skip_empty = with_results and field is not None
+        if before is not None:
+            candidates = (positions[i] for i in range(bisect.bisect_left(positions, before) - 1, -1, -1))
+        else:
+            start = bisect.bisect_right(positions, after) if after is not None else 0
+            candidates = (positions[i] for i in range(start, len(positions)))
+        rows = []
+        for position in candidates:
+            user_id = self._order[position]
+            if skip_empty and not _has_results(self.results.get(user_id)):
+                continue
+            rows.append((position, user_id, self.users[user_id]))
+            if len(rows) > limit:
+                break
+        return self._make_page(rows, limit, after, before)
+
+    # Foydalanuvchi natijalari birinchi so'ralganda ResultHistory ga ochiladi va xotirada qoladi.
+    # Eski formatdagi uzun ro'yxatning buferga sig'magan qismi shu yerda arxivga ko'chiriladi.
+    def _history(self, user_id):
+        value = self.results.get(user_id)
+        if value is None or isinstance(value, ResultHistory):
+            return value
+        history, overflow = ResultHistory.from_json(
+            json.loads(value) if isinstance(value, bytes) else value, self.history_size
+        )
+        self.results[user_id] = history
+        if overflow:
+            for result in overflow:
+                self._mark_dirty(("archive", user_id), result, append=True)
+            self._mark_dirty(("results", user_id), history)
+        return history
+
+    def get_results(self, user_id):
+        history = self._history(user_id)
+        return list(history.recent) if history is not None else []
+
+    def get_result_totals(self, user_id):
+        history = self._history(user_id)
+        return history.totals() if history is not None else _totals(0, 0.0, 0.0)
+
+    def add_result(self, user_id, result):
+        history = self._history(user_id)
+        if history is None:
+            history = self.results[user_id] = ResultHistory(self.history_size)
+        evicted = history.append(result)
+        if evicted is not None:
+            self._mark_dirty(("archive", user_id), evicted, append=True)
+        if history.count == 1 and user_id in self._position:
+            bisect.insort(self._with_results, self._position[user_id])
+        self._mark_dirty(("results", user_id), history)
+
+    # Arxivdagi va oxirgi natijalar birga. Fon oqimidan chaqirilishi mumkin, shuning uchun
+    # self.results dagi qiymat o'zgartirilmaydi, faqat vaqtincha ochiladi.
+    @staticmethod
+    def _full_history(value, archived):
+        if isinstance(value, bytes):
+            value = json.loads(value)
+        if isinstance(value, ResultHistory):
+            recent = list(value.recent)
+        elif isinstance(value, dict):
+            recent = value["recent"]
+        else:
+            recent = value or []  # Eski format: barcha natijalar ro'yxatda, arxivda hech narsa yo'q
+        return archived + recent
+
+    # Arxiv joylari indeksi: undan oldin navbatdagi barcha qatorlar faylga tushiriladi
+    def _archive_index(self):
+        if self.writer is not None:
+            self.writer.flush()
+        return self.archive.index()
+
+    def iter_results(self):
+        offsets = self._archive_index()
+        with self.archive.reader() as read:
+            for uid, value in list(self.results.items()):
+                if _has_results(value):
+                    yield uid, self._full_history(value, read(offsets.get(uid, ())))
+
+    # Kalitlar ro'yxati bir lahzada olinadi, har bir foydalanuvchi navbat bilan o'qiladi.
+    # Natijalar faqat qo'shib boriladi, shuning uchun ro'yxat nusxasi izchil bo'ladi.
+    # Arxivdan faqat navbatdagi foydalanuvchining natijalari o'qiladi.
+    def iter_export(self):
+        offsets = self._archive_index()
+        with self.archive.reader() as read:
+            for user_id in list(self.users):
+                user = self.users.get(user_id)
+                if user is not None:
+                    yield user_id, user, self._full_history(self.results.get(user_id), read(offsets.get(user_id, ())))
+
+    def get_test(self, user_id):
+        return self.users.get(user_id, {}).get("current_test")
+
+    def put_test(self, user_id, test):
+        user = self.users[user_id]
+        user["current_test"] = test
+        self._with_tests.add(user_id)
+        self._mark_dirty(("user", user_id), user)
+
+    def delete_test(self, user_id):
+        user = self.users.get(user_id)
+        self._with_tests.discard(user_id)
+        if user is not None and user.pop("current_test", None) is not None:
+            self._mark_dirty(("user", user_id), user)
+
+    # /metrics so'rovida event loop oqimida chaqiriladi: foydalanuvchilar aylanib chiqilmaydi
+    def count_tests(self):
+        return len(self._with_tests)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    class TEXT,
+    school TEXT,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_users_class ON users(class);
+CREATE INDEX IF NOT EXISTS idx_users_school ON users(school);
+
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    subject TEXT,
+    score INTEGER,
+    total INTEGER,
+    date TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_user ON results(user_id, id);
+
+CREATE TABLE IF NOT EXISTS tests (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+
+# Vaqtinchalik xato: baza boshqa ulanish tomonidan band (SQLITE_BUSY / SQLITE_LOCKED)
+def _is_busy(error):
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error).lower()
+    return "database is locked" in message or "database table is locked" in message or "busy" in message
+
+
+# Foydalanuvchi yozuvini uch tomonlama birlashtirish: `base` - o'qilgan nusxa, `mine` - shu jarayon
+# o'zgartirgani, `theirs` - bazadagi (boshqa jarayon yozgan) joriy nusxa. Shu jarayon o'zgartirgan
+# maydonlar ustun, qolganlari bazadagidek qoladi.
+def merge_records(base, mine, theirs):
+    merged = dict(theirs)
+    for key in set(base) | set(mine):
+        if mine.get(key, _MISSING) != base.get(key, _MISSING):
+            if key in mine:
+                merged[key] = mine[key]
+            else:
+                merged.pop(key, None)
+    return merged
+
+
+# SQLite engine: butun aholi xotirada saqlanmaydi, har bir so'rov indeks bo'yicha bitta qatorni
+# o'qiydi. Yozuvlar fon oqimida alohida ulanish orqali partiyalab, bitta tranzaksiyada yoziladi;
+# hali yozilmagan qiymatlar o'qishda navbatdan olinadi. Tugallanmagan testlar `tests` jadvalida turadi.
+#
+# Bitta baza bilan bir nechta jarayon ishlashi mumkin (workers.py): foydalanuvchi yozuvlari
+# optimistik tarzda yoziladi. Har bir qatorda `version` bor; o'qilgan versiya va nusxa eslab
+# qolinadi (`_bases`, oxirgi BASE_CACHE_SIZE ta) va yozuv faqat versiya o'zgarmagan bo'lsa
+# qo'llanadi. Aks holda joriy qator o'qilib merge_records bilan birlashtiriladi - partiya
+# tranzaksiyasi yozish qulfini ushlab turgani uchun takroriy urinish birinchi marta o'tadi.
+class SqliteStorage(Storage):
+    BASE_CACHE_SIZE = 10000
+    BUSY_TIMEOUT_MS = 30000  # Boshqa jarayon yozish qulfini ushlab turganda shuncha kutiladi
+    RETRY_MAX_DELAY = 5.0  # Partiyani qayta urinishlar orasidagi eng uzun pauza (soniya)
+    RETRY_ATTEMPTS = 8  # Baza band bo'lsa partiya shuncha marta yoziladi, keyin tashlab yuboriladi
+
+    def __init__(self, db_file, max_pending=10000, history_size=10):
+        super().__init__()
+        self.history_size = history_size
+        self.db_file = db_file
+        self.max_pending = max_pending
+        self.conn = None
+        self.writer = None
+        self._write_conn = None
+        self._bases = collections.OrderedDict()
+        self._bases_lock = threading.Lock()
+        self._staged_bases = []
+        self.conflicts = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self):
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = self._connect()
+        self.conn.executescript(SQLITE_SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(users)")}
+        if "version" not in columns:
+            self.conn.execute("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self.conn.commit()
+        self._write_conn = self._connect()
+        self.writer = BackgroundWriter(
+            self._apply_batch, commit=self._commit, max_pending=self.max_pending, name="sqlite-writer"
+        )
+
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
+        for conn in (self.conn, self._write_conn):
+            if conn is not None:
+                conn.close()
+        self.conn = self._write_conn = None
+
+    # Fon oqimida: partiyadagi barcha yozuvlar bitta tranzaksiyada bajariladi. Baza band bo'lsa
+    # (busy_timeout dan keyin ham "database is locked" - bir nechta worker bitta bazaga yozganda)
+    # tranzaksiya bekor qilinadi va butun partiya kutib qayta yoziladi, eng ko'pi RETRY_ATTEMPTS marta.
+    # Boshqa xatolar (yo'q jadval, faqat o'qish uchun baza, disk to'lgan, IntegrityError) o'tib
+    # ketmaydi: xatoli qator jurnalga yozilib tashlab yuboriladi, partiyaning qolgani yoziladi.
+    def _apply_batch(self, batch):
+        for attempt in range(1, self.RETRY_ATTEMPTS + 1):
+            try:
+                return self._apply_rows(batch)
+            except sqlite3.OperationalError as e:
+                self._write_conn.rollback()
+                self._staged_bases.clear()
+                if attempt == self.RETRY_ATTEMPTS:
+                    logger.error(
+                        f"Bazaga yozib bo'lmadi '{self.db_file}' ({len(batch)} ta yozuv, {attempt} urinish), "
+                        f"partiya tashlab yuborildi: {e}"
+                    )
+                    return 0
+                delay = min(self.RETRY_MAX_DELAY, 0.05 * 2 ** attempt)
+                log = logger.warning if attempt < 5 else logger.error
+                log(f"Bazaga yozib bo'lmadi '{self.db_file}' ({len(batch)} ta yozuv, {attempt}-urinish), {delay:.1f} s dan keyin qayta: {e}")
+                time.sleep(delay)
+
+    def _apply_rows(self, batch):
+        conn = self._write_conn
+        written_bytes = 0
+        for (kind, user_id), value in batch:
+            try:
+                if kind == "user":
+                    written_bytes += len(value[2].encode('utf-8'))
+                    self._put_user_row(conn, user_id, *value)
+                elif kind == "test":
+                    if value is None:
+                        conn.execute("DELETE FROM tests WHERE user_id = ?", (user_id,))
+                    else:
+                        conn.execute(
+                            "INSERT INTO tests (user_id, data) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                            (user_id, value)
+                        )
+                        written_bytes += len(value.encode('utf-8'))
+                elif kind == "results":
+                    conn.executemany(
+                        "INSERT INTO results (user_id, subject, score, total, date, data) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(user_id, *row) for row in value]
+                    )
+                    written_bytes += sum(len(row[-1].encode('utf-8')) for row in value)
+            except sqlite3.Error as e:
+                if _is_busy(e):
+                    raise
+                logger.error(f"Bazaga yozishda xato '{self.db_file}' ({kind}, {user_id}): {e}")
+        return written_bytes
+
+    def _remember(self, user_id, version, data):
+        with self._bases_lock:
+            self._bases[user_id] = (version, data)
+            self._bases.move_to_end(user_id)
+            if len(self._bases) > self.BASE_CACHE_SIZE:
+                self._bases.popitem(last=False)
+
+    # Fon oqimida yozilgan versiyalar asos sifatida faqat commit'dan keyin eslab qolinadi: bekor
+    # qilingan (rollback) partiyaning versiyalari `_bases` ga tushmaydi. BackgroundWriter commit'ni
+    # o'z lock'i ichida chaqiradi, shuning uchun handler eski asos bilan yangi qatorni ko'rmaydi.
+    def _commit(self):
+        staged, self._staged_bases = self._staged_bases, []
+        self._write_conn.commit()
+        for entry in staged:
+            self._remember(*entry)
+
+    # Fon oqimida: versiya bo'yicha shartli yozish, to'qnashuvda birlashtirish. Asos (base) yo'q
+    # bo'lsa - yangi foydalanuvchi yoki asos BASE_CACHE_SIZE dan oshib keshdan chiqib ketgan -
+    # handler nimani o'chirganini bilib bo'lmaydi: birlashtirilmaydi, oxirgi yozuv ustun.
+    def _put_user_row(self, conn, user_id, cls, school, data, base):
+        if base is None:
+            conn.execute(
+                "INSERT INTO users (user_id, class, school, data, version) VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT(user_id) DO UPDATE SET class = excluded.class, school = excluded.school, "
+                "data = excluded.data, version = users.version + 1",
+                (user_id, cls, school, data)
+            )
+            version = conn.execute("SELECT version FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+            self._staged_bases.append((user_id, version, data))
+            return
+        cursor = conn.execute(
+            "UPDATE users SET class = ?, school = ?, data = ?, version = version + 1 WHERE user_id = ? AND version = ?",
+            (cls, school, data, user_id, base[0])
+        )
+        if cursor.rowcount:
+            self._staged_bases.append((user_id, base[0] + 1, data))
+            return
+
+        # Yozuvni o'qilgandan keyin boshqa jarayon o'zgartirgan
+        self.conflicts += 1
+        row = conn.execute("SELECT version, data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO users (user_id, class, school, data, version) VALUES (?, ?, ?, ?, 1)",
+                (user_id, cls, school, data)
+            )
+            self._staged_bases.append((user_id, 1, data))
+            return
+        version, current = row
+        merged = merge_records(json.loads(base[1]), json.loads(data), json.loads(current))
+        conn.execute(
+            "UPDATE users SET class = ?, school = ?, data = ?, version = ? WHERE user_id = ?",
+            (merged.get("class"), merged.get("school"), _dumps(merged), version + 1, user_id)
+        )
+        logger.info(f"Foydalanuvchi {user_id}: parallel o'zgarish birlashtirildi (versiya {version + 1}).")
+        # Handler qo'lidagi lug'atda boshqa jarayonning o'zgarishlari yo'q: asos sifatida eski versiya
+        # va shu nusxa eslab qolinadi, shunda keyingi yozuv ham birlashtirishdan o'tadi va ularni o'chirmaydi
+        self._staged_bases.append((user_id, version, data))
+
+    # Handler oqimida: belgilangan qiymatlar JSON ga aylantirilib fon yozuvchiga beriladi.
+    # Navbatda turgan yozuv almashtirilganda uning asosi (base) saqlanadi.
+    def _write(self, key, value):
+        kind, user_id = key
+        if kind == "user":
+            with self._bases_lock:
+                base = self._bases.get(user_id)
+            self.writer.submit(
+                key, (value.get("class"), value.get("school"), _dumps(value), base),
+                merge=lambda old, new: new[:3] + old[3:]
+            )
+        elif kind == "test":
+            self.writer.submit(key, _dumps(value) if value is not None else None)
+        elif kind == "results":
+            rows = [
+                (r.get("subject"), r.get("score"), r.get("total"), r.get("date"), _dumps(r))
+                for r in value
+            ]
+            self.writer.submit(key, rows, merge=lambda old, new: old + new)
+
+    # Bir kalit uchun hali bazaga tushmagan qiymat: avval dirty, keyin fon yozuvchi navbati
+    def get_user(self, user_id):
+        user = self._dirty.get(("user", user_id), _MISSING)
+        if user is not _MISSING:
+            return user
+        with self.writer.lock:
+            pending = self.writer.peek(("user", user_id))
+            if pending is not _MISSING:
+                return json.loads(pending[2])
+            row = self.conn.execute("SELECT version, data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            self._remember(user_id, *row)
+        return json.loads(row[1])
+
+    def put_user(self, user_id, user):
+        self._mark_dirty(("user", user_id), user)
+
+    # Hali bazaga tushmagan foydalanuvchi yozuvlari: fon yozuvchidagilar, ustidan dirty.
+    # writer.lock ichida, bazadan o'qish bilan birga chaqiriladi: commit ham shu lock ichida
+    # bo'lgani uchun yozuv ikkalasida ham, hech birida ham bo'lmay qolmaydi.
+    # `only` berilsa faqat shu foydalanuvchilar olinadi (sahifa uchun).
+    def _unwritten_users(self, only=None):
+        pending = {
+            user_id: value[2] for (kind, user_id), value in self.writer.unwritten()
+            if kind == "user" and (only is None or user_id in only)
+        }
+        users = {user_id: json.loads(data) for user_id, data in pending.items()}
+        users.update(
+            (user_id, user) for (kind, user_id), user in self._dirty.items()
+            if kind == "user" and (only is None or user_id in only)
+        )
+        return users
+
+    def _unwritten_results_by_user(self):
+        results = {}
+        for (kind, user_id), rows in self.writer.unwritten():
+            if kind == "results":
+                results.setdefault(user_id, []).extend(json.loads(row[-1]) for row in rows)
+        for (kind, user_id), user_results in self._dirty.items():
+            if kind == "results":
+                results.setdefault(user_id, []).extend(user_results)
+        return results
+
+    # Foydalanuvchi -> faolmi (rowid tartibida). Ro'yxatlar event loop'da o'qiladi, shuning uchun
+    # yozuvchi kutilmaydi: bazadagi qatorlar ustiga hali yozilmagan yozuvlar qo'yiladi.
+    def _user_activity(self):
+        with self.writer.lock:
+            rows = self.conn.execute(
+                "SELECT user_id, COALESCE(json_extract(data, '$.active'), 1) != 0 FROM users ORDER BY rowid"
+            ).fetchall()
+            unwritten = self._unwritten_users()
+        activity = dict(rows)
+        for user_id, user in unwritten.items():
+            activity[user_id] = bool(user.get("active", True))
+        return activity
+
+    def user_ids(self, active_only=False):
+        return [user_id for user_id, active in self._user_activity().items() if active or not active_only]
+
+    def count_users(self):
+        activity = self._user_activity()
+        return len(activity), sum(1 for active in activity.values() if active)
+
+    # Ro'yxat alohida ulanishda o'qiladi: o'qish tranzaksiyasi (snapshot) va hali yozilmagan yozuvlar
+    # writer.lock ichida birga olinadi, keyin qatorlar lock'siz oqim bo'lib keladi
+    def _snapshot(self, sql, unwritten):
+        conn = self._connect()
+        try:
+            with self.writer.lock:
+                conn.execute("BEGIN")
+                return conn, conn.execute(sql), unwritten()
+        except Exception:
+            conn.close()
+            raise
+
+    def iter_users(self):
+        conn, rows, unwritten = self._snapshot("SELECT user_id, data FROM users ORDER BY rowid", self._unwritten_users)
+        try:
+            for user_id, data in rows:
+                user = unwritten.pop(user_id, _MISSING)
+                yield user_id, json.loads(data) if user is _MISSING else user
+            yield from unwritten.items()
+        finally:
+            conn.close()
+
+    # Kursor - rowid. Sinf/maktab indeksi rowid ni ham o'z ichiga oladi, shuning uchun
+    # "class = ? AND rowid > ?" so'rovi indeksdan to'g'ridan-to'g'ri kerakli joydan boshlanadi.
+    # Sahifa yozuvchini kutmaydi: qatorlar bazadagi rowid bo'yicha tanlanadi, ma'lumotlari esa hali
+    # yozilmagan yozuvdan olinadi. Yangi foydalanuvchi (va sinf/maktab o'zgarishi) ro'yxatda fon
+    # yozuvchi uni bazaga tushirgandan keyin ko'rinadi.
+    def page_users(self, after=None, before=None, limit=10, field=None, value=None, with_results=False):
+        sql = "SELECT rowid, user_id, data FROM users WHERE "
+        params = []
+        if field is not None:
+            if field not in PAGE_FIELDS:
+                raise ValueError(f"Noma'lum maydon: {field}")
+            sql += f"{field} = ? AND "
+            params.append(value)
+        if with_results:
+            sql += "EXISTS (SELECT 1 FROM results WHERE results.user_id = users.user_id) AND "
+        if before is not None:
+            sql += "rowid < ? ORDER BY rowid DESC LIMIT ?"
+            params.append(before)
+        else:
+            sql += "rowid > ? ORDER BY rowid LIMIT ?"
+            params.append(after if after is not None else 0)
+        params.append(limit + 1)
+        with self.writer.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+            unwritten = self._unwritten_users(only={row[1] for row in rows})
+        rows = [
+            (rowid, user_id, unwritten[user_id] if user_id in unwritten else json.loads(data))
+            for rowid, user_id, data in rows
+        ]
+        return self._make_page(rows, limit, after, before)
+
+    # Hali bazaga tushmagan natijalar: fon yozuvchi navbatidagilar, keyin dirty
+    def _unwritten_results(self, user_id, pending):
+        user_results = [json.loads(row[-1]) for row in pending] if pending is not _MISSING else []
+        user_results.extend(self._dirty.get(("results", user_id), []))
+        return user_results
+
+    # `results` jadvali o'zi arxiv vazifasini bajaradi: xotirada hech narsa saqlanmaydi,
+    # oxirgi natijalar (user_id, id) indeksi bo'yicha teskari tartibda LIMIT bilan o'qiladi
+    def get_results(self, user_id):
+        with self.writer.lock:
+            pending = self.writer.peek(("results", user_id))
+            rows = self.conn.execute(
+                "SELECT data FROM (SELECT id, data FROM results WHERE user_id = ? ORDER BY id DESC LIMIT ?) ORDER BY id",
+                (user_id, self.history_size)
+            ).fetchall()
+        user_results = [json.loads(data) for (data,) in rows]
+        user_results.extend(self._unwritten_results(user_id, pending))
+        return user_results[-self.history_size:]
+
+    def get_result_totals(self, user_id):
+        with self.writer.lock:
+            pending = self.writer.peek(("results", user_id))
+            count, best, percent_sum = self.conn.execute(
+                "SELECT COUNT(*), MAX(p), SUM(p) FROM (SELECT CASE WHEN total > 0 THEN score * 100.0 / total ELSE 0 END AS p "
+                "FROM results WHERE user_id = ?)",
+                (user_id,)
+            ).fetchone()
+        best, percent_sum = best or 0.0, percent_sum or 0.0
+        for result in self._unwritten_results(user_id, pending):
+            percentage = result_percentage(result)
+            count += 1
+            best = max(best, percentage)
+            percent_sum += percentage
+        return _totals(count, best, percent_sum)
+
+    def add_result(self, user_id, result):
+        self._mark_dirty(("results", user_id), result, append=True)
+
+    def iter_results(self):
+        conn, rows, unwritten = self._snapshot(
+            "SELECT user_id, data FROM results ORDER BY user_id, id", self._unwritten_results_by_user
+        )
+        try:
+            for user_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+                yield user_id, [json.loads(data) for _, data in group] + unwritten.pop(user_id, [])
+            yield from unwritten.items()
+        finally:
+            conn.close()
+
+    # Eksport alohida ulanishda o'qiladi: handlerlarning so'rovlari bilan aralashmaydi
+    # va foydalanuvchilar natijalari bilan birga bitta oqim bo'lib keladi
+    def iter_export(self):
+        if self.writer is not None:
+            self.writer.flush()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT users.user_id, users.data, results.data FROM users "
+                "LEFT JOIN results ON results.user_id = users.user_id ORDER BY users.rowid, results.id"
+            )
+            for user_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+                group = list(group)
+                yield user_id, json.loads(group[0][1]), [json.loads(row[2]) for row in group if row[2] is not None]
+        finally:
+            conn.close()
+
+    def get_test(self, user_id):
+        test = self._dirty.get(("test", user_id), _MISSING)
+        if test is not _MISSING:
+            return test
+        with self.writer.lock:
+            pending = self.writer.peek(("test", user_id))
+            if pending is not _MISSING:
+                return json.loads(pending) if pending is not None else None
+            row = self.conn.execute("SELECT data FROM tests WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_test(self, user_id, test):
+        self._mark_dirty(("test", user_id), test)
+
+    def delete_test(self, user_id):
+        self._mark_dirty(("test", user_id), None)
+
+    # Hali bazaga tushmagan testlar hisobga olinmaydi
+    def count_tests(self):
+        with self.writer.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM tests").fetchone()[0]
+
+
+# Konfiguratsiyaga ko'ra engine tanlash
+def open_storage(backend, user_file, results_file, db_file, compact_every=1000, max_pending=10000,
+                 history_size=10, archive_file=None):
+    if backend == "sqlite":
+        return SqliteStorage(db_file, max_pending=max_pending, history_size=history_size)
+    if backend == "json":
+        return JsonStorage(
+            user_file, results_file, compact_every=compact_every, max_pending=max_pending,
+            history_size=history_size, archive_file=archive_file
+        )
+    raise ValueError(f"Noma'lum saqlash turi: {backend}")
+
+
+# data/*.json fayllaridagi foydalanuvchilar, natijalar va tugallanmagan testlarni SQLite bazaga ko'chirish
+def migrate_json_to_sqlite(user_file, results_file, db_file):
+    source = JsonStorage(user_file, results_file)
+    source.load()
+    target = SqliteStorage(db_file)
+    target.load()
+    users = results_count = tests = 0
+    with target.conn:
+        for user_id, user in source.iter_users():
+            user = dict(user)
+            test = user.pop("current_test", None)
+            target.conn.execute(
+                "INSERT OR REPLACE INTO users (user_id, class, school, data) VALUES (?, ?, ?, ?)",
+                (user_id, user.get("class"), user.get("school"), _dumps(user))
+            )
+            users += 1
+            if test is not None:
+                target.conn.execute("INSERT OR REPLACE INTO tests (user_id, data) VALUES (?, ?)", (user_id, _dumps(test)))
+                tests += 1
+        target.conn.execute("DELETE FROM results")
+        for user_id, user_results in source.iter_results():
+            for result in user_results:
+                target.conn.execute(
+                    "INSERT INTO results (user_id, subject, score, total, date, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (user_id, result.get("subject"), result.get("score"), result.get("total"), result.get("date"), _dumps(result))
+                )
+                results_count += 1
+    source.close()
+    target.close()
+    return users, results_count, tests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bot ma'lumotlari bilan ishlash")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="data/*.json fayllarini SQLite bazaga ko'chirish")
+    migrate.add_argument("--data-dir", default="data")
+    migrate.add_argument("--db", default=None, help="SQLite fayli (standart: <data-dir>/bot.db)")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    db_file = args.db or os.path.join(args.data_dir, "bot.db")
+    users, results_count, tests = migrate_json_to_sqlite(
+        os.path.join(args.data_dir, "user_data.json"),
+        os.path.join(args.data_dir, "results.json"),
+        db_file
+    )
+    logger.info(f"Ko'chirildi: {users} foydalanuvchi, {results_count} natija, {tests} tugallanmagan test -> '{db_file}'")
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from locks import PerUserUpdateProcessor
+
+
+def make_update(update_id, user_id):
+    user = User(id=user_id, first_name="U", is_bot=False)
+    chat = Chat(id=user_id, type="private")
+    return Update(update_id, message=Message(update_id, datetime.now(), chat, from_user=user))
+
+
+# A foydalanuvchi semafordagi barcha o'rinlardan ko'p yangilanish yuborsa ham, B ning
+# yangilanishi A ning birinchi handleri tugashini kutmasdan bajariladi
+def test_flooding_user_does_not_block_others():
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+        release = asyncio.Event()
+        order = []
+
+        async def slow(name):
+            await release.wait()
+            order.append(name)
+
+        async def fast(name):
+            order.append(name)
+
+        flood = [
+            asyncio.create_task(processor.process_update(make_update(i, 1), slow(f"a{i}")))
+            for i in range(10)
+        ]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(processor.process_update(make_update(100, 2), fast("b")), timeout=1)
+        assert order == ["b"]
+
+        release.set()
+        await asyncio.gather(*flood)
+        assert order == ["b"] + [f"a{i}" for i in range(10)]
+
+    asyncio.run(scenario())
@@ -0,0 +1,35 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.error import BadRequest
+
+from membership import MembershipCache, is_participant_error
+
+
+class FakeBot:
+    def __init__(self, status):
+        self.status = status
+        self.calls = 0
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls += 1
+        return SimpleNamespace(status=self.status)
+
+
+# Qayta tekshirish keshdagi ijobiy javobga ishonmaydi va chiqib ketganni keshdan o'chiradi
+def test_fresh_status_bypasses_cached_member():
+    cache = MembershipCache("@group")
+    bot = FakeBot("member")
+    assert asyncio.run(cache.get_status(bot, 1)) == "member"
+    bot.status = "left"
+    assert asyncio.run(cache.get_status(bot, 1)) == "member"
+    assert asyncio.run(cache.get_status(bot, 1, fresh=True)) == "left"
+    assert asyncio.run(cache.get_status(bot, 1)) == "left"
+    assert bot.calls == 3
+
+
+def test_only_participant_errors_mean_left():
+    assert is_participant_error(BadRequest("User not found"))
+    assert is_participant_error(BadRequest("PARTICIPANT_ID_INVALID"))
+    assert not is_participant_error(BadRequest("Chat not found"))
+    assert not is_participant_error(BadRequest("Member list is inaccessible"))
@@ -0,0 +1,42 @@
+from question_bank import HISTORY_SIZE, QuestionIndex
+
+
+def question(question_id, text, section="algebra"):
+    return {"id": question_id, "question": text, "options": ["a", "b"], "correct": 0, "section": section}
+
+
+# Eski versiyada boshlangan test qayta yuklashdan keyin ham o'sha savollarni ko'radi
+def test_get_returns_question_as_of_version():
+    index = QuestionIndex({"matem": [question(1, "v1"), question(2, "o'chiriladi")]}, version=1)
+    assert index.update({"matem": [question(1, "v2"), question(3, "yangi", section="geometriya")]}, version=2) == 3
+    index.update({"matem": [question(1, "v3"), question(3, "yangi", section="geometriya")]}, version=3)
+
+    assert index.get("matem", 1, version=1)["question"] == "v1"
+    assert index.get("matem", 2, version=1)["question"] == "o'chiriladi"
+    assert index.get("matem", 1, version=2)["question"] == "v2"
+    assert index.get("matem", 1)["question"] == "v3"
+    assert index.get("matem", 2) is None
+    assert index.get("matem", 3, version=1)["question"] == "yangi"
+    assert index.section("matem", "algebra") == [1]
+    assert index.section("matem", "geometriya") == [3]
+    assert sorted(index.bucket("matem", 0)) == [1, 3]
+
+
+# HISTORY_SIZE dan eski versiya tarixdan chiqariladi: joriy savol qaytadi
+def test_versions_older_than_history_fall_back_to_current():
+    index = QuestionIndex({"matem": [question(1, "v1")]}, version=1)
+    for version in range(2, HISTORY_SIZE + 3):
+        index.update({"matem": [question(1, f"v{version}")]}, version=version)
+
+    current = f"v{HISTORY_SIZE + 2}"
+    assert index.get("matem", 1, version=1)["question"] == current
+    assert index.get("matem", 1, version=2)["question"] == "v2"
+    assert index.get("matem", 1, version="noma'lum")["question"] == current
+
+
+def test_removed_subject_is_kept_in_history():
+    index = QuestionIndex({"matem": [question(1, "v1")], "fizika": [question(1, "f1")]}, version=1)
+    index.update({"matem": [question(1, "v1")]}, version=2)
+    assert index.get("fizika", 1) is None
+    assert index.get("fizika", 1, version=1)["question"] == "f1"
+    assert index.bucket("fizika", 0) == []
@@ -0,0 +1,57 @@
+import asyncio
+from types import SimpleNamespace
+
+from router import CallbackRouter
+
+
+class FakeQuery:
+    def __init__(self, data, user_id):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append((text, show_alert))
+
+
+def handler(name, calls):
+    async def handle(update, context):
+        calls.append(name)
+    return handle
+
+
+# Aniq qiymat prefiksdan ustun, bir nechta prefiks mos kelsa eng uzuni tanlanadi
+def test_longest_prefix_wins():
+    calls = []
+    router = CallbackRouter()
+    router.prefix('course_', handler("course", calls))
+    router.prefix('course_info_', handler("course_info", calls))
+    router.exact('course_info_all', handler("all", calls))
+
+    assert router.resolve('course_info_7').name == 'course_info_'
+    assert router.resolve('course_7').name == 'course_'
+    assert router.resolve('course_info_all').name == 'course_info_all'
+    assert router.resolve('course_inf').name == 'course_'
+    assert router.resolve('cours') is None
+    assert router.resolve('') is None
+
+
+def test_admin_only_route_rejects_other_users():
+    calls, dispatched = [], []
+    router = CallbackRouter(is_admin=lambda user_id: user_id == "1", on_dispatch=lambda *args: dispatched.append(args[0]))
+    router.prefix('admin_', handler("admin", calls), admin_only=True)
+
+    query = FakeQuery('admin_stats', 2)
+    asyncio.run(router.dispatch(SimpleNamespace(callback_query=query), None))
+    assert calls == [] and query.answers == [("Bu bo'lim faqat admin uchun.", True)]
+
+    asyncio.run(router.dispatch(SimpleNamespace(callback_query=FakeQuery('admin_stats', 1)), None))
+    assert calls == ["admin"]
+    assert dispatched == ['admin_'] and router.stats['admin_'][0] == 1
+
+
+def test_unknown_callback_is_answered():
+    router = CallbackRouter()
+    query = FakeQuery('nimadir', 2)
+    asyncio.run(router.dispatch(SimpleNamespace(callback_query=query), None))
+    assert query.answers == [(None, False)]
@@ -0,0 +1,66 @@
+from stats import StatsStore
+
+
+def make_result(score):
+    return {"subject": "matem", "score": score, "total": 10, "answers": [[1, 0, score > 5]]}
+
+
+def open_workers(tmp_path, count=2):
+    files = [str(tmp_path / f"stats.{i}.json") for i in range(count)]
+    return [StatsStore(files[i], peer_files=[f for f in files if f != files[i]]) for i in range(count)]
+
+
+# Har bir worker o'z testlarini sanaydi, ko'rsatishda yig'indi olinadi
+def test_combined_sums_worker_counters(tmp_path):
+    first, second = open_workers(tmp_path)
+    first.record({"school": "1", "class": "5"}, make_result(8), [[1, 0, 1]])
+    second.record({"school": "2", "class": "5"}, make_result(3), [[1, 1, 0]])
+    second.save(second.dump())
+
+    data = first.combined()
+    assert data["overall"]["count"] == 2
+    assert data["classes"]["5"]["count"] == 2
+    assert set(data["schools"]) == {"1", "2"}
+    assert data["questions"]["matem:1"] == [2, 1]
+    assert first.data["overall"]["count"] == 1
+
+
+# Tarixdan qayta qurilganda boshqa worker sanagan natija ikki marta hisoblanmaydi
+def test_rebuild_subtracts_peer_counters(tmp_path):
+    first, second = open_workers(tmp_path)
+    second.record({"school": "2", "class": "6"}, make_result(3), [[1, 1, 0]])
+    second.save(second.dump())
+
+    history = [
+        ("a", {"school": "1", "class": "5"}, [make_result(8), make_result(9)]),
+        ("b", {"school": "2", "class": "6"}, [make_result(3)]),
+    ]
+    assert first.rebuild(history) == 3
+    assert first.data["overall"]["count"] == 2
+    assert "2" not in first.data["schools"]
+
+    data = first.combined()
+    assert data["overall"]["count"] == 3
+    assert data["schools"]["2"]["count"] == 1
+
+
+# Qayta qurish paytida yakunlangan testlar yo'qolmaydi va tarixda ko'ringani ikki marta sanalmaydi
+def test_records_during_rebuild_are_replayed_once(tmp_path):
+    store = StatsStore(str(tmp_path / "stats.json"))
+    user = {"school": "1", "class": "5"}
+    early, seen, late = make_result(8), make_result(3), make_result(6)
+    store.record(user, early, early["answers"])
+
+    def rows():
+        yield "1", user, [early]
+        store.record(user, seen, seen["answers"])
+        yield "2", user, [seen]
+        store.record(user, late, late["answers"])
+
+    assert store.rebuild(rows()) == 2
+    assert store.data["overall"]["count"] == 3
+    assert store.data["overall"]["score_sum"] == 17
+    assert store.data["questions"]["matem:1"] == [3, 2]
+
+    store.record(user, make_result(1), [[1, 0, 0]])
+    assert store.data["overall"]["count"] == 4
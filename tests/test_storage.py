@@ -0,0 +1,441 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from snapshot_cache import cache_filename
+from storage import JsonStorage, LogStore, ResultArchive, SqliteStorage, merge_records
+
+
+def make_result(i):
+    return {"subject": "matem", "score": i, "total": 10, "date": f"2026-01-{i + 1:02d}"}
+
+
+def open_json(tmp_path, history_size):
+    storage = JsonStorage(
+        str(tmp_path / "user_data.json"), str(tmp_path / "results.json"), history_size=history_size
+    )
+    storage.load()
+    return storage
+
+
+def reopen(filename, **kwargs):
+    store = LogStore(filename, **kwargs)
+    return store, store.load()
+
+
+# Jarayon yopilmasdan to'xtasa ham jurnal qayta o'qilganda barcha yozuvlar tiklanadi
+def test_log_replays_puts_and_deletes_after_crash(tmp_path):
+    filename = str(tmp_path / "users.json")
+    store, _ = reopen(filename)
+    store.put("1", {"name": "A"})
+    store.put("2", {"name": "B"})
+    store.put("1", {"name": "A2"})
+    store.delete("2")
+
+    _, data = reopen(filename)
+    assert data == {"1": {"name": "A2"}}
+
+
+# Yarim yozilgan oxirgi qator tashlanadi va kesib olinadi: keyingi yozuv unga yopishib qolmaydi
+def test_torn_log_tail_is_dropped_and_repaired(tmp_path):
+    filename = str(tmp_path / "users.json")
+    store, _ = reopen(filename)
+    store.put("1", {"name": "A"})
+    with open(store.log_filename, "a", encoding="utf-8") as f:
+        f.write('{"k":"2","v":{"na')
+
+    store, data = reopen(filename)
+    assert data == {"1": {"name": "A"}}
+    store.put("3", {"name": "C"})
+
+    _, data = reopen(filename)
+    assert data == {"1": {"name": "A"}, "3": {"name": "C"}}
+
+
+# Siqish: jurnal snapshotga birlashtiriladi, .old o'chiriladi, keyingi yuklash bir xil natija beradi
+def test_compaction_merges_log_into_snapshot(tmp_path):
+    filename = str(tmp_path / "users.json")
+    store, _ = reopen(filename, compact_every=3)
+    store.put("1", {"name": "A"})
+    store.put("2", {"name": "B"})
+    store.delete("1")
+    store.compact(wait=True)
+
+    assert not os.path.exists(store.old_log_filename)
+    with open(filename, encoding="utf-8") as f:
+        assert json.load(f) == {"2": {"name": "B"}}
+    assert os.path.getsize(store.log_filename) == 0
+    _, data = reopen(filename)
+    assert data == {"2": {"name": "B"}}
+
+
+# Jurnal .old ga o'tkazilgan, lekin snapshot yozilmagan (yoki yozilgan, .old o'chirilmagan) paytda
+# to'xtash: .old avval, joriy jurnal keyin qo'llanadi, takroriy qo'llash natijani o'zgartirmaydi
+def test_crash_between_log_rotation_and_compaction(tmp_path):
+    filename = str(tmp_path / "users.json")
+    store, _ = reopen(filename)
+    store.put("1", {"name": "A"})
+    store.put("2", {"name": "B"})
+    store._log.close()
+    os.replace(store.log_filename, store.old_log_filename)
+    with open(store.log_filename, "w", encoding="utf-8") as f:
+        f.write(LogStore.encode_put("1", '{"name":"A2"}'))
+        f.write('{"k":"2","d":1}\n')
+
+    _, data = reopen(filename)
+    assert data == {"1": {"name": "A2"}}
+
+    # Snapshot yozilgan, ammo .old hali o'chirilmagan
+    store, _ = reopen(filename)
+    store._log.close()
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"1": {"name": "A"}, "2": {"name": "B"}}, f)
+    store, data = reopen(filename)
+    assert data == {"1": {"name": "A2"}}
+    store.close()
+    assert not os.path.exists(store.old_log_filename)
+    _, data = reopen(filename)
+    assert data == {"1": {"name": "A2"}}
+
+
+# lazy=True: snapshot qiymatlari JSON baytlari bo'lib qoladi, jurnaldagilar esa ochilgan
+def test_lazy_snapshot_keeps_values_encoded(tmp_path):
+    filename = str(tmp_path / "results.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"1": [make_result(1)]}, f)
+    store, _ = reopen(filename, lazy=True)
+    store.put("2", [make_result(2)])
+    store.close()
+
+    store, data = reopen(filename, lazy=True)
+    assert isinstance(data["1"], bytes) and isinstance(data["2"], bytes)
+    assert json.loads(data["2"]) == [make_result(2)]
+    store.put("3", [make_result(3)])
+    _, data = reopen(filename, lazy=True)
+    assert data["3"] == [make_result(3)]
+
+
+# Kesh snapshotning o'zgartirilgan vaqti va hajmi bilan bog'langan: fayl qo'lda o'zgartirilsa
+# (hajmi o'zgarsa ham, faqat vaqti o'zgarsa ham) kesh emas, JSON o'qiladi
+def test_snapshot_cache_invalidated_by_mtime_and_size(tmp_path):
+    filename = str(tmp_path / "users.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"1": {"name": "A"}}, f)
+    store, data = reopen(filename)
+    store._log.close()
+    assert os.path.exists(cache_filename(filename))
+
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"1": {"name": "AB"}}, f)
+    store, data = reopen(filename)
+    store._log.close()
+    assert data == {"1": {"name": "AB"}}
+
+    stat = os.stat(filename)
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"1": {"name": "XY"}}, f)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    _, data = reopen(filename)
+    assert data == {"1": {"name": "XY"}}
+
+
+# RESULT_HISTORY kamaytirilganda buferga sig'magan natijalar arxivga tushishi kerak
+def test_shrinking_history_archives_overflow(tmp_path):
+    storage = open_json(tmp_path, history_size=6)
+    storage.put_user("1", {"first_name": "A"})
+    for i in range(6):
+        storage.add_result("1", make_result(i))
+    storage.close()
+
+    storage = open_json(tmp_path, history_size=3)
+    assert [r["score"] for r in storage.get_results("1")] == [3, 4, 5]
+    storage.close()
+
+    storage = open_json(tmp_path, history_size=3)
+    exported = {user_id: results for user_id, _, results in storage.iter_export()}
+    assert [r["score"] for r in exported["1"]] == [0, 1, 2, 3, 4, 5]
+    assert storage.get_result_totals("1")["count"] == 6
+    storage.close()
+
+    with open(tmp_path / "results_archive.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line)["r"]["score"] for line in f] == [0, 1, 2]
+
+
+def test_legacy_list_overflow_is_archived(tmp_path):
+    with open(tmp_path / "user_data.json", "w", encoding="utf-8") as f:
+        json.dump({"1": {"first_name": "A"}}, f)
+    with open(tmp_path / "results.json", "w", encoding="utf-8") as f:
+        json.dump({"1": [make_result(i) for i in range(5)]}, f)
+
+    storage = open_json(tmp_path, history_size=2)
+    assert [r["score"] for r in storage.get_results("1")] == [3, 4]
+    assert storage.get_result_totals("1")["count"] == 5
+    storage.close()
+
+    storage = open_json(tmp_path, history_size=2)
+    exported = {user_id: results for user_id, _, results in storage.iter_export()}
+    assert [r["score"] for r in exported["1"]] == [0, 1, 2, 3, 4]
+    storage.close()
+
+
+# Arxiv foydalanuvchi bo'yicha joylardan o'qiladi: aralash tartib, buzilgan va tugallanmagan qatorlar
+def test_archive_reads_each_user_from_offsets(tmp_path):
+    filename = tmp_path / "archive.jsonl"
+    lines = [ResultArchive.encode(uid, json.dumps(make_result(i))) for i, uid in enumerate(["1", "2", "1", "2", "1"])]
+    lines.insert(2, "{buzilgan\n")
+    filename.write_text("".join(lines) + '{"u":"1","r":{"sc', encoding="utf-8")
+
+    archive = ResultArchive(str(filename))
+    offsets = archive.index()
+    assert sorted(offsets) == ["1", "2"]
+    with archive.reader() as read:
+        assert [r["score"] for r in read(offsets["2"])] == [1, 3]
+        assert [r["score"] for r in read(offsets["1"])] == [0, 2, 4]
+    with ResultArchive(str(tmp_path / "missing.jsonl")).reader() as read:
+        assert read(()) == []
+
+
+# Boshqa jarayon yozish qulfini busy_timeout dan uzoqroq ushlab tursa ham partiya yo'qolmaydi
+def test_sqlite_batch_survives_locked_database(tmp_path, caplog):
+    db_file = str(tmp_path / "bot.db")
+    storage = SqliteStorage(db_file)
+    storage.BUSY_TIMEOUT_MS = 50
+    storage.load()
+
+    other = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    storage.put_user("1", {"first_name": "A", "class": "5"})
+    storage.add_result("1", make_result(7))
+    storage.flush_dirty()
+    time.sleep(0.3)
+    threading.Timer(0.2, other.execute, ("COMMIT",)).start()
+    assert storage.writer.flush(timeout=10)
+    other.close()
+    assert any("1-urinish" in record.getMessage() for record in caplog.records)
+
+    assert storage.get_user("1")["class"] == "5"
+    assert [r["score"] for r in storage.get_results("1")] == [7]
+    storage.close()
+
+
+# Vaqtinchalik bo'lmagan xato (masalan, yo'q jadval) qayta urinilmaydi: faqat shu qator tashlanadi
+def test_sqlite_non_busy_error_drops_only_failing_row(tmp_path, caplog):
+    db_file = str(tmp_path / "bot.db")
+    storage = SqliteStorage(db_file)
+    storage.load()
+    storage.conn.execute("DROP TABLE tests")
+    storage.conn.commit()
+
+    storage.put_user("1", {"first_name": "A"})
+    storage.put_test("1", {"subject": "matem"})
+    storage.add_result("1", make_result(3))
+    storage.flush_dirty()
+    assert storage.writer.flush(timeout=8)
+    assert not any("urinish" in record.getMessage() for record in caplog.records)
+    assert any("no such table: tests" in record.getMessage() for record in caplog.records)
+
+    row = storage.conn.execute("SELECT data FROM users WHERE user_id = '1'").fetchone()
+    assert json.loads(row[0])["first_name"] == "A"
+    assert storage.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 1
+    storage.close()
+
+
+# Baza uzoq band bo'lsa partiya RETRY_ATTEMPTS dan keyin tashlanadi, yozuvchi (va to'xtash) osilib qolmaydi
+def test_sqlite_busy_retries_are_bounded(tmp_path, caplog):
+    db_file = str(tmp_path / "bot.db")
+    storage = SqliteStorage(db_file)
+    storage.BUSY_TIMEOUT_MS = 20
+    storage.RETRY_ATTEMPTS = 2
+    storage.load()
+
+    other = sqlite3.connect(db_file, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    storage.put_user("1", {"first_name": "A"})
+    storage.flush_dirty()
+    assert storage.writer.flush(timeout=8)
+    assert any("tashlab yuborildi" in record.getMessage() for record in caplog.records)
+    other.execute("ROLLBACK")
+    other.close()
+    storage.close()
+
+
+def test_merge_records_keeps_both_sides_changes():
+    base = {"name": "A", "class": "5", "inactive_reason": "blocked"}
+    mine = {"name": "A", "class": "6"}
+    theirs = {"name": "A", "class": "5", "school": "1", "inactive_reason": "blocked"}
+    assert merge_records(base, mine, theirs) == {"name": "A", "class": "6", "school": "1"}
+
+
+def open_sqlite(db_file):
+    storage = SqliteStorage(db_file)
+    storage.load()
+    return storage
+
+
+# Ikki worker bitta yozuvni o'qib, turli maydonlarni o'zgartirsa ikkala o'zgarish ham saqlanadi
+def test_sqlite_concurrent_updates_are_merged(tmp_path):
+    db_file = str(tmp_path / "bot.db")
+    first, second = open_sqlite(db_file), open_sqlite(db_file)
+    first.put_user("1", {"name": "A", "inactive_reason": "blocked"})
+    first.flush()
+
+    mine, theirs = first.get_user("1"), second.get_user("1")
+    theirs["school"] = "1"
+    second.put_user("1", theirs)
+    second.flush()
+    mine["class"] = "6"
+    mine.pop("inactive_reason")
+    first.put_user("1", mine)
+    first.flush()
+
+    assert first.conflicts == 1
+    row = first.conn.execute("SELECT data FROM users WHERE user_id = '1'").fetchone()
+    assert json.loads(row[0]) == {"name": "A", "school": "1", "class": "6"}
+    first.close()
+    second.close()
+
+
+# Asos keshdan chiqib ketgan bo'lsa birlashtirilmaydi: o'chirilgan maydon qaytib kelmaydi
+def test_sqlite_missing_base_is_last_writer_wins(tmp_path):
+    db_file = str(tmp_path / "bot.db")
+    first, second = open_sqlite(db_file), open_sqlite(db_file)
+    first.put_user("1", {"name": "A", "inactive_reason": "blocked"})
+    first.flush()
+
+    user = first.get_user("1")
+    theirs = second.get_user("1")
+    theirs["school"] = "1"
+    second.put_user("1", theirs)
+    second.flush()
+    first._bases.clear()
+    user.pop("inactive_reason")
+    first.put_user("1", user)
+    first.flush()
+
+    row = first.conn.execute("SELECT version, data FROM users WHERE user_id = '1'").fetchone()
+    assert json.loads(row[1]) == {"name": "A"}
+    assert first._bases["1"][0] == row[0] == 3
+    first.close()
+    second.close()
+
+
+# Bekor qilingan partiyaning versiyalari asos sifatida eslab qolinmaydi
+def test_sqlite_rolled_back_batch_does_not_update_bases(tmp_path):
+    storage = open_sqlite(str(tmp_path / "bot.db"))
+    storage.put_user("1", {"name": "A"})
+    storage.flush()
+    storage.get_user("1")
+    assert storage._bases["1"][0] == 1
+
+    apply_rows = storage._apply_rows
+
+    def failing(batch):
+        apply_rows(batch)
+        raise sqlite3.OperationalError("database is locked")
+
+    storage._apply_rows = failing
+    storage.RETRY_ATTEMPTS = 1
+    storage.put_user("1", {"name": "B"})
+    storage.put_user("2", {"name": "C"})
+    storage.flush()
+    assert storage._bases["1"][0] == 1
+    assert "2" not in storage._bases
+
+    storage._apply_rows = apply_rows
+    user = storage.get_user("1")
+    user["class"] = "5"
+    storage.put_user("1", user)
+    storage.flush()
+    assert storage.conflicts == 0
+    row = storage.conn.execute("SELECT version, data FROM users WHERE user_id = '1'").fetchone()
+    assert row[0] == 2 and json.loads(row[1]) == {"name": "A", "class": "5"}
+    storage.close()
+
+
+# Disk sekin va fon yozuvchi navbati to'la bo'lsa ham flush_dirty() event loop'ni to'xtatmaydi
+def test_flush_dirty_does_not_block_when_writer_queue_is_full(tmp_path):
+    db_file = str(tmp_path / "bot.db")
+    storage = SqliteStorage(db_file)
+    storage.load()
+    gate = threading.Event()
+    apply_batch = storage.writer._apply_batch
+    storage.writer._apply_batch = lambda batch: gate.wait() and apply_batch(batch)
+    storage.writer.max_pending = 1
+
+    for i in range(5):
+        storage.put_user(str(i), {"first_name": f"U{i}"})
+    started = time.perf_counter()
+    assert storage.flush_dirty() > 0
+    assert time.perf_counter() - started < 0.5
+    assert storage.write_stats()["deferred"] > 0
+    assert storage.get_user("4")["first_name"] == "U4"
+
+    threading.Timer(0.2, gate.set).start()
+    asyncio.run(storage.drain_dirty())
+    storage.flush()
+    storage.close()
+
+    storage = SqliteStorage(db_file)
+    storage.load()
+    assert sorted(storage.user_ids()) == [str(i) for i in range(5)]
+    storage.close()
+
+
+# Ro'yxatlar yozuvchini kutmaydi: bazadagi qatorlar ustiga navbatdagi va dirty yozuvlar qo'yiladi
+def test_sqlite_lists_overlay_unwritten_records_without_flushing(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "bot.db"))
+    storage.load()
+    storage.put_user("1", {"first_name": "A"})
+    storage.add_result("1", make_result(1))
+    storage.flush()
+
+    gate = threading.Event()
+    apply_batch = storage.writer._apply_batch
+    storage.writer._apply_batch = lambda batch: gate.wait() and apply_batch(batch)
+    storage.put_user("1", {"first_name": "A", "active": False})
+    storage.put_user("2", {"first_name": "B"})
+    storage.add_result("2", make_result(2))
+    storage.flush_dirty()
+    storage.put_user("3", {"first_name": "C"})
+    storage.add_result("1", make_result(3))
+
+    started = time.perf_counter()
+    assert storage.user_ids() == ["1", "2", "3"]
+    assert storage.user_ids(active_only=True) == ["2", "3"]
+    assert storage.count_users() == (3, 2)
+    assert dict(storage.iter_users())["1"]["active"] is False
+    results = {user_id: [r["score"] for r in user_results] for user_id, user_results in storage.iter_results()}
+    assert results == {"1": [1, 3], "2": [2]}
+    page, _, _ = storage.page_users(limit=10)
+    assert [(user_id, user.get("active", True)) for user_id, user in page] == [("1", False)]
+    assert time.perf_counter() - started < 0.5
+
+    gate.set()
+    storage.close()
+
+
+# Fon yozuvchisiz (yopilgan) storage'da flush yozmaydi va xato bermaydi
+def test_flush_without_writer_is_noop(tmp_path):
+    storage = open_json(tmp_path, history_size=3)
+    storage.close()
+    storage.put_user("1", {"first_name": "A"})
+    storage.flush()
+    asyncio.run(storage.drain_dirty())
+    assert storage.flush_dirty() == 1
+
+
+def test_count_tests_tracks_started_and_finished_tests(tmp_path):
+    with open(tmp_path / "user_data.json", "w", encoding="utf-8") as f:
+        json.dump({"1": {"first_name": "A", "current_test": {"subject": "matem"}}, "2": {"first_name": "B"}}, f)
+    storage = open_json(tmp_path, history_size=3)
+    assert storage.count_tests() == 1
+
+    storage.put_test("2", {"subject": "matem"})
+    assert storage.count_tests() == 2
+    storage.delete_test("1")
+    storage.put_user("2", {"first_name": "B"})
+    assert storage.count_tests() == 0
+    storage.close()
@@ -0,0 +1,106 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# Telegram webhook qabul qiluvchi aiohttp server. Kelgan yangilanish tekshiriladi va
+# application.update_queue ga qo'yiladi; qayta ishlash Application ning o'zida (handlerlar,
+# JobQueue) polling rejimidagidek davom etadi. Secret token X-Telegram-Bot-Api-Secret-Token
+# sarlavhasi bilan solishtiriladi (hmac.compare_digest - vaqt bo'yicha sizib chiqmaydi).
+class WebhookServer:
+    def __init__(self, application, host="127.0.0.1", port=8443, path="/telegram", secret_token=None):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.received = 0
+        self.rejected = 0
+        self._runner = None
+
+    def make_app(self):
+        app = web.Application(client_max_size=1024 * 1024)
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    async def handle_update(self, request):
+        if self.secret_token:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+                self.rejected += 1
+                logger.warning(f"Webhook: noto'g'ri secret token ({request.remote}).")
+                return web.Response(status=403)
+        try:
+            data = await request.json(loads=json.loads)
+            await self.deliver(data)
+        except Exception as e:
+            self.rejected += 1
+            logger.error(f"Webhook: yangilanishni o'qib bo'lmadi: {e}")
+            return web.Response(status=400)
+        self.received += 1
+        return web.Response()
+
+    # Yangilanishni qayta ishlashga topshirish (workers.py dagi old server buni qayta belgilaydi)
+    async def deliver(self, data):
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+
+    async def handle_health(self, request):
+        return web.json_response({"ok": True, "received": self.received, "queue": self.application.update_queue.qsize()})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info(f"Webhook server: http://{self.host}:{self.port}{self.path}")
+
+    # Yangi so'rovlar qabul qilinmaydi, ochiq so'rovlar tugashi kutiladi
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Webhook rejimida botni ishga tushirish (run_polling o'rniga). Application `.updater(None)`
+# bilan qurilgan bo'lishi kerak. To'xtash tartibi: server yopiladi -> navbatdagi yangilanishlar
+# qayta ishlanadi -> Application to'xtaydi -> post_shutdown.
+async def run_webhook(application, server, webhook_url=None, allowed_updates=None, stop_event=None):
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url, secret_token=server.secret_token, allowed_updates=allowed_updates
+            )
+            logger.info(f"Webhook o'rnatildi: {webhook_url}")
+        await application.start()
+        await server.start()
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("Webhook server to'xtatilmoqda...")
+            await server.stop()
+            await application.stop()
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
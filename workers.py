@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+from aiohttp import web
+from telegram import Bot, Update
+
+from sharding import shard_for, update_user_id
+from webhook import WebhookServer
+
+logger = logging.getLogger(__name__)
+
+# Konfiguratsiya (bot.py import qilinmaydi: u yuklanganda saqlash va ma'lumot fayllari ochiladi)
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))  # Yangilanishlarni qayta ishlovchi jarayonlar soni
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org")
+WORKER_CHECK_INTERVAL = 1.0  # O'lgan workerlarni tekshirish oralig'i (soniya)
+
+
+# Old jarayon: webhook serveri yangilanishlarni Update ga aylantirmaydi, faqat foydalanuvchi
+# bo'yicha workerlar navbatiga tarqatadi
+class ShardingServer(WebhookServer):
+    def __init__(self, queues, host="127.0.0.1", port=8443, path="/telegram", secret_token=None):
+        super().__init__(None, host, port, path, secret_token)
+        self.queues = queues
+
+    async def deliver(self, data):
+        if not isinstance(data, dict) or "update_id" not in data:
+            raise ValueError("update_id yo'q")
+        self.queues[shard_for(update_user_id(data), len(self.queues))].put(data)
+
+    async def handle_health(self, request):
+        return web.json_response({"ok": True, "received": self.received, "workers": len(self.queues)})
+
+
+# Worker jarayonidagi Application: yangilanishlar old jarayon navbatidan olinadi.
+# Navbatdan None kelsa (yoki SIGTERM) worker navbatdagi ishlarni tugatib to'xtaydi.
+async def run_worker(application, queue):
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, queue.put_nowait, None)
+    except (NotImplementedError, RuntimeError):
+        pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, queue.get)
+                if data is None:
+                    break
+                try:
+                    update = Update.de_json(data, application.bot)
+                except Exception as e:
+                    logger.error(f"Yangilanishni o'qib bo'lmadi: {e}")
+                    continue
+                await application.update_queue.put(update)
+        finally:
+            await application.stop()
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+# Worker jarayonining kirish nuqtasi (spawn: bot.py har bir workerda alohida yuklanadi)
+def worker_main(index, count, queue):
+    os.environ["WORKER_INDEX"] = str(index)
+    os.environ["WORKER_COUNT"] = str(count)
+    os.environ["BOT_MODE"] = "webhook"
+    # Ctrl+C butun guruhga keladi; to'xtatishni old jarayon boshqaradi
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import bot
+    logger.info(f"Worker {index}/{count} ishga tushdi (pid {os.getpid()}).")
+    application = bot.build_application()
+    asyncio.run(run_worker(application, queue))
+    bot.close_storage()
+
+
+class WorkerPool:
+    def __init__(self, count):
+        self.context = multiprocessing.get_context("spawn")
+        self.count = count
+        self.queues = [self.context.Queue() for _ in range(count)]
+        self.processes = [None] * count
+
+    def _spawn(self, index):
+        process = self.context.Process(
+            target=worker_main, args=(index, self.count, self.queues[index]), name=f"bot-worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+
+    # To'xtab qolgan worker o'rniga yangisi ishga tushiriladi (navbat saqlanib qoladi)
+    def restart_dead(self):
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error(f"Worker {index} to'xtadi (kod {process.exitcode}), qayta ishga tushirilmoqda.")
+                self._spawn(index)
+
+    def stop(self, timeout=30):
+        for queue in self.queues:
+            queue.put(None)
+        for index, process in enumerate(self.processes):
+            process.join(timeout)
+            if process.is_alive():
+                logger.error(f"Worker {index} {timeout} soniyada to'xtamadi, majburan yopildi.")
+                process.terminate()
+                process.join()
+        self.processes = [None] * self.count
+
+
+async def run_front(pool, server, webhook_url=None, stop_event=None):
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    pool.start()
+    if webhook_url:
+        async with Bot(BOT_TOKEN, base_url=f"{TELEGRAM_BASE_URL.rstrip('/')}/bot") as bot:
+            await bot.set_webhook(url=webhook_url, secret_token=server.secret_token, allowed_updates=Update.ALL_TYPES)
+        logger.info(f"Webhook o'rnatildi: {webhook_url}")
+    await server.start()
+    try:
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), WORKER_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pool.restart_dead()
+    finally:
+        logger.info("Old server to'xtatilmoqda, workerlar navbatni tugatmoqda...")
+        await server.stop()
+        await asyncio.to_thread(pool.stop)
+
+
+# Bir nechta jarayonli rejim: old jarayon webhookni qabul qiladi, WORKERS ta jarayon
+# yangilanishlarni qayta ishlaydi. Holat umumiy SQLite (WAL) bazada turadi.
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    if os.getenv("STORAGE_BACKEND", "json") != "sqlite":
+        raise SystemExit(
+            "Bir nechta worker faqat STORAGE_BACKEND=sqlite bilan ishlaydi "
+            "(ma'lumotlarni ko'chirish: python storage.py migrate)."
+        )
+    pool = WorkerPool(max(1, WORKERS))
+    server = ShardingServer(pool.queues, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+    logger.info(f"{pool.count} ta worker bilan ishga tushirilmoqda.")
+    asyncio.run(run_front(pool, server, WEBHOOK_URL))
+
+
+if __name__ == "__main__":
+    main()